@@ -7,3 +7,5 @@ __license__ = 'MIT'
 
 # Version synonym
 VERSION = __version__
+
+default_app_config = 'batch_requests.apps.BatchRequestsConfig'
@@ -0,0 +1,243 @@
+'''
+@summary: Admission control of the batch requests.
+
+Under load, batches are turned away with a 503 and a Retry-After header before using any
+worker, rather than queued until everything times out. A batch is rejected when the pool
+queue is too deep, when admitting it would put too many sub requests in flight, or when its
+user has run out of budget. Sub requests are counted with the weight of their route.
+'''
+import math
+import re
+import threading
+import time
+from functools import wraps
+from urllib.parse import urlsplit
+
+from batch_requests.exceptions import BadBatchRequest
+from batch_requests.expansion import parse_batch
+from batch_requests.settings import br_settings as _settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404
+from django.http.response import HttpResponse
+from django.urls import resolve
+
+# Number of user budgets above which the full (idle) ones are dropped.
+MAX_BUCKETS = 10000
+
+
+class RouteWeights(object):
+    '''
+        Weight of the sub requests of each route, from a mapping of URL names or regular
+        expressions (keys starting with ^, matched against the path) to weights, as for
+        the execution classes. Sub requests of other routes weigh 1.
+    '''
+
+    def __init__(self, rules=None):
+        self.names = {}
+        self.patterns = []
+        for pattern, weight in (rules or {}).items():
+            if not pattern.startswith('^'):
+                self.names[pattern] = weight
+                continue
+            try:
+                self.patterns.append((re.compile(pattern), weight))
+            except re.error as error:
+                raise ImproperlyConfigured(
+                    'Invalid regular expression %r in ADMISSION_ROUTE_WEIGHTS: %s' % (
+                        pattern, error
+                    )
+                )
+
+    def weight(self, request_data):
+        if not (self.names or self.patterns) or not isinstance(request_data, dict):
+            return 1
+        path = urlsplit(str(request_data.get('url', ''))).path
+        try:
+            view_name = resolve(path).view_name
+        except Http404:
+            view_name = None
+
+        if view_name in self.names:
+            return self.names[view_name]
+        for regex, weight in self.patterns:
+            if regex.match(path):
+                return weight
+        return 1
+
+
+class TokenBucket(object):
+    '''
+        Budget refilled at rate tokens per second, up to capacity tokens.
+    '''
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost):
+        '''
+            Returns how long to wait for cost tokens to be available, 0 if they are.
+        '''
+        self.refill()
+        # A cost above the capacity waits for the bucket to be full.
+        cost = min(cost, self.capacity)
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def take(self, cost):
+        self.tokens -= min(cost, self.capacity)
+
+
+class AdmissionController(object):
+    '''
+        Keeps the weighted number of sub requests in flight in this process, and the
+        budget of each user.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.buckets = {}
+
+    def admit(self, user_key, cost, queue_depth):
+        '''
+            Admits a batch of the given cost. Returns None if admitted, otherwise the number
+            of seconds after which to retry.
+        '''
+        max_queue_depth = _settings.ADMISSION_MAX_QUEUE_DEPTH
+        max_in_flight = _settings.ADMISSION_MAX_IN_FLIGHT
+        rate = _settings.ADMISSION_USER_RATE
+
+        with self.lock:
+            if max_queue_depth is not None and queue_depth > max_queue_depth:
+                return _settings.ADMISSION_RETRY_AFTER
+            # A batch is always admitted when nothing else is in flight.
+            if max_in_flight is not None and self.in_flight and \
+                    self.in_flight + cost > max_in_flight:
+                return _settings.ADMISSION_RETRY_AFTER
+
+            if rate and user_key is not None:
+                bucket = self.bucket(user_key, rate)
+                wait = bucket.wait_time(cost)
+                if wait:
+                    return wait
+                bucket.take(cost)
+
+            self.in_flight += cost
+            return None
+
+    def release(self, cost):
+        with self.lock:
+            self.in_flight -= cost
+
+    def bucket(self, user_key, rate):
+        bucket = self.buckets.get(user_key)
+        if bucket is None:
+            if len(self.buckets) >= MAX_BUCKETS:
+                self.prune()
+            burst = _settings.ADMISSION_USER_BURST or rate
+            bucket = self.buckets[user_key] = TokenBucket(rate, burst)
+        return bucket
+
+    def prune(self):
+        for user_key, bucket in list(self.buckets.items()):
+            bucket.refill()
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[user_key]
+
+
+controller = AdmissionController()
+# Batches of the endpoint profiles are admitted independently of those of the others.
+profile_controllers = {}
+_profile_controllers_lock = threading.Lock()
+
+
+def get_controller():
+    '''
+        Returns the admission controller of the endpoint profile in use.
+    '''
+    name = _settings.name
+    if name is None:
+        return controller
+    with _profile_controllers_lock:
+        if name not in profile_controllers:
+            profile_controllers[name] = AdmissionController()
+        return profile_controllers[name]
+
+
+def user_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'user:%s' % user.pk
+    return 'address:%s' % request.META.get('REMOTE_ADDR')
+
+
+def batch_cost(request):
+    '''
+        Returns the weighted number of sub requests of the batch. The parsed requests are
+        kept on the request, so that the body is only parsed once.
+    '''
+    # Invalid batches, e.g. over the limit, are rejected by the view anyway.
+    try:
+        requests = parse_batch(request.body, _settings.MAX_LIMIT)
+    except (ValueError, AttributeError, BadBatchRequest):
+        return 0
+
+    request.batch_requests_data = requests
+    weights = RouteWeights(_settings.ADMISSION_ROUTE_WEIGHTS)
+    return sum(weights.weight(request_data) for request_data in requests)
+
+
+def check_settings(batch_settings):
+    '''
+        Raises ImproperlyConfigured if the settings, or those of one of their profiles,
+        limit the sub requests in flight or the budget of the users along with
+        STREAM_INGEST: streamed batches aren't counted upfront, so these limits wouldn't
+        apply. Called once the app is ready.
+    '''
+    for name in [None] + list(batch_settings.PROFILES):
+        profile = batch_settings.profile(name)
+        limited = profile.ADMISSION_MAX_IN_FLIGHT is not None or profile.ADMISSION_USER_RATE
+        if profile.ADMISSION_CONTROL and profile.STREAM_INGEST and limited:
+            raise ImproperlyConfigured(
+                'ADMISSION_MAX_IN_FLIGHT and ADMISSION_USER_RATE can\'t be used with '
+                'STREAM_INGEST%s, only ADMISSION_MAX_QUEUE_DEPTH applies to streamed '
+                'batches.' % ('' if name is None else ' (profile %s)' % name)
+            )
+
+
+def admission_control(view):
+    '''
+        Turns the batch requests away with a 503 when ADMISSION_CONTROL is on and they
+        can't be admitted. With STREAM_INGEST, the body isn't read upfront and only the
+        depth of the queue is checked (see check_settings).
+    '''
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if not _settings.ADMISSION_CONTROL:
+            return view(request, *args, **kwargs)
+
+        cost = 0 if _settings.STREAM_INGEST else batch_cost(request)
+        controller = get_controller()
+        retry_after = controller.admit(
+            user_key(request), cost, _settings.executor.queue_depth()
+        )
+        if retry_after is not None:
+            response = HttpResponse(
+                'The server is overloaded, retry later.', status=503, content_type='text/plain'
+            )
+            response['Retry-After'] = str(max(1, int(math.ceil(retry_after))))
+            return response
+
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            controller.release(cost)
+    return inner
@@ -0,0 +1,23 @@
+'''
+@summary: Application config of batch_requests.
+'''
+from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+class BatchRequestsConfig(AppConfig):
+    name = 'batch_requests'
+    verbose_name = 'Batch requests'
+
+    def ready(self):
+        '''
+            Checks the settings, and has the first request of each process warm batch
+            execution up when WARMUP_ON_FIRST_REQUEST is set. Nothing is started here: ready() also runs in
+            management commands and in the parent of forked workers.
+        '''
+        from batch_requests.admission import check_settings
+        from batch_requests.settings import br_settings as _settings
+        check_settings(_settings)
+        if _settings.WARMUP_ON_FIRST_REQUEST:
+            from batch_requests.warmup import warm_up_once
+            request_started.connect(warm_up_once, dispatch_uid='batch_requests.warm_up')
@@ -0,0 +1,70 @@
+'''
+@summary: Registry of bulk handlers used to collapse batched reads of the same route
+          into a single call.
+'''
+from batch_requests.utils import resolve_request
+from django.http import Http404
+
+
+class BulkHandlerRegistry(object):
+    '''
+        Maps a route name (the ``view_name`` returned by ``resolve``) to a bulk handler.
+
+        A bulk handler is called once with the list of WSGI requests and the list of
+        keyword arguments resolved for each of them. It must return a list of responses
+        (``HttpResponse`` objects or result dicts) in the same order as the requests.
+    '''
+
+    # Only side effect free requests are safe to collapse.
+    bulk_methods = {'GET'}
+
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, view_name, handler=None):
+        '''
+            Registers the handler for the given route name. Can also be used as a decorator.
+        '''
+        if handler is None:
+            def decorator(func):
+                self.register(view_name, func)
+                return func
+            return decorator
+
+        self.handlers[view_name] = handler
+        return handler
+
+    def unregister(self, view_name):
+        '''
+            Removes the handler registered for the given route name, if any.
+        '''
+        self.handlers.pop(view_name, None)
+
+    def group(self, wsgi_requests):
+        '''
+            Groups the requests which have a registered bulk handler by route name.
+            Returns a dict of route name to a list of (index, wsgi_request, kwargs).
+        '''
+        groups = {}
+        if not self.handlers:
+            return groups
+
+        for index, wsgi_request in enumerate(wsgi_requests):
+            if isinstance(wsgi_request, tuple):
+                wsgi_request = wsgi_request[0]
+
+            if wsgi_request.method not in self.bulk_methods:
+                continue
+
+            try:
+                match = resolve_request(wsgi_request)
+            except Http404:
+                continue
+
+            if match.view_name in self.handlers:
+                groups.setdefault(match.view_name, []).append((index, wsgi_request, match.kwargs))
+        return groups
+
+
+bulk_handlers = BulkHandlerRegistry()
+register_bulk_handler = bulk_handlers.register
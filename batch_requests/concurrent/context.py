@@ -0,0 +1,139 @@
+'''
+@summary: Propagation of the caller's context to the workers executing sub requests.
+
+The contextvars of the batch request (on Python 3.7+) and the thread local state captured
+by the snapshotters in CONTEXT_SNAPSHOTTERS (the active translation and time zone by
+default) are captured once per batch, and restored around each sub request executed on a
+worker thread.
+'''
+from batch_requests import settings
+from django.utils import timezone, translation
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+_missing = object()
+
+
+class ContextSnapshotter(object):
+    '''
+        Captures a piece of thread local state on the batch request thread and restores it
+        on the workers.
+    '''
+
+    def capture(self):
+        '''
+            Returns the state of the current thread.
+        '''
+        raise NotImplementedError
+
+    def restore(self, state):
+        '''
+            Applies the captured state to the current thread. Returns what reset needs to
+            undo it.
+        '''
+        raise NotImplementedError
+
+    def reset(self, token):
+        raise NotImplementedError
+
+
+class TranslationSnapshotter(ContextSnapshotter):
+    '''
+        Propagates the active translation.
+    '''
+
+    def capture(self):
+        return translation.get_language()
+
+    def restore(self, language):
+        override = translation.override(language)
+        override.__enter__()
+        return override
+
+    def reset(self, override):
+        override.__exit__(None, None, None)
+
+
+class TimezoneSnapshotter(ContextSnapshotter):
+    '''
+        Propagates the current time zone.
+    '''
+
+    def capture(self):
+        return timezone.get_current_timezone()
+
+    def restore(self, tz):
+        override = timezone.override(tz)
+        override.__enter__()
+        return override
+
+    def reset(self, override):
+        override.__exit__(None, None, None)
+
+
+class ThreadLocalSnapshotter(ContextSnapshotter):
+    '''
+        Propagates attributes of a threading.local, e.g. the current tenant. Subclasses set
+        local and attributes.
+    '''
+    local = None
+    attributes = ()
+
+    def capture(self):
+        return {attr: getattr(self.local, attr, _missing) for attr in self.attributes}
+
+    def restore(self, state):
+        previous = self.capture()
+        self._apply(state)
+        return previous
+
+    def reset(self, previous):
+        self._apply(previous)
+
+    def _apply(self, state):
+        for attr, value in state.items():
+            if value is not _missing:
+                setattr(self.local, attr, value)
+            elif hasattr(self.local, attr):
+                delattr(self.local, attr)
+
+
+class ProfileSnapshotter(ThreadLocalSnapshotter):
+    '''
+        Propagates the settings of the endpoint profile in use.
+    '''
+    local = settings.current
+    attributes = ('settings',)
+
+
+class BatchContext(object):
+    '''
+        The context of a batch request, captured once for all its sub requests.
+    '''
+    __slots__ = ('context', 'states')
+
+    def __init__(self, snapshotters=(), propagate_contextvars=True):
+        self.context = (
+            contextvars.copy_context() if propagate_contextvars and contextvars else None
+        )
+        self.states = [(snapshotter, snapshotter.capture()) for snapshotter in snapshotters]
+
+    def __bool__(self):
+        return self.context is not None or bool(self.states)
+
+    def run(self, func, *args, **kwargs):
+        '''
+            Calls func within the captured context.
+        '''
+        tokens = [(snapshotter, snapshotter.restore(state)) for snapshotter, state in self.states]
+        try:
+            if self.context is None:
+                return func(*args, **kwargs)
+            # A context can't be entered by several threads at once, each call gets a copy.
+            return self.context.copy().run(func, *args, **kwargs)
+        finally:
+            for snapshotter, token in reversed(tokens):
+                snapshotter.reset(token)
@@ -3,34 +3,342 @@ Created on Feb 20, 2016
 
 @author: Rahul Tanwani
 '''
+import atexit
+import heapq
+import os
+import threading
+import time
+import weakref
 from abc import ABCMeta
 
+from concurrent.futures import Future
 from concurrent.futures.process import ProcessPoolExecutor
 from concurrent.futures.thread import ThreadPoolExecutor
 
+from batch_requests.concurrent import routing
+from batch_requests.concurrent.context import BatchContext
+from batch_requests.concurrent.stats import RouteCostModel
+
+# All the executors created in this process, to reset them after a fork and shut them
+# down on exit.
+_executors = weakref.WeakSet()
+
 
 class Executor(object):
     '''
         Based executor class to encapsulate the job execution.
+
+        Requests may be routed to execution classes (see batch_requests.concurrent.routing),
+        each of them having its own pool. Requests not matching any route run on the
+        pool of the executor.
     '''
     __metaclass__ = ABCMeta
 
+    # Class of the pool used to execute the requests.
+    pool_class = None
+
+    # Whether the requests of a batch may run concurrently, hence in any order.
+    concurrent = True
+
+    # Pool classes and number of workers (None for the executor's) per execution class.
+    execution_class_pools = {
+        routing.THREAD: (ThreadPoolExecutor, None),
+        routing.SERIALIZED: (ThreadPoolExecutor, 1),
+    }
+
+    def __init__(self, num_workers=None, execution_classes=None,
+                 inline_threshold=None, inline_batch_size=0, longest_first=True,
+                 snapshotters=(), propagate_contextvars=True):
+        '''
+            The pools themselves are only created on first use.
+
+            When inline_threshold (in seconds) is given, requests of routes expected to take
+            less than that, and all the requests of batches of at most inline_batch_size
+            requests, run inline rather than on the pool. With longest_first, requests are
+            submitted in decreasing order of their expected duration.
+
+            Requests executed on thread pools run within the contextvars (unless
+            propagate_contextvars is off) and the state captured by the snapshotters of
+            the thread calling execute.
+        '''
+        self.num_workers = num_workers
+        self.router = routing.ExecutionClassRouter(execution_classes)
+        self.inline_threshold = inline_threshold
+        self.inline_batch_size = inline_batch_size
+        self.longest_first = longest_first
+        self.snapshotters = list(snapshotters)
+        self.propagate_contextvars = propagate_contextvars
+        self.cost_model = RouteCostModel()
+        self._pools = {}
+        self._pool_lock = threading.Lock()
+        self._pid = os.getpid()
+        _executors.add(self)
+
+    @property
+    def executor_pool(self):
+        '''
+            Returns the pool of the executor, creating it if required.
+        '''
+        return self.get_pool(None)
+
+    def get_pool(self, execution_class):
+        '''
+            Returns the pool for the given execution class, creating it if required.
+        '''
+        self._check_pid()
+        pool = self._pools.get(execution_class)
+        if pool is None:
+            with self._pool_lock:
+                pool = self._pools.get(execution_class)
+                if pool is None:
+                    pool = self._pools[execution_class] = self.create_pool(execution_class)
+        return pool
+
+    def create_pool(self, execution_class=None):
+        '''
+            Creates the pool used to execute the requests of the given execution class.
+        '''
+        if execution_class is None:
+            return self.pool_class(self.num_workers)
+
+        pool_class, num_workers = self.execution_class_pools[execution_class]
+        return pool_class(num_workers or self.num_workers)
+
+    def shutdown(self, wait=True):
+        '''
+            Shuts the pools down. New pools are created if the executor is used again.
+        '''
+        self._check_pid()
+        with self._pool_lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait=wait)
+
+    def queue_depth(self):
+        '''
+            Returns the number of requests waiting for a worker, across the pools.
+        '''
+        depth = 0
+        for pool in list(self._pools.values()):
+            if isinstance(pool, ThreadPoolExecutor):
+                depth += pool._work_queue.qsize()
+            else:
+                depth += len(getattr(pool, '_pending_work_items', ()))
+        return depth
+
+    def warm_up(self, task=None, timeout=None):
+        '''
+            Starts all the workers of the pool ahead of the first batch. On thread pools,
+            task (if given) then runs once on each worker, e.g. to open its connections.
+        '''
+        pool = self.executor_pool
+        num_workers = pool._max_workers
+        if isinstance(pool, ThreadPoolExecutor):
+            # Workers wait for each other, so that every task runs on its own worker.
+            barrier = threading.Barrier(num_workers)
+            futures = [
+                pool.submit(_warm_up_worker, barrier, task, timeout) for _ in range(num_workers)
+            ]
+        else:
+            futures = [pool.submit(_noop) for _ in range(num_workers)]
+        for future in futures:
+            future.result()
+
+    def reset_after_fork(self):
+        '''
+            Drops the pools inherited from the parent process. Their workers don't exist in
+            the child, so they can neither be used nor shut down.
+        '''
+        self._pools = {}
+        self._pool_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        '''
+            Resets the pools in a forked process when no fork hook did, e.g. on Python 3.6
+            which lacks os.register_at_fork.
+        '''
+        if self._pid != os.getpid():
+            self.reset_after_fork()
+
+    def execution_class(self, request, route_key=None, batch_size=None):
+        '''
+            Returns the execution class of the request, None for the executor's pool.
+            Requests without a configured class may run inline if they are expected to be
+            cheaper than handing them over to the pool.
+        '''
+        execution_class = self.router.classify(request) if self.router else None
+        if execution_class is not None or self.inline_threshold is None:
+            return execution_class
+
+        if batch_size is not None and batch_size <= self.inline_batch_size:
+            return routing.INLINE
+
+        predicted = self.cost_model.predict(route_key)
+        if predicted is not None and predicted < self.inline_threshold:
+            return routing.INLINE
+        return None
+
     def execute(self, requests, resp_generator, *args, **kwargs):
         '''
             Calls the resp_generator for all the requests in parallel in an asynchronous way.
+
+            Requests expected to take the longest are submitted first, so that they don't
+            start late and delay the whole batch. Inline requests run on the current thread
+            once all the others are submitted. Responses are returned in order, along with
+            the predicted and actual makespan of the batch.
         '''
-        result_futures = [
-            self.executor_pool.submit(resp_generator, req, *args, **kwargs)
-            for req in requests
-        ]
-        resp = [res_future.result() for res_future in result_futures]
+        start = time.perf_counter()
+        route_keys = [self.cost_model.route_key(req) for req in requests]
+        # Unknown routes are expected to take as long as the average route: not last, as
+        # they may turn out to be expensive, nor first, as most routes are cheap.
+        unknown = self.cost_model.mean()
+        predictions = [self.cost_model.predict(key, unknown) for key in route_keys]
+
+        inline = []
+        pooled = []
+        for index, req in enumerate(requests):
+            execution_class = self.execution_class(req, route_keys[index], len(requests))
+            if execution_class == routing.INLINE:
+                inline.append(index)
+            else:
+                pooled.append((index, execution_class))
+        if self.longest_first:
+            pooled.sort(key=lambda item: predictions[item[0]], reverse=True)
+
+        # The context of the caller is captured once for the whole batch.
+        context = self.capture_context() if pooled else None
+
+        result_futures = {}
+        submitted_costs = {}
+        for index, execution_class in pooled:
+            result_futures[index] = self.submit_to_pool(
+                execution_class, context, resp_generator, requests[index], *args, **kwargs
+            )
+            submitted_costs.setdefault(execution_class, []).append(predictions[index])
+
+        resp = BatchResults([None] * len(requests))
+        for index in inline:
+            resp[index], duration = timed(resp_generator, requests[index], *args, **kwargs)
+            self.cost_model.observe(route_keys[index], duration)
+        for index, res_future in result_futures.items():
+            resp[index], duration = res_future.result()
+            self.cost_model.observe(route_keys[index], duration)
+
+        resp.predicted_makespan = self.predict_makespan(
+            submitted_costs, [predictions[index] for index in inline]
+        )
+        resp.makespan = time.perf_counter() - start
         return resp
 
+    def capture_context(self):
+        '''
+            Captures the context of the calling thread, for the requests of a batch.
+        '''
+        return BatchContext(self.snapshotters, self.propagate_contextvars)
+
+    def submit_to_pool(self, execution_class, context, resp_generator, request, *args, **kwargs):
+        '''
+            Submits the request to the pool of the execution class. Returns a future of its
+            response and duration.
+        '''
+        pool = self.get_pool(execution_class)
+        if context and isinstance(pool, ThreadPoolExecutor):
+            return pool.submit(context.run, timed, resp_generator, request, *args, **kwargs)
+        return pool.submit(timed, resp_generator, request, *args, **kwargs)
+
+    def submit(self, request, resp_generator, context=None):
+        '''
+            Executes a single request, e.g. one of a batch read as a stream, on the pool or
+            inline depending on its execution class. Returns a future of its response.
+            context is the context of the batch, from capture_context.
+        '''
+        route_key = self.cost_model.route_key(request)
+        execution_class = self.execution_class(request, route_key)
+        if execution_class == routing.INLINE:
+            timed_future = Future()
+            timed_future.set_result(timed(resp_generator, request))
+        else:
+            timed_future = self.submit_to_pool(execution_class, context, resp_generator, request)
+
+        future = Future()
+
+        def done(timed_future):
+            try:
+                result, duration = timed_future.result()
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                self.cost_model.observe(route_key, duration)
+                future.set_result(result)
+        timed_future.add_done_callback(done)
+        return future
+
+    def predict_makespan(self, submitted_costs, inline_costs):
+        '''
+            Predicts the makespan of a batch from the expected cost of the requests submitted
+            to each pool, in submission order, and of the inline requests. Each pool hands
+            the next request over to its least loaded worker.
+        '''
+        makespan = sum(inline_costs)
+        for execution_class, costs in submitted_costs.items():
+            workers = getattr(self.get_pool(execution_class), '_max_workers', 1)
+            loads = [0.0] * max(1, min(workers, len(costs)))
+            for cost in costs:
+                heapq.heapreplace(loads, loads[0] + cost)
+            makespan = max(makespan, max(loads))
+        return makespan
+
+
+class BatchResults(list):
+    '''
+        Responses of a batch, along with its predicted and actual makespan in seconds.
+    '''
+    predicted_makespan = None
+    makespan = None
+
+
+def timed(resp_generator, request, *args, **kwargs):
+    '''
+        Calls the resp_generator for the request, returns its result and duration in seconds.
+    '''
+    start = time.perf_counter()
+    result = resp_generator(request, *args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _noop():
+    pass
+
+
+def _warm_up_worker(barrier, task, timeout):
+    try:
+        barrier.wait(timeout)
+    except threading.BrokenBarrierError:
+        # Some workers are busy, the others are warmed up anyway.
+        pass
+    if task is not None:
+        task()
+
 
 class SequentialExecutor(Executor):
     '''
         Executor for executing the requests sequentially.
     '''
+    concurrent = False
+
+    def warm_up(self, task=None, timeout=None):
+        '''
+            Requests run on the calling thread, there are no workers to start.
+        '''
+
+    def submit(self, request, resp_generator, context=None):
+        '''
+            Executes the request on the calling thread.
+        '''
+        future = Future()
+        future.set_result(resp_generator(request))
+        return future
 
     def execute(self, requests, resp_generator, *args, **kwargs):
         '''
@@ -43,19 +351,26 @@ class ThreadBasedExecutor(Executor):
     '''
         An implementation of executor using threads for parallelism.
     '''
-    def __init__(self, num_workers):
-        '''
-            Create a thread pool for concurrent execution with specified number of workers.
-        '''
-        self.executor_pool = ThreadPoolExecutor(num_workers)
+    pool_class = ThreadPoolExecutor
 
 
 class ProcessBasedExecutor(Executor):
     '''
         An implementation of executor using process(es) for parallelism.
     '''
-    def __init__(self, num_workers):
-        '''
-            Create a process pool for concurrent execution with specified number of workers.
-        '''
-        self.executor_pool = ProcessPoolExecutor(num_workers)
+    pool_class = ProcessPoolExecutor
+
+
+def _reset_executors_after_fork():
+    for executor in list(_executors):
+        executor.reset_after_fork()
+
+
+def _shutdown_executors():
+    for executor in list(_executors):
+        executor.shutdown(wait=True)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_executors_after_fork)
+atexit.register(_shutdown_executors)
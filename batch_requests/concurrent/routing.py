@@ -0,0 +1,77 @@
+'''
+@summary: Maps the routes of sub requests to the execution class they should run in.
+'''
+import re
+
+from batch_requests.utils import resolve_request
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404
+
+# Run on the thread handling the batch request.
+INLINE = 'inline'
+# Run on a thread pool.
+THREAD = 'thread'
+# Not supported: the WSGI requests and the views handling them can't be sent to another
+# process.
+PROCESS = 'process'
+# Run on a single worker, so that requests of this class never run concurrently.
+SERIALIZED = 'serialized'
+
+EXECUTION_CLASSES = (INLINE, THREAD, SERIALIZED)
+
+
+class ExecutionClassRouter(object):
+    '''
+        Chooses the execution class of a request from a mapping of URL names or regular
+        expressions to execution classes. Keys starting with ^ are regular expressions,
+        the others URL names. URL names are looked up first, regular expressions are then
+        tried in order against the request path.
+    '''
+
+    def __init__(self, rules=None):
+        self.names = {}
+        self.patterns = []
+        for pattern, execution_class in (rules or {}).items():
+            if execution_class == PROCESS:
+                raise ImproperlyConfigured(
+                    'Invalid execution class %r for %r, sub requests can\'t be pickled to '
+                    'run in another process.' % (execution_class, pattern)
+                )
+            if execution_class not in EXECUTION_CLASSES:
+                raise ImproperlyConfigured(
+                    'Invalid execution class %r for %r, must be one of %s.' % (
+                        execution_class, pattern, ', '.join(EXECUTION_CLASSES)
+                    )
+                )
+            if not pattern.startswith('^'):
+                self.names[pattern] = execution_class
+                continue
+            try:
+                self.patterns.append((re.compile(pattern), execution_class))
+            except re.error as error:
+                raise ImproperlyConfigured(
+                    'Invalid regular expression %r in EXECUTION_CLASSES: %s' % (pattern, error)
+                )
+
+    def __bool__(self):
+        return bool(self.names or self.patterns)
+
+    def classify(self, request):
+        '''
+            Returns the execution class for the given request, or None if no rule matches.
+        '''
+        if isinstance(request, tuple):
+            request = request[0]
+
+        try:
+            view_name = resolve_request(request).view_name
+        except Http404:
+            view_name = None
+
+        if view_name in self.names:
+            return self.names[view_name]
+
+        for regex, execution_class in self.patterns:
+            if regex.match(request.path_info):
+                return execution_class
+        return None
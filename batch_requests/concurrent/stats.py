@@ -0,0 +1,71 @@
+'''
+@summary: Keeps running estimates of the time taken by the requests of each route.
+'''
+import threading
+
+from batch_requests.utils import resolve_request
+from django.http import Http404
+
+# Key of the requests which don't resolve: their paths come from the clients, keeping an
+# estimate per path would let them grow the estimates without bounds.
+UNRESOLVED = '<unresolved>'
+
+
+class RouteCostModel(object):
+    '''
+        Exponentially weighted moving average of the duration (in seconds) of the requests
+        of each route.
+    '''
+
+    def __init__(self, alpha=0.2):
+        '''
+            alpha is the weight of the latest observation.
+        '''
+        self.alpha = alpha
+        self.estimates = {}
+        self.lock = threading.Lock()
+
+    def route_key(self, request):
+        '''
+            Returns the key the statistics of the request are kept under: its URL name, or
+            UNRESOLVED if it doesn't resolve. None if the request has no path.
+        '''
+        if isinstance(request, tuple):
+            request = request[0]
+
+        path = getattr(request, 'path_info', None)
+        if path is None:
+            return None
+
+        try:
+            return resolve_request(request).view_name
+        except Http404:
+            return UNRESOLVED
+
+    def observe(self, key, duration):
+        '''
+            Adds the duration of a request of the given route to its estimate.
+        '''
+        if key is None:
+            return
+
+        with self.lock:
+            estimate = self.estimates.get(key)
+            if estimate is None:
+                self.estimates[key] = duration
+            else:
+                self.estimates[key] = estimate + self.alpha * (duration - estimate)
+
+    def predict(self, key, default=None):
+        '''
+            Returns the estimated duration of a request of the given route.
+        '''
+        return self.estimates.get(key, default)
+
+    def mean(self, default=0.0):
+        '''
+            Returns the mean of the estimates of the known routes, default if none is known.
+        '''
+        with self.lock:
+            estimates = list(self.estimates.values())
+        return sum(estimates) / len(estimates) if estimates else default
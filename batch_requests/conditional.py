@@ -0,0 +1,119 @@
+'''
+@summary: ETag handling for sub responses and for the batch response as a whole.
+'''
+import hashlib
+import json
+
+from batch_requests.messages import SubResponse
+from django.utils.http import parse_etags, parse_http_date_safe, quote_etag
+
+# Only the responses of these methods can be short-circuited with a 304.
+CONDITIONAL_METHODS = {'GET', 'HEAD'}
+
+
+def get_header(result, name):
+    '''
+        Case insensitive lookup of a header of a sub response.
+    '''
+    name = name.lower()
+    for header, value in result.get('headers', {}).items():
+        if header.lower() == name:
+            return value
+    return None
+
+
+def body_etag(body):
+    '''
+        Computes a strong ETag from the (decoded) body of a sub response.
+    '''
+    if not isinstance(body, str):
+        body = json.dumps(body, sort_keys=True)
+    return quote_etag(hashlib.md5(body.encode('utf-8')).hexdigest())
+
+
+def _weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(if_none_match, etag):
+    '''
+        Weak comparison of an ETag against an If-None-Match header value.
+    '''
+    etags = parse_etags(if_none_match)
+    if etags == ['*']:
+        return True
+    return _weak(etag) in {_weak(candidate) for candidate in etags}
+
+
+def is_not_modified(meta, etag, last_modified=None):
+    '''
+        Checks the conditional headers found in the given META against the ETag and the
+        Last-Modified date of a response. If-None-Match takes precedence.
+    '''
+    if_none_match = meta.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag is not None and etag_matches(if_none_match, etag)
+
+    if_modified_since = parse_http_date_safe(meta.get('HTTP_IF_MODIFIED_SINCE', ''))
+    last_modified = parse_http_date_safe(last_modified) if last_modified else None
+    return bool(if_modified_since and last_modified and last_modified <= if_modified_since)
+
+
+def not_modified_result(result):
+    '''
+        Returns a body-less 304 entry keeping the validators of the given result.
+    '''
+    headers = {
+        header: value for header, value in result.get('headers', {}).items()
+        if header.lower() in ('etag', 'last-modified', 'cache-control', 'vary')
+    }
+    return SubResponse(304, 'Not Modified', headers)
+
+
+def conditional_result(wsgi_request, result):
+    '''
+        Makes sure successful GET and HEAD sub responses carry an ETag, computing it from
+        the body when the view didn't set one, and short-circuits the response with a
+        body-less 304 when it matches the conditional headers of the sub request.
+    '''
+    if result.get('status_code') == 304:
+        result.pop('body', None)
+        return result
+
+    if wsgi_request.method not in CONDITIONAL_METHODS or result.get('status_code') != 200:
+        return result
+
+    etag = get_header(result, 'ETag')
+    if etag is None:
+        etag = body_etag(result.get('body', ''))
+        result.setdefault('headers', {})['ETag'] = etag
+
+    if is_not_modified(wsgi_request.META, etag, get_header(result, 'Last-Modified')):
+        return not_modified_result(result)
+    return result
+
+
+def is_conditional_batch(requests):
+    '''
+        Only a batch made of GET and HEAD requests can be short-circuited with a 304, the
+        results of its writes would be lost otherwise.
+    '''
+    return requests is not None and all(
+        str(request_data.get('method', '')).upper() in CONDITIONAL_METHODS
+        for request_data in requests
+    )
+
+
+def batch_etag(results):
+    '''
+        Computes the ETag of a batch response from the status and the validator of each of
+        its entries, leaving out volatile headers such as durations.
+    '''
+    digest = hashlib.md5()
+    for result in results:
+        # Entries without a body, e.g. errors, are told apart by their reason phrase.
+        etag = get_header(result, 'ETag') or body_etag([
+            result.get('status_code'), result.get('reason_phrase'), result.get('body', ''),
+        ])
+        digest.update(('%s %s\n' % (result.get('status_code'), etag)).encode('utf-8'))
+    return quote_etag(digest.hexdigest())
@@ -0,0 +1,95 @@
+'''
+@summary: Builds the envelope the sub responses are returned in.
+'''
+from http.client import responses as REASON_PHRASES
+
+from batch_requests.jsonapi import JsonApiIncludedMerger
+from batch_requests.settings import br_settings as _settings
+
+
+def filter_headers(headers, allowed):
+    '''
+        Keeps the headers whose (case insensitive) name is allowed.
+    '''
+    return {header: value for header, value in headers.items() if header.lower() in allowed}
+
+
+def compact_result(result):
+    '''
+        Leaves out the default reason phrase and the empty body and headers of a result.
+    '''
+    compact = dict(result)
+    if compact.get('reason_phrase') == REASON_PHRASES.get(compact.get('status_code')):
+        del compact['reason_phrase']
+    if compact.get('body') in ('', None):
+        compact.pop('body', None)
+    if not compact.get('headers'):
+        compact.pop('headers', None)
+    return compact
+
+
+def hoist_headers(results):
+    '''
+        Moves the headers having the same value in every result to a single block.
+        Returns the common headers and the results without them.
+    '''
+    if not results:
+        return {}, results
+
+    common = dict(results[0].get('headers') or {})
+    for result in results[1:]:
+        headers = result.get('headers') or {}
+        common = {
+            header: value for header, value in common.items()
+            if header in headers and headers[header] == value
+        }
+    if not common:
+        return common, results
+
+    hoisted = []
+    for result in results:
+        result = dict(result)
+        result['headers'] = {
+            header: value for header, value in (result.get('headers') or {}).items()
+            if header not in common
+        }
+        hoisted.append(result)
+    return common, hoisted
+
+
+def build_envelope(results):
+    '''
+        Returns the JSON serializable batch response for the given results.
+
+        By default this is the list of results. Headers not in RESPONSE_HEADERS_TO_INCLUDE
+        (when set) are left out. With COMPACT_ENVELOPE, the results go in a "batch" list
+        next to a "headers" block holding the headers common to all of them, and default
+        reason phrases and empty bodies are left out.
+
+        With MERGE_JSONAPI_INCLUDED, the included resources of the JSON-API sub responses
+        are moved to an "included" list of the envelope, which is then always an object.
+    '''
+    included = None
+    if _settings.MERGE_JSONAPI_INCLUDED:
+        merger = JsonApiIncludedMerger()
+        results = [merger.merge(result) for result in results]
+        included = merger.resources()
+
+    allowed = _settings.RESPONSE_HEADERS_TO_INCLUDE
+    if allowed is not None:
+        allowed = {header.lower() for header in allowed}
+        results = [
+            dict(result, headers=filter_headers(result['headers'], allowed))
+            if result.get('headers') else result
+            for result in results
+        ]
+
+    if not _settings.COMPACT_ENVELOPE:
+        envelope = {'batch': results} if included is not None else results
+    else:
+        headers, results = hoist_headers(results)
+        envelope = {'headers': headers, 'batch': [compact_result(result) for result in results]}
+
+    if included is not None:
+        envelope['included'] = included
+    return envelope
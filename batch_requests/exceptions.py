@@ -11,10 +11,11 @@ class BadBatchRequest(Exception):
     '''
         Raised when client sends an invalid batch request.
     '''
-    def __init__(self, message, results=None, requests=None, *args, **kwargs):
+    def __init__(self, message, results=None, requests=None, exception=None, *args, **kwargs):
         '''
-            Initialize.
+            Initialize. The exception is the one raised by the view of the failed request.
         '''
         self.requests = requests
         self.results = results
+        self.exception = exception
         Exception.__init__(self, message, *args, **kwargs)
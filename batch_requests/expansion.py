@@ -0,0 +1,120 @@
+'''
+@summary: Expands the fan-out templates and the defaults of a batch.
+
+A request definition with a ``for_each`` list is a template, expanded into a request per
+item, the ``{{item}}`` placeholders of its url and body being replaced with the item:
+
+    {"method": "get", "url": "/users/{{item}}/", "for_each": [1, 2, 3]}
+
+The ``defaults`` block of the batch holds what the requests have in common, e.g. their
+method and headers. Headers are merged, the request's own values taking precedence.
+'''
+import json
+import re
+from urllib.parse import quote
+
+from batch_requests.exceptions import BadBatchRequest
+
+PLACEHOLDER = '{{item}}'
+# A placeholder making up a whole JSON string is replaced with the JSON item itself.
+_PLACEHOLDERS = re.compile(r'("\{\{item\}\}"|\{\{item\}\})')
+
+
+def apply_defaults(request_data, defaults):
+    '''
+        Returns the request definition completed with the defaults of the batch.
+    '''
+    if not defaults or not isinstance(request_data, dict):
+        return request_data
+
+    merged = dict(defaults, **request_data)
+    if isinstance(defaults.get('headers'), dict) and isinstance(request_data.get('headers'), dict):
+        merged['headers'] = dict(defaults['headers'], **request_data['headers'])
+    return merged
+
+
+class Template(object):
+    '''
+        A request definition compiled for expansion: its url and body are split around
+        their placeholders once, and put back together for each item. A body given as JSON
+        rather than as a string stays decoded, so that onward placeholders still apply.
+    '''
+
+    def __init__(self, request_data):
+        self.request_data = {
+            key: value for key, value in request_data.items() if key not in ('for_each', 'body')
+        }
+        url = request_data.get('url')
+        self.url_parts = url.split(PLACEHOLDER) if isinstance(url, str) else None
+
+        self.body_parts = None
+        self.body_is_text = True
+        if 'body' in request_data:
+            body = request_data['body']
+            self.body_is_text = isinstance(body, str)
+            text = body if self.body_is_text else json.dumps(body)
+            if PLACEHOLDER in text:
+                self.body_parts = _PLACEHOLDERS.split(text)
+            else:
+                self.request_data['body'] = body
+
+    def expand(self, item):
+        request_data = dict(self.request_data)
+        if self.url_parts is not None:
+            request_data['url'] = quote(str(item), safe='').join(self.url_parts)
+
+        if self.body_parts is not None:
+            whole = json.dumps(item)
+            inner = json.dumps(str(item))[1:-1]
+            body = ''.join(
+                whole if part == '"%s"' % PLACEHOLDER else inner if part == PLACEHOLDER else part
+                for part in self.body_parts
+            )
+            request_data['body'] = body if self.body_is_text else json.loads(body)
+        return request_data
+
+
+def iter_expanded(requests, defaults=None):
+    '''
+        Yields the requests of the batch, with the templates expanded and the defaults
+        applied.
+    '''
+    if defaults is not None and not isinstance(defaults, dict):
+        raise BadBatchRequest('The defaults of batch request should be an object.')
+
+    for request_data in requests:
+        request_data = apply_defaults(request_data, defaults)
+        if not isinstance(request_data, dict) or 'for_each' not in request_data:
+            yield request_data
+            continue
+
+        items = request_data['for_each']
+        if not isinstance(items, list):
+            raise BadBatchRequest('for_each should be a list.')
+        template = Template(request_data)
+        for item in items:
+            yield template.expand(item)
+
+
+def expand_requests(requests, defaults=None, max_limit=None):
+    '''
+        Returns the requests of the batch, with the templates expanded and the defaults
+        applied. Raises BadBatchRequest as soon as there are more than max_limit of them.
+    '''
+    expanded = []
+    for request_data in iter_expanded(requests, defaults):
+        if max_limit is not None and len(expanded) >= max_limit:
+            raise BadBatchRequest('You can batch maximum of %d requests.' % max_limit)
+        expanded.append(request_data)
+    return expanded
+
+
+def parse_batch(body, max_limit=None):
+    '''
+        Decodes the body of a batch request and returns its expanded requests.
+    '''
+    data = json.loads(body)
+    requests = data.get('batch', [])
+    if type(requests) not in (list, tuple):
+        raise BadBatchRequest('The body of batch request should always be list!')
+    return expand_requests(requests, data.get('defaults'), max_limit)
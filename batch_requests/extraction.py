@@ -0,0 +1,182 @@
+'''
+@summary: Compiled extraction expressions used to pass values from a response onward to
+          the subsequent requests of a batch.
+
+An expression is either a JSON pointer (``/data/id``) or a dotted path (``data.id``).
+Each segment may be followed by ``[n]`` to index a list (negative indexes count from the
+end) or ``[*]`` to collect the value from every element of a list. A default value may be
+given after a ``|``, as a JSON literal or a plain string: ``data.parent.id | null``.
+'''
+import json
+import re
+from functools import lru_cache
+
+from batch_requests.exceptions import BadBatchRequest
+
+_SEGMENT = re.compile(r'^(?P<name>[^\[\]]*)(?P<brackets>(?:\[(?:-?\d+|\*)\])*)$')
+_BRACKET = re.compile(r'\[(-?\d+|\*)\]')
+
+WILDCARD = ('*', None)
+_MISSING = object()
+
+
+class Expression(object):
+    '''
+        A compiled extraction expression.
+    '''
+    __slots__ = ('source', 'steps', 'default', 'has_default')
+
+    def __init__(self, source, steps, default=None, has_default=False):
+        self.source = source
+        self.steps = steps
+        self.default = default
+        self.has_default = has_default
+
+    def extract(self, body):
+        '''
+            Returns the value of this expression for the given body.
+        '''
+        return Extractor({'value': self}).extract(body).get('value')
+
+
+class _Node(object):
+    '''
+        A node of the trie built from the steps of several expressions.
+    '''
+    __slots__ = ('children', 'names')
+
+    def __init__(self):
+        self.children = {}
+        self.names = []
+
+    def all_names(self):
+        names = list(self.names)
+        for child in self.children.values():
+            names.extend(child.all_names())
+        return names
+
+
+class Extractor(object):
+    '''
+        Extracts the values of several expressions in a single walk of a body.
+    '''
+
+    def __init__(self, expressions):
+        self.expressions = expressions
+        self.root = _Node()
+        for name, expression in expressions.items():
+            node = self.root
+            for step in expression.steps:
+                node = node.children.setdefault(step, _Node())
+            node.names.append(name)
+
+    def extract(self, body):
+        '''
+            Returns a dict of name to extracted value. Names whose expression did not
+            match, and which have no default, are left out.
+        '''
+        values = {}
+        _walk(self.root, body, values)
+        for name, expression in self.expressions.items():
+            if name not in values and expression.has_default:
+                values[name] = expression.default
+        return values
+
+
+def _resolve(step, value):
+    '''
+        Applies a single step to the value, returns _MISSING if it does not apply.
+    '''
+    kind, arg = step
+    if kind == 'key':
+        if isinstance(value, dict):
+            return value.get(arg, _MISSING)
+        if isinstance(value, list) and arg.isdigit():
+            kind, arg = 'index', int(arg)
+    if kind == 'index' and isinstance(value, list):
+        try:
+            return value[arg]
+        except IndexError:
+            return _MISSING
+    return _MISSING
+
+
+def _walk(node, value, values):
+    for name in node.names:
+        values[name] = value
+
+    for step, child in node.children.items():
+        if step == WILDCARD:
+            if not isinstance(value, list):
+                continue
+            collected = {name: [] for name in child.all_names()}
+            for item in value:
+                item_values = {}
+                _walk(child, item, item_values)
+                for name, item_value in item_values.items():
+                    collected[name].append(item_value)
+            values.update(collected)
+        else:
+            next_value = _resolve(step, value)
+            if next_value is not _MISSING:
+                _walk(child, next_value, values)
+
+
+def _parse_segment(segment):
+    match = _SEGMENT.match(segment)
+    if match is None:
+        raise ValueError(segment)
+
+    steps = []
+    if match.group('name'):
+        steps.append(('key', match.group('name')))
+    for index in _BRACKET.findall(match.group('brackets')):
+        steps.append(WILDCARD if index == '*' else ('index', int(index)))
+    return steps
+
+
+@lru_cache(maxsize=512)
+def compile_expression(source):
+    '''
+        Compiles the given expression. Compiled expressions are cached by source string.
+    '''
+    path, has_default, default = source, False, None
+    if '|' in source:
+        path, default = source.split('|', 1)
+        default = default.strip()
+        try:
+            default = json.loads(default)
+        except ValueError:
+            pass
+        has_default = True
+
+    path = path.strip()
+    if path.startswith('/'):
+        segments = [
+            segment.replace('~1', '/').replace('~0', '~') for segment in path[1:].split('/')
+        ]
+    else:
+        segments = path.split('.') if path else []
+
+    steps = []
+    try:
+        for segment in segments:
+            steps.extend(_parse_segment(segment))
+    except ValueError:
+        raise BadBatchRequest('Invalid onward_data expression: %s' % source)
+    return Expression(source, tuple(steps), default, has_default)
+
+
+def compile_extractor(expressions):
+    '''
+        Compiles a dict of name to expression string into an Extractor.
+    '''
+    if not isinstance(expressions, dict) or not all(
+            isinstance(source, str) for source in expressions.values()):
+        raise BadBatchRequest('onward_data should map names to expression strings.')
+    return _compile_extractor(tuple(sorted(expressions.items())))
+
+
+@lru_cache(maxsize=512)
+def _compile_extractor(items):
+    return Extractor({name: compile_expression(source) for name, source in items})
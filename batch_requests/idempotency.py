@@ -0,0 +1,266 @@
+'''
+@summary: Replays the stored response of a batch retried with the same Idempotency-Key.
+
+The first execution of a batch carrying an ``Idempotency-Key`` header has its response
+stored for IDEMPOTENCY_TTL seconds. Retries get the stored response back without anything
+being executed; a retry arriving while the first execution is still running waits for it.
+'''
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from batch_requests.settings import br_settings as _settings
+from batch_requests.settings import import_class
+from django.core.cache import caches
+from django.http.response import HttpResponse, StreamingHttpResponse
+
+IDEMPOTENCY_KEY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER_NAME = 'Idempotent-Replayed'
+
+
+class IdempotencyStore(object):
+    '''
+        Interface of the stores keeping the responses. A stored response is a dict with
+        the fingerprint of the request, the status code, the content and the headers.
+    '''
+
+    def get(self, key):
+        '''
+            Returns the stored response, None if there is none or it expired.
+        '''
+        raise NotImplementedError
+
+    def set(self, key, stored):
+        raise NotImplementedError
+
+    def acquire(self, key):
+        '''
+            Marks the key as in flight. Returns False if it already is.
+        '''
+        raise NotImplementedError
+
+    def release(self, key):
+        raise NotImplementedError
+
+    def wait(self, key, timeout):
+        '''
+            Waits, at most timeout seconds, for the key to be released.
+        '''
+        time.sleep(min(timeout, 0.05))
+
+
+class LocalIdempotencyStore(IdempotencyStore):
+    '''
+        In process LRU of at most IDEMPOTENCY_MAX_ENTRIES responses. Only retries reaching
+        the same process are deduplicated.
+    '''
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.in_flight = set()
+        self.condition = threading.Condition()
+
+    def get(self, key):
+        with self.condition:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, stored = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return stored
+
+    def set(self, key, stored):
+        with self.condition:
+            self.entries[key] = (time.monotonic() + _settings.IDEMPOTENCY_TTL, stored)
+            self.entries.move_to_end(key)
+            while len(self.entries) > _settings.IDEMPOTENCY_MAX_ENTRIES:
+                self.entries.popitem(last=False)
+
+    def acquire(self, key):
+        with self.condition:
+            if key in self.in_flight:
+                return False
+            self.in_flight.add(key)
+            return True
+
+    def release(self, key):
+        with self.condition:
+            self.in_flight.discard(key)
+            self.condition.notify_all()
+
+    def wait(self, key, timeout):
+        with self.condition:
+            if key in self.in_flight:
+                self.condition.wait(timeout)
+
+
+class CacheIdempotencyStore(IdempotencyStore):
+    '''
+        Keeps the responses in the Django cache set in IDEMPOTENCY_CACHE_ALIAS, so that
+        retries are deduplicated across processes sharing the cache.
+    '''
+
+    @property
+    def cache(self):
+        return caches[_settings.IDEMPOTENCY_CACHE_ALIAS]
+
+    def get(self, key):
+        return self.cache.get('batch_requests.idempotency.%s' % key)
+
+    def set(self, key, stored):
+        self.cache.set('batch_requests.idempotency.%s' % key, stored, _settings.IDEMPOTENCY_TTL)
+
+    def acquire(self, key):
+        # The lock outlives the execution of the batch, but not a process dying meanwhile.
+        return self.cache.add(
+            'batch_requests.idempotency.lock.%s' % key, True, _settings.IDEMPOTENCY_LOCK_TTL
+        )
+
+    def release(self, key):
+        self.cache.delete('batch_requests.idempotency.lock.%s' % key)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    '''
+        Returns the configured store, shared by the whole process.
+    '''
+    path = _settings.IDEMPOTENCY_STORE
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = import_class(path)()
+        return _stores[path]
+
+
+class HashingStream(object):
+    '''
+        Wraps the stream of a request body, hashing what is read from it, so that a body
+        read incrementally (see STREAM_INGEST) is fingerprinted without being buffered.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.hash = hashlib.sha256()
+
+    def read(self, *args, **kwargs):
+        data = self.stream.read(*args, **kwargs)
+        self.hash.update(data)
+        return data
+
+    def readline(self, *args, **kwargs):
+        data = self.stream.readline(*args, **kwargs)
+        self.hash.update(data)
+        return data
+
+    def hexdigest(self):
+        '''
+            Returns the hash of the whole body, reading what wasn't read yet.
+        '''
+        while True:
+            chunk = self.read(64 * 1024)
+            if not chunk:
+                return self.hash.hexdigest()
+
+
+def request_fingerprint(request):
+    '''
+        Returns the hash of the request body. With STREAM_INGEST, the body is hashed in
+        chunks rather than loaded at once.
+    '''
+    if _settings.STREAM_INGEST:
+        return HashingStream(request).hexdigest()
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def store_key(request, key):
+    '''
+        Keys are scoped by user and path, so that clients can't replay each other's batches.
+    '''
+    user = getattr(request, 'user', None)
+    user_id = user.pk if user is not None and user.is_authenticated else ''
+    scope = '%s\n%s\n%s' % (user_id, request.path, key)
+    return hashlib.sha256(scope.encode('utf-8')).hexdigest()
+
+
+def stored_response(response, fingerprint):
+    return {
+        'fingerprint': fingerprint,
+        'status_code': response.status_code,
+        'content': response.content,
+        'headers': list(response.items()),
+    }
+
+
+def replayed_response(stored):
+    response = HttpResponse(content=stored['content'], status=stored['status_code'])
+    for header, value in stored['headers']:
+        response[header] = value
+    response[REPLAYED_HEADER_NAME] = 'true'
+    return response
+
+
+def idempotent(view):
+    '''
+        Stores the response of the batch views called with an Idempotency-Key header, and
+        replays it for the retries carrying the same key and body. A key reused with another
+        body gets a 422, a retry still waiting for the first execution after
+        IDEMPOTENCY_WAIT_SECONDS a 409.
+    '''
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_KEY_HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+
+        store = get_idempotency_store()
+        key = store_key(request, key)
+        # A streamed body is fingerprinted while the view reads it, unless it's replayed.
+        fingerprint = None if _settings.STREAM_INGEST else request_fingerprint(request)
+        deadline = time.monotonic() + _settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            stored = store.get(key)
+            if stored is not None:
+                if fingerprint is None:
+                    fingerprint = request_fingerprint(request)
+                if stored['fingerprint'] != fingerprint:
+                    return HttpResponse(
+                        'The Idempotency-Key was used for another batch.', status=422
+                    )
+                return replayed_response(stored)
+
+            if store.acquire(key):
+                # The first execution may have stored its response since it was looked up.
+                if store.get(key) is None:
+                    break
+                store.release(key)
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return HttpResponse(
+                    'A batch with this Idempotency-Key is still being executed.', status=409
+                )
+            store.wait(key, remaining)
+
+        stream = None
+        if fingerprint is None:
+            stream = request._stream = HashingStream(request._stream)
+        try:
+            response = view(request, *args, **kwargs)
+            if stream is not None:
+                fingerprint = stream.hexdigest()
+            # Server errors are left out, so that the retry executes the batch again.
+            if not isinstance(response, StreamingHttpResponse) and response.status_code < 500:
+                store.set(key, stored_response(response, fingerprint))
+            return response
+        finally:
+            store.release(key)
+    return inner
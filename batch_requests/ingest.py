@@ -0,0 +1,166 @@
+'''
+@summary: Incremental parsing of the batch request body.
+
+The sub requests of the ``batch`` array are decoded one at a time while the body is read, so
+that they can be executed before the rest of the body has arrived, and without the whole
+document ever being decoded at once.
+'''
+import codecs
+import json
+import re
+
+from batch_requests.exceptions import BadBatchRequest
+from batch_requests.expansion import iter_expanded
+
+_WHITESPACE = re.compile(r'\s*')
+_decoder = json.JSONDecoder()
+
+
+class BatchStreamParser(object):
+    '''
+        Reads the JSON object of a batch request from a file like object, in chunks, up to
+        max_size bytes (None for no limit).
+    '''
+
+    def __init__(self, stream, chunk_size=64 * 1024, max_size=None):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.size = 0
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        # Values of the keys of the top level object read so far, other than batch.
+        self.values = {}
+        # Keys of the top level object, in the order they were read.
+        self.keys = []
+
+    def read_more(self):
+        '''
+            Appends the next chunk of the body to the buffer. Returns False at the end.
+        '''
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        self.size += len(chunk or b'')
+        if self.max_size is not None and self.size > self.max_size:
+            raise BadBatchRequest(
+                'The body of batch request is larger than %d bytes.' % self.max_size
+            )
+        try:
+            text = self.text_decoder.decode(chunk or b'', final=self.eof)
+        except UnicodeDecodeError:
+            raise BadBatchRequest('The body of batch request should be UTF-8 encoded JSON.')
+        # Drop what was already consumed.
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.read_more():
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, *tokens):
+        token = self.peek()
+        if token not in tokens:
+            raise BadBatchRequest('Invalid JSON in the body of batch request.')
+        self.pos += 1
+        return token
+
+    def value(self):
+        '''
+            Decodes the next JSON value, reading more of the body until it's complete.
+        '''
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                end = None
+            # A number at the end of the buffer may go on in the next chunk.
+            if end is not None and (end < len(self.buffer) or self.eof):
+                self.pos = end
+                return value
+            if not self.read_more():
+                raise BadBatchRequest('Invalid JSON in the body of batch request.')
+
+    def iter_array(self):
+        '''
+            Yields the elements of the array starting at the current position.
+        '''
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',', ']') == ']':
+                return
+
+    def iter_batch(self):
+        '''
+            Yields the elements of the batch array of the top level object.
+        '''
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+        else:
+            seen = set()
+            while True:
+                if self.peek() != '"':
+                    raise BadBatchRequest('Invalid JSON in the body of batch request.')
+                key = self.value()
+                self.expect(':')
+                if key in seen:
+                    raise BadBatchRequest('Duplicate key in the body of batch request.')
+                seen.add(key)
+                self.keys.append(key)
+
+                if key != 'batch':
+                    self.values[key] = self.value()
+                elif self.peek() != '[':
+                    raise BadBatchRequest('The body of batch request should always be list!')
+                else:
+                    yield from self.iter_array()
+
+                if self.expect(',', '}') == '}':
+                    break
+
+        if self.peek():
+            raise BadBatchRequest('Extra data after the body of batch request.')
+
+
+def iter_batch_requests(stream, max_limit, chunk_size=64 * 1024, max_size=None):
+    '''
+        Yields the sub requests of the batch read from the given stream as soon as each of
+        them has been read, with the templates expanded. Raises BadBatchRequest once more than
+        max_limit were read, or more than max_size bytes, or at the end if the defaults were
+        given after the batch array.
+    '''
+    parser = BatchStreamParser(stream, chunk_size, max_size)
+
+    def expanded():
+        for request_data in parser.iter_batch():
+            yield from iter_expanded([request_data], parser.values.get('defaults'))
+
+    for index, request_data in enumerate(expanded()):
+        if index >= max_limit:
+            raise BadBatchRequest('You can batch maximum of %d requests.' % max_limit)
+        if not isinstance(request_data, dict):
+            raise BadBatchRequest('Request definition should have url, method defined.')
+        yield request_data
+
+    # The batch has been executed without defaults given after it, rather than with them.
+    keys = parser.keys
+    if 'defaults' in keys and 'batch' in keys and keys.index('defaults') > keys.index('batch'):
+        raise BadBatchRequest(
+            'The defaults of a streamed batch should come before the batch array.'
+        )
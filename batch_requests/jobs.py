@@ -0,0 +1,248 @@
+'''
+@summary: Storage and background execution of asynchronous batch jobs.
+
+Very large batches are accepted as jobs: their sub requests run on a background pool and
+their results are stored, as they finish, in a pluggable job store.
+'''
+import json
+import os
+import threading
+import time
+import uuid
+
+from batch_requests.concurrent.executor import ThreadBasedExecutor
+from batch_requests.loader import BatchLoader
+from batch_requests.settings import br_settings as _settings
+from batch_requests.settings import import_class
+from batch_requests.utils import headers_to_include_from_request
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Credentials aren't stored with the jobs, their sub requests run as the user of the job.
+CREDENTIAL_HEADERS = {'HTTP_COOKIE', 'HTTP_AUTHORIZATION', 'HTTP_PROXY_AUTHORIZATION'}
+
+
+class JobStore(object):
+    '''
+        Interface of the job stores. A job is a dict with its id, status, total number of
+        requests, number of completed requests, requests, the headers of the request which
+        submitted it (meta) and the id of its user. Results are stored in completion
+        order, each of them carrying the index of its request.
+    '''
+
+    def create(self, requests, meta, user_id=None):
+        '''
+            Stores a new pending job and returns its id.
+        '''
+        raise NotImplementedError
+
+    def get(self, job_id):
+        '''
+            Returns the job, None if it doesn't exist.
+        '''
+        raise NotImplementedError
+
+    def set_status(self, job_id, status):
+        raise NotImplementedError
+
+    def add_result(self, job_id, result):
+        raise NotImplementedError
+
+    def get_results(self, job_id, offset=0, limit=None):
+        '''
+            Returns the results of the job, in completion order, from offset.
+        '''
+        raise NotImplementedError
+
+    def claim(self, job_id):
+        '''
+            Takes the lease of the job for this worker. Returns False if another worker
+            holds it. Leases expire JOB_LEASE_SECONDS after the last result, so that the
+            jobs of a worker which went away can be resumed.
+        '''
+        raise NotImplementedError
+
+    def release(self, job_id):
+        raise NotImplementedError
+
+    def leased(self, job_id):
+        '''
+            Returns whether a worker holds the lease of the job.
+        '''
+        raise NotImplementedError
+
+    def unfinished(self):
+        '''
+            Returns the ids of the jobs which are neither done nor failed.
+        '''
+        raise NotImplementedError
+
+
+class FileJobStore(JobStore):
+    '''
+        Keeps each job in JOB_STORE_DIR: a JSON file for the job, a JSON lines file for its
+        results and a lock file for its lease. The directory and the files are only
+        accessible to the user running the workers.
+    '''
+    lock = threading.Lock()
+
+    def __init__(self, directory=None):
+        self.directory = directory or _settings.JOB_STORE_DIR
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        if os.stat(self.directory).st_mode & 0o077:
+            os.chmod(self.directory, 0o700)
+
+    def _open(self, path, flags, mode='w'):
+        return os.fdopen(os.open(path, flags | os.O_WRONLY | os.O_CREAT, 0o600), mode)
+
+    def _path(self, job_id, extension):
+        if not job_id.isalnum():
+            raise ValueError('Invalid job id.')
+        return os.path.join(self.directory, '%s.%s' % (job_id, extension))
+
+    def _write_job(self, job):
+        path = self._path(job['id'], 'json')
+        with self._open(path + '.tmp', os.O_TRUNC) as job_file:
+            json.dump(job, job_file)
+        os.replace(path + '.tmp', path)
+
+    def _read_job(self, job_id):
+        try:
+            with open(self._path(job_id, 'json')) as job_file:
+                return json.load(job_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def create(self, requests, meta, user_id=None):
+        job = {
+            'id': uuid.uuid4().hex, 'status': PENDING, 'total': len(requests),
+            'requests': requests, 'meta': meta, 'user_id': user_id,
+        }
+        self._write_job(job)
+        return job['id']
+
+    def get(self, job_id):
+        job = self._read_job(job_id)
+        if job is not None:
+            job['completed'] = len(self.get_results(job_id))
+        return job
+
+    def set_status(self, job_id, status):
+        with self.lock:
+            job = self._read_job(job_id)
+            job['status'] = status
+            self._write_job(job)
+
+    def add_result(self, job_id, result):
+        line = json.dumps(result) + '\n'
+        with self.lock:
+            with self._open(self._path(job_id, 'results'), os.O_APPEND, 'a') as results_file:
+                results_file.write(line)
+        self._heartbeat(job_id)
+
+    def get_results(self, job_id, offset=0, limit=None):
+        try:
+            with open(self._path(job_id, 'results')) as results_file:
+                lines = results_file.readlines()
+        except FileNotFoundError:
+            return []
+        end = None if limit is None else offset + limit
+        # A line being written by another process may not be complete yet.
+        return [json.loads(line) for line in lines[offset:end] if line.endswith('\n')]
+
+    def _heartbeat(self, job_id):
+        try:
+            os.utime(self._path(job_id, 'lock'))
+        except FileNotFoundError:
+            pass
+
+    def claim(self, job_id):
+        path = self._path(job_id, 'lock')
+        for _ in range(2):
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) < _settings.JOB_LEASE_SECONDS:
+                        return False
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def release(self, job_id):
+        try:
+            os.remove(self._path(job_id, 'lock'))
+        except FileNotFoundError:
+            pass
+
+    def leased(self, job_id):
+        try:
+            age = time.time() - os.path.getmtime(self._path(job_id, 'lock'))
+        except FileNotFoundError:
+            return False
+        return age < _settings.JOB_LEASE_SECONDS
+
+    def unfinished(self):
+        job_ids = [
+            name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json')
+        ]
+        return [
+            job_id for job_id in job_ids
+            if (self._read_job(job_id) or {}).get('status', DONE) not in (DONE, FAILED)
+        ]
+
+
+class JobRequest(object):
+    '''
+        Stands for the request which submitted a job when building its sub requests, which
+        may happen after that request is gone (e.g. when resuming the job).
+    '''
+
+    def __init__(self, meta, user_id=None):
+        self.META = meta
+        self.batch_loader = BatchLoader()
+        if user_id is not None:
+            self.user = get_user_model()._default_manager.filter(pk=user_id).first()
+            if self.user is None:
+                self.user = AnonymousUser()
+
+
+def job_meta(request):
+    '''
+        Returns the headers of the request submitting a job to store with it, without the
+        credentials.
+    '''
+    return {
+        header: value for header, value in headers_to_include_from_request(request).items()
+        if header not in CREDENTIAL_HEADERS
+    }
+
+
+def get_job_store():
+    '''
+        Returns the configured job store.
+    '''
+    return import_class(_settings.JOB_STORE)()
+
+
+_job_executor = None
+_job_executor_lock = threading.Lock()
+
+
+def submit_job(func, job_id):
+    '''
+        Runs func(job_id) on the background job pool.
+    '''
+    global _job_executor
+    if _job_executor is None:
+        with _job_executor_lock:
+            if _job_executor is None:
+                _job_executor = ThreadBasedExecutor(_settings.JOB_WORKERS)
+    return _job_executor.executor_pool.submit(func, job_id)
@@ -1,4 +1,5 @@
 import json
+import threading
 
 
 class JsonApiRewriter:
@@ -9,11 +10,17 @@ class JsonApiRewriter:
     uses the first resource as a relationship. This rewriter supports
     replacing the UUID value in subsequent relationships with the
     DB level ID.
+
+    The rewriter can also infer which requests of a batch depend on
+    each other, so that independent requests may run in parallel.
+    The mapping is guarded by a lock as it may be updated and read
+    from several threads.
     """
     def __init__(self):
 
         # Cache the generated mappings.
         self.mapping = {}
+        self.lock = threading.RLock()
 
         # Only rewrite a request if the method matches one of these.
         self.rewrite_methods = {'post', 'put', 'patch', 'delete'}
@@ -28,12 +35,22 @@ class JsonApiRewriter:
         """
         if not self.should_rewrite(request):
             return request
-        body = request.get('body', None)
+        body = self.load_body(request)
         if body is not None:
-            body = json.loads(body)
             self.rewrite_body(body)
             request['body'] = body
 
+    def load_body(self, request):
+        """ Return the request body as a dict, or None if it isn't JSON.
+        """
+        body = request.get('body', None)
+        if isinstance(body, (str, bytes)):
+            try:
+                body = json.loads(body)
+            except ValueError:
+                return None
+        return body if isinstance(body, dict) else None
+
     def rewrite_body(self, body):
         data = body.get('data', {})
         self.rewrite_main(data)
@@ -59,21 +76,80 @@ class JsonApiRewriter:
 
     def map_relation_id(self, relation):
         type, id = relation.get('type'), relation.get('id')
-        return self.mapping.get(type, {}).get(id)
+        with self.lock:
+            return self.mapping.get(type, {}).get(id)
+
+    def iter_relations(self, body):
+        """ Yield every relation `rewrite_body` would touch.
+        """
+        data = body.get('data', {})
+        if isinstance(data, dict):
+            yield data
+            for rel in data.get('relationships', {}).values():
+                related = rel.get('data', {})
+                if not isinstance(related, list):
+                    related = [related]
+                for relation in related:
+                    if isinstance(relation, dict):
+                        yield relation
+
+    def references(self, request):
+        """ The (type, id) pairs a request would have rewritten.
+        """
+        if not self.should_rewrite(request):
+            return set()
+        body = self.load_body(request)
+        if body is None:
+            return set()
+        return {
+            (relation.get('type'), relation.get('id'))
+            for relation in self.iter_relations(body)
+            if relation.get('id') is not None
+        }
+
+    def creates(self, request):
+        """ The (type, id) pairs a request would add to the mapping.
+        """
+        if request.get('method', '').lower() not in self.update_methods:
+            return set()
+        body = self.load_body(request)
+        data = body.get('data', {}) if body is not None else None
+        if not isinstance(data, dict) or 'id' not in data:
+            return set()
+        return {(data.get('type'), data['id'])}
+
+    def dependencies(self, requests):
+        """ Infer the dependencies between the requests of a batch.
+
+        Returns a list with the set of indexes of the earlier requests
+        each request depends on, i.e. the requests creating an ID it
+        references.
+        """
+        creators = {}
+        dependencies = []
+        for index, request in enumerate(requests):
+            dependencies.append({
+                creators[ref] for ref in self.references(request)
+                if ref in creators
+            })
+            for ref in self.creates(request):
+                creators.setdefault(ref, index)
+        return dependencies
 
     def update_mapping(self, request, response):
         if not self.should_update(request, response):
             return
-        req_body = request.get('body', None)
+        req_body = self.load_body(request)
         rsp_body = response.get('body', None)
-        if req_body is None or rsp_body is None:
+        if req_body is None or not isinstance(rsp_body, dict):
             return
         req_data = req_body.get('data', {})
         rsp_data = rsp_body.get('data', {})
         if 'id' in req_data and 'id' in rsp_data:
-            self.mapping.setdefault(
-                req_data['type'], {}
-            )[req_data['id']] = rsp_data['id']
+            with self.lock:
+                self.mapping.setdefault(
+                    req_data['type'], {}
+                )[req_data['id']] = rsp_data['id']
 
     def should_rewrite(self, request):
         method = request.get('method', '')
@@ -85,3 +161,54 @@ class JsonApiRewriter:
             method.lower() in self.update_methods and
             response.get('status_code') in self.update_status_codes
         )
+
+
+class JsonApiIncludedMerger:
+    """ Merge the `included` resources of JSON-API sub responses.
+
+    The same related resources are often included by several sub
+    responses of a batch. The merger moves them to a single pool,
+    keyed by (type, id), and leaves each sub response with the
+    resource identifiers of what it included. Resources included
+    more than once are merged, the first values taking precedence.
+    """
+    def __init__(self):
+        self.included = {}
+
+    def merge(self, result):
+        """ Return the result without its included resources.
+        """
+        body = result.get('body') if result is not None else None
+        if not isinstance(body, dict) or not isinstance(body.get('included'), list):
+            return result
+        included = body['included']
+        # Resources without an ID can't be referenced.
+        if not all(self.is_identified(resource) for resource in included):
+            return result
+
+        references = []
+        for resource in included:
+            key = (resource['type'], resource['id'])
+            references.append({'type': resource['type'], 'id': resource['id']})
+            if key not in self.included:
+                self.included[key] = resource
+            else:
+                self.included[key] = self.merge_resource(self.included[key], resource)
+        return dict(result, body=dict(body, included=references))
+
+    def is_identified(self, resource):
+        return isinstance(resource, dict) and None not in (
+            resource.get('type'), resource.get('id')
+        )
+
+    def merge_resource(self, first, other):
+        merged = dict(other, **first)
+        for member in ('attributes', 'relationships', 'meta', 'links'):
+            if isinstance(first.get(member), dict) and isinstance(other.get(member), dict):
+                merged[member] = dict(other[member], **first[member])
+        return merged
+
+    def resources(self):
+        """ The included resources of the batch, in the order first seen.
+        """
+        return list(self.included.values())
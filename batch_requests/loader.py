@@ -0,0 +1,128 @@
+'''
+@summary: Batch scoped loader coalescing the lookups by primary key made by sub requests.
+
+Every sub request gets the loader of its batch as ``request.batch_loader``:
+
+    author = request.batch_loader.load(Author, author_id)
+
+Lookups made by concurrently running sub requests within a short window are collected into
+a single ``filter(pk__in=...)`` query per model and database, and the objects are cached
+until a sub request writing finishes.
+'''
+import threading
+import time
+
+from batch_requests.routers import current_database
+
+
+def fetch_by_pk(model, keys):
+    '''
+        Default fetch: one query for all the keys. Returns a dict of key to object.
+    '''
+    return {obj.pk: obj for obj in model._default_manager.filter(pk__in=keys)}
+
+
+class BatchLoader(object):
+    '''
+        Loads objects by primary key on behalf of the sub requests of a batch.
+
+        The first sub request needing objects of a model waits for window seconds, so that
+        the sub requests running concurrently can add the keys they need, then fetches all
+        of them. The others wait for the objects to be fetched. Sub requests pinned to
+        different databases (see batch_requests.routers) are served separately, so that a
+        request reading from the primary never gets objects fetched from a replica.
+    '''
+
+    def __init__(self, window=0.0, fetch=fetch_by_pk):
+        self.window = window
+        self.fetch = fetch
+        self.cache = {}
+        self.pending = {}
+        self.in_flight = set()
+        self.collecting = set()
+        self.condition = threading.Condition()
+
+    def load(self, model, key):
+        '''
+            Returns the object of the given model with the given primary key, None if it
+            doesn't exist.
+        '''
+        return self.load_many(model, [key])[0]
+
+    def load_many(self, model, keys):
+        '''
+            Returns the objects of the given model with the given primary keys, in order.
+            None is returned in place of the objects which don't exist.
+        '''
+        # Objects are fetched, and cached, per database the calling sub request is pinned to.
+        group = (current_database(), model)
+        keys = [model._meta.pk.to_python(key) for key in keys]
+        # Objects fetched by this sub request, whether or not they are still cached.
+        loaded = {}
+
+        while True:
+            with self.condition:
+                missing = [
+                    key for key in keys if key not in loaded and (group, key) not in self.cache
+                ]
+                if not missing:
+                    return [
+                        loaded[key] if key in loaded else self.cache[(group, key)]
+                        for key in keys
+                    ]
+
+                # Keys are (queued) again if not being fetched, e.g. once dropped by clear().
+                self.pending.setdefault(group, set()).update(
+                    key for key in missing if (group, key) not in self.in_flight
+                )
+                if group in self.collecting:
+                    # Another sub request is collecting or fetching the keys of this model.
+                    self.condition.wait()
+                    continue
+                self.collecting.add(group)
+            loaded.update(self._dispatch(group))
+
+    def _dispatch(self, group):
+        '''
+            Fetches the pending keys of the group, caches the objects and returns them by key.
+        '''
+        if self.window:
+            time.sleep(self.window)
+
+        with self.condition:
+            keys = self.pending.pop(group, set())
+            self.in_flight.update((group, key) for key in keys)
+
+        objects = None
+        try:
+            objects = self.fetch(group[1], keys) if keys else {}
+        finally:
+            with self.condition:
+                self.in_flight.difference_update((group, key) for key in keys)
+                if objects is None:
+                    # Let the waiting sub requests try again.
+                    self.pending.setdefault(group, set()).update(keys)
+                else:
+                    for key in keys:
+                        self.cache[(group, key)] = objects.get(key)
+                self.collecting.discard(group)
+                self.condition.notify_all()
+        return {key: objects.get(key) for key in keys}
+
+    def prime(self, obj):
+        '''
+            Adds an object, e.g. one just created or updated by a sub request, to the cache
+            of the database the calling sub request is pinned to.
+        '''
+        with self.condition:
+            self.cache[((current_database(), type(obj)), obj.pk)] = obj
+
+    def clear(self, model=None):
+        '''
+            Drops the cached objects of the given model, or all of them, whatever their
+            database. Called once each sub request which may have written finishes.
+        '''
+        with self.condition:
+            for cache_key in list(self.cache):
+                if model is None or cache_key[0][1] is model:
+                    del self.cache[cache_key]
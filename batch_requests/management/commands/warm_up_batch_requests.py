@@ -0,0 +1,16 @@
+'''
+@summary: Warms batch execution up and reports how long each step took.
+'''
+from django.core.management.base import BaseCommand
+
+from batch_requests.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = 'Starts the batch pool workers, resolves WARMUP_ROUTES and opens the worker connections.'
+
+    def handle(self, *args, **options):
+        report = warm_up()
+        for step, duration in report.items():
+            self.stdout.write('%s: %.1fms' % (step, duration * 1000))
+        self.stdout.write('total: %.1fms' % (sum(report.values()) * 1000))
@@ -0,0 +1,93 @@
+'''
+@summary: The sub requests and sub responses passed along the batch pipeline.
+
+Both are slotted, so that a batch doesn't allocate a dict for each of its sub requests and
+sub responses. A SubResponse behaves as the result dict it replaces, and is serialized as
+one with the encode hook.
+'''
+from collections import namedtuple
+from collections.abc import MutableMapping
+
+
+class SubRequest(namedtuple('SubRequest', ('wsgi_request', 'onward_variables'))):
+    '''
+        A sub request ready to be executed: its WSGI request and the onward data of its
+        definition. Unpacks as the (wsgi_request, onward_variables) tuple it replaces.
+    '''
+    __slots__ = ()
+
+
+class SubResponse(MutableMapping):
+    '''
+        The result of a sub request. Its fields can be read and written as attributes, or
+        as the keys of the result dict it replaces; a field never set is a missing key.
+    '''
+    FIELDS = ('status_code', 'reason_phrase', 'headers', 'body')
+    __slots__ = FIELDS
+
+    def __init__(self, status_code, reason_phrase=None, headers=None, **fields):
+        self.status_code = status_code
+        if reason_phrase is not None:
+            self.reason_phrase = reason_phrase
+        if headers is not None:
+            self.headers = headers
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, result):
+        '''
+            Returns the sub response of the given result dict. Dicts having other keys than
+            the fields of a sub response are returned as they are.
+        '''
+        if isinstance(result, cls) or not result.keys() <= set(cls.FIELDS):
+            return result
+        response = cls.__new__(cls)
+        for key, value in result.items():
+            setattr(response, key, value)
+        return response
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self}
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError('%s is not a field of a sub response.' % key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS and hasattr(self, key)
+
+    def __iter__(self):
+        return (key for key in self.FIELDS if hasattr(self, key))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'SubResponse(%r)' % self.to_dict()
+
+
+def encode(value):
+    '''
+        Default hook of json.dumps serializing the sub responses.
+    '''
+    if isinstance(value, SubResponse):
+        return value.to_dict()
+    raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
@@ -0,0 +1,175 @@
+'''
+@summary: On demand and sampled profiling of batch executions.
+
+A batch is profiled when sampled (PROFILE_SAMPLE_RATE) or asked for with the PROFILE_HEADER
+header by a staff user or with PROFILE_TOKEN. The profile covers the batch request and all
+its sub requests, including the ones executed on the worker threads, and is saved to
+PROFILE_DIR. Batches which are not profiled only pay for the sampling decision.
+'''
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import threading
+import tracemalloc
+import uuid
+from datetime import datetime
+from functools import wraps
+
+from batch_requests.settings import br_settings as _settings
+
+CPROFILE = 'cprofile'
+TRACEMALLOC = 'tracemalloc'
+
+# Number of profiled batches using tracemalloc, which traces the whole process.
+_tracing = 0
+_tracing_lock = threading.Lock()
+
+
+def should_profile(request):
+    '''
+        Tells whether the given batch request should be profiled.
+    '''
+    value = request.META.get(_settings.PROFILE_HEADER)
+    if value:
+        token = _settings.PROFILE_TOKEN
+        # compare_digest only takes ASCII strings, header values may be anything.
+        if token and hmac.compare_digest(value.encode('utf-8'), token.encode('utf-8')):
+            return True
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+
+    rate = _settings.PROFILE_SAMPLE_RATE
+    return bool(rate) and random.random() < rate
+
+
+class BatchProfiler(object):
+    '''
+        Profiles a batch across the threads executing it.
+
+        With cProfile, each thread running a part of the batch gets its own profile, and
+        the profiles are merged when saved. tracemalloc traces every thread of the process,
+        a snapshot is taken when the batch is over.
+    '''
+
+    def __init__(self, mode=CPROFILE):
+        if mode not in (CPROFILE, TRACEMALLOC):
+            raise ValueError('Invalid profiling mode: %s' % mode)
+        self.mode = mode
+        self.profiles = []
+        self.snapshot = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started_tracing = False
+
+    def start(self):
+        global _tracing
+        if self.mode == TRACEMALLOC:
+            with _tracing_lock:
+                if _tracing == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start(_settings.PROFILE_TRACEMALLOC_FRAMES)
+                    self.started_tracing = True
+                _tracing += 1
+
+    def stop(self):
+        global _tracing
+        if self.mode == TRACEMALLOC:
+            with _tracing_lock:
+                self.snapshot = tracemalloc.take_snapshot()
+                _tracing -= 1
+                if _tracing == 0 and self.started_tracing:
+                    tracemalloc.stop()
+
+    def run(self, func, *args, **kwargs):
+        '''
+            Calls func, profiling it unless the current thread is already being profiled.
+        '''
+        if self.mode != CPROFILE or getattr(self.local, 'profile', None) is not None:
+            return func(*args, **kwargs)
+
+        profile = self.local.profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            self.local.profile = None
+            with self.lock:
+                self.profiles.append(profile)
+
+    def save(self, directory):
+        '''
+            Saves the profile to the given directory and returns its path.
+        '''
+        os.makedirs(directory, exist_ok=True)
+        name = 'batch-%s-%s.%s' % (
+            datetime.now().strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8],
+            'prof' if self.mode == CPROFILE else 'snapshot'
+        )
+        path = os.path.join(directory, name)
+        if self.mode == CPROFILE:
+            with self.lock:
+                pstats.Stats(*self.profiles).dump_stats(path)
+        else:
+            self.snapshot.dump(path)
+        return path
+
+
+def rotate(directory, max_files, max_bytes):
+    '''
+        Removes the oldest profiles of the directory until at most max_files of them,
+        weighing at most max_bytes, are left.
+    '''
+    paths = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith('batch-')
+    ]
+    files = sorted(((os.path.getmtime(path), os.path.getsize(path), path) for path in paths))
+    total = sum(size for _, size, _ in files)
+    while files and (len(files) > max_files or total > max_bytes):
+        _, size, path = files.pop(0)
+        os.remove(path)
+        total -= size
+
+
+def profiled(get_response):
+    '''
+        Profiles the sub requests of profiled batches.
+    '''
+    @wraps(get_response)
+    def inner(wsgi_request):
+        request = wsgi_request[0] if isinstance(wsgi_request, tuple) else wsgi_request
+        profiler = getattr(request, 'batch_profiler', None)
+        if profiler is None:
+            return get_response(wsgi_request)
+        return profiler.run(get_response, wsgi_request)
+    return inner
+
+
+def profile_batch(view):
+    '''
+        Profiles the batch requests selected by should_profile. The name of the saved
+        profile is returned in the PROFILE_HEADER_NAME header.
+    '''
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if not should_profile(request):
+            return view(request, *args, **kwargs)
+
+        profiler = request.batch_profiler = BatchProfiler(_settings.PROFILE_MODE)
+        profiler.start()
+        try:
+            response = profiler.run(view, request, *args, **kwargs)
+        finally:
+            profiler.stop()
+
+        # Failing to save the profile doesn't fail the batch.
+        directory = _settings.PROFILE_DIR
+        try:
+            path = profiler.save(directory)
+            rotate(directory, _settings.PROFILE_MAX_FILES, _settings.PROFILE_MAX_BYTES)
+        except OSError:
+            return response
+        response[_settings.PROFILE_HEADER_NAME] = os.path.basename(path)
+        return response
+    return inner
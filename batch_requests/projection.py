@@ -0,0 +1,118 @@
+'''
+@summary: Server side projection of sub response bodies on a selection of fields.
+
+Fields are given either as a list of JSON pointers (``["/id", "/author/name"]``) or as a
+sparse fieldset, a comma separated list of dotted paths (``"id,author.name"``). Lists are
+projected element by element, so ``/tags/name`` selects the name of every tag, and list
+bodies have each of their elements projected.
+'''
+import json
+import re
+from functools import lru_cache
+
+from batch_requests.exceptions import BadBatchRequest
+
+_WHITESPACE = re.compile(r'\s*')
+_decoder = json.JSONDecoder()
+
+
+class Projection(object):
+    '''
+        A compiled selection of fields, kept as a tree of keys. A leaf selects the whole
+        value found at its path.
+    '''
+    __slots__ = ('tree',)
+
+    def __init__(self, paths):
+        self.tree = {}
+        for path in paths:
+            node = self.tree
+            for key in path[:-1]:
+                child = node.setdefault(key, {})
+                if child is None:
+                    break
+                node = child
+            else:
+                node[path[-1]] = None
+
+    def apply(self, body):
+        '''
+            Projects the given body. List bodies have each of their elements projected.
+        '''
+        return _project(body, self.tree)
+
+    def apply_json(self, content):
+        '''
+            Projects the given JSON document. The elements of a top level array are decoded
+            and projected one at a time, so that the full elements are never all held in
+            memory. Returns None if the content isn't a JSON array.
+        '''
+        try:
+            return [self.apply(item) for item in iter_json_array(content)]
+        except ValueError:
+            return None
+
+
+def _project(value, tree):
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _project(value[key], child) for key, child in tree.items() if key in value}
+    return value
+
+
+def iter_json_array(content):
+    '''
+        Yields the elements of the JSON array in the given string one at a time. Raises
+        ValueError if the content isn't a valid JSON array.
+    '''
+    index = _WHITESPACE.match(content, 0).end()
+    if content[index:index + 1] != '[':
+        raise ValueError('Not a JSON array.')
+
+    index = _WHITESPACE.match(content, index + 1).end()
+    if content[index:index + 1] == ']':
+        return
+
+    while True:
+        item, index = _decoder.raw_decode(content, index)
+        yield item
+
+        index = _WHITESPACE.match(content, index).end()
+        separator = content[index:index + 1]
+        index = _WHITESPACE.match(content, index + 1).end()
+        if separator == ']':
+            break
+        if separator != ',':
+            raise ValueError('Invalid JSON array.')
+
+    if index != len(content):
+        raise ValueError('Extra data after JSON array.')
+
+
+def _parse_path(field):
+    if field.startswith('/'):
+        return tuple(key.replace('~1', '/').replace('~0', '~') for key in field[1:].split('/'))
+    return tuple(field.split('.'))
+
+
+@lru_cache(maxsize=256)
+def _compile(fields):
+    return Projection([_parse_path(field) for field in fields])
+
+
+def compile_fields(fields):
+    '''
+        Compiles the fields selector of a sub request. Compiled projections are cached.
+    '''
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',')]
+
+    if not isinstance(fields, (list, tuple)) or not all(
+            isinstance(field, str) and field.strip('/') for field in fields):
+        raise BadBatchRequest(
+            'fields should be a list of JSON pointers or a comma separated list of fields.'
+        )
+    return _compile(tuple(fields))
@@ -0,0 +1,59 @@
+'''
+@summary: Retrying the sequential batches failing on transient database errors.
+
+A sequential batch runs in a single transaction, so a deadlock or a serialization failure
+in any of its requests fails the whole batch. Such errors are expected under contention and
+usually go away when the transaction is simply run again, which is cheaper to do on the
+server than for the client to send the whole batch again.
+'''
+import random
+
+from django.db import DatabaseError
+
+# serialization_failure and deadlock_detected (PostgreSQL).
+TRANSIENT_SQLSTATES = {'40001', '40P01'}
+# ER_LOCK_WAIT_TIMEOUT and ER_LOCK_DEADLOCK (MySQL).
+TRANSIENT_ERRNOS = {1205, 1213}
+# Messages of the errors having no code, e.g. from SQLite.
+TRANSIENT_MESSAGES = ('database is locked', 'deadlock')
+
+
+def iter_causes(exc):
+    '''
+        Yields the exception and the ones it was raised from, e.g. the error of the database
+        driver wrapped by Django.
+    '''
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+
+def is_transient(exc):
+    '''
+        Returns whether the exception is a database error which may not happen again when
+        the transaction is retried.
+    '''
+    if not any(isinstance(error, DatabaseError) for error in iter_causes(exc)):
+        return False
+
+    for error in iter_causes(exc):
+        sqlstate = getattr(error, 'pgcode', None) or getattr(error, 'sqlstate', None)
+        if sqlstate in TRANSIENT_SQLSTATES:
+            return True
+        if error.args and isinstance(error.args[0], int) and error.args[0] in TRANSIENT_ERRNOS:
+            return True
+        message = str(error).lower()
+        if any(transient in message for transient in TRANSIENT_MESSAGES):
+            return True
+    return False
+
+
+def backoff(attempt, base, maximum):
+    '''
+        Returns how long to wait before the given retry (counting from 0), in seconds: a
+        random duration up to an exponentially growing bound, so that the transactions
+        which conflicted don't conflict again.
+    '''
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
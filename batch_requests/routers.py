@@ -0,0 +1,76 @@
+'''
+@summary: Database routing of the queries made by batch sub requests.
+
+Add ``batch_requests.routers.BatchRouter`` first in ``DATABASE_ROUTERS`` to have the reads of
+read-only sub requests go to the aliases in ``READ_REPLICA_ALIASES``.
+'''
+import itertools
+import threading
+from contextlib import contextmanager
+
+from batch_requests.settings import br_settings as _settings
+
+# Methods of the sub requests that may be served by a replica.
+READ_ONLY_METHODS = {'GET', 'HEAD'}
+
+_state = threading.local()
+_replica_counter = itertools.count()
+
+
+def current_database():
+    '''
+        Returns the alias the current thread is pinned to, if any.
+    '''
+    return getattr(_state, 'alias', None)
+
+
+@contextmanager
+def use_database(alias):
+    '''
+        Pins the queries of the current thread to the given alias (None for no pinning).
+    '''
+    previous = current_database()
+    _state.alias = alias
+    try:
+        yield
+    finally:
+        _state.alias = previous
+
+
+def assign_databases(methods, in_transaction=False):
+    '''
+        Returns the alias each sub request of a batch should use, given their methods.
+
+        Read-only requests go to a replica, in turn. Writes, and every request of a batch
+        executed in a transaction, stay on the primary. Once a batch has written, the
+        requests following the write also stay on the primary so that they read it.
+        Returns None for every request if no replica is configured.
+    '''
+    replicas = _settings.READ_REPLICA_ALIASES
+    if not replicas:
+        return [None] * len(methods)
+
+    primary = _settings.PRIMARY_DATABASE_ALIAS
+    written = in_transaction
+    aliases = []
+    for method in methods:
+        if written or method.upper() not in READ_ONLY_METHODS:
+            written = True
+            aliases.append(primary)
+        else:
+            aliases.append(replicas[next(_replica_counter) % len(replicas)])
+    return aliases
+
+
+class BatchRouter(object):
+    '''
+        Routes the reads of a sub request to the alias it is pinned to. Writes are left
+        to the other routers (or the default database), so they never go to a replica.
+    '''
+
+    def db_for_read(self, model, **hints):
+        return current_database()
+
+    def db_for_write(self, model, **hints):
+        alias = current_database()
+        return alias if alias == _settings.PRIMARY_DATABASE_ALIAS else None
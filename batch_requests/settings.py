@@ -5,9 +5,15 @@
 '''
 
 import multiprocessing
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
 from importlib import import_module
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
 
 DEFAULTS = {
     'HEADERS_TO_INCLUDE': ['HTTP_USER_AGENT', 'HTTP_COOKIE'],
@@ -16,9 +22,71 @@ DEFAULTS = {
     'EXECUTE_PARALLEL': False,
     'CONCURRENT_EXECUTOR': 'batch_requests.concurrent.executor.ThreadBasedExecutor',
     'NUM_WORKERS': multiprocessing.cpu_count() * 4,
+    'EXECUTION_CLASSES': {},
+    'ADAPTIVE_INLINE': False,
+    'INLINE_THRESHOLD_MS': 1.0,
+    'INLINE_BATCH_SIZE': 1,
+    'SCHEDULE_LONGEST_FIRST': True,
+    'MAKESPAN_HEADER_NAME': 'batch_requests.makespan',
     'ADD_DURATION_HEADER': True,
     'DURATION_HEADER_NAME': 'batch_requests.duration',
-    'MAX_LIMIT': 20
+    'MAX_LIMIT': 20,
+    'USE_ETAGS': False,
+    'COMPACT_ENVELOPE': False,
+    'RESPONSE_HEADERS_TO_INCLUDE': None,
+    'MERGE_JSONAPI_INCLUDED': False,
+    'READ_REPLICA_ALIASES': [],
+    'PRIMARY_DATABASE_ALIAS': 'default',
+    'DATABASE_HEADER_NAME': 'batch_requests.database',
+    'LOADER_WINDOW_MS': 2.0,
+    'JOB_STORE': 'batch_requests.jobs.FileJobStore',
+    'JOB_STORE_DIR': os.path.join(tempfile.gettempdir(), 'batch_requests_jobs'),
+    'JOB_WORKERS': 2,
+    'JOB_MAX_LIMIT': 1000,
+    'JOB_PAGE_SIZE': 100,
+    'JOB_LEASE_SECONDS': 60,
+    'JOB_POLL_INTERVAL': 0.5,
+    'IDEMPOTENCY_STORE': 'batch_requests.idempotency.LocalIdempotencyStore',
+    'IDEMPOTENCY_TTL': 24 * 60 * 60,
+    'IDEMPOTENCY_MAX_ENTRIES': 1000,
+    'IDEMPOTENCY_CACHE_ALIAS': 'default',
+    'IDEMPOTENCY_WAIT_SECONDS': 30,
+    'IDEMPOTENCY_LOCK_TTL': 10 * 60,
+    'WARMUP_ON_FIRST_REQUEST': False,
+    'WARMUP_ROUTES': [],
+    'WARMUP_DATABASES': None,
+    'WARMUP_TIMEOUT': 10,
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_HEADER': 'HTTP_X_BATCH_PROFILE',
+    'PROFILE_TOKEN': None,
+    'PROFILE_MODE': 'cprofile',
+    'PROFILE_TRACEMALLOC_FRAMES': 1,
+    'PROFILE_DIR': os.path.join(tempfile.gettempdir(), 'batch_requests_profiles'),
+    'PROFILE_MAX_FILES': 50,
+    'PROFILE_MAX_BYTES': 100 * 1024 * 1024,
+    'PROFILE_HEADER_NAME': 'batch_requests.profile',
+    'TRACING_EXPORTERS': [],
+    'TRACING_FILE': os.path.join(tempfile.gettempdir(), 'batch_requests_traces.jsonl'),
+    'PROPAGATE_CONTEXTVARS': True,
+    'STREAM_INGEST': False,
+    'STREAM_CHUNK_SIZE': 64 * 1024,
+    'ADMISSION_CONTROL': False,
+    'ADMISSION_MAX_IN_FLIGHT': None,
+    'ADMISSION_MAX_QUEUE_DEPTH': None,
+    'ADMISSION_ROUTE_WEIGHTS': {},
+    'ADMISSION_USER_RATE': None,
+    'ADMISSION_USER_BURST': None,
+    'ADMISSION_RETRY_AFTER': 1,
+    'SEQUENTIAL_RETRIES': 0,
+    'RETRY_BACKOFF': 0.05,
+    'RETRY_MAX_BACKOFF': 1.0,
+    'RETRY_CLASSIFIER': 'batch_requests.retry.is_transient',
+    'RETRIES_HEADER_NAME': 'batch_requests.retries',
+    'CONTEXT_SNAPSHOTTERS': [
+        'batch_requests.concurrent.context.TranslationSnapshotter',
+        'batch_requests.concurrent.context.TimezoneSnapshotter',
+    ],
+    'PROFILES': {},
 }
 
 
@@ -41,10 +109,71 @@ class BatchRequestSettings(object):
         Allow API settings to be accessed as properties.
     '''
 
-    def __init__(self, user_settings=None, defaults=None):
+    def __init__(self, user_settings=None, defaults=None, name=None):
         self.user_settings = user_settings or {}
         self.defaults = defaults or {}
-        self.executor = self._executor()
+        # The name of the endpoint profile, None for the default settings.
+        self.name = name
+        self._executor_instance = None
+        self._executor_lock = threading.Lock()
+        self._profiles = {}
+        self._profiles_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        '''
+            The executor is created on first use rather than at import time, so that no
+            pool is created before the process forks.
+        '''
+        if self._executor_instance is None:
+            with self._executor_lock:
+                if self._executor_instance is None:
+                    self._executor_instance = self._executor()
+        return self._executor_instance
+
+    @executor.setter
+    def executor(self, executor):
+        self._executor_instance = executor
+
+    def profile(self, name):
+        '''
+            Returns the settings of the given endpoint profile: these settings, overridden
+            by those of the profile in PROFILES. Each profile has its own executor.
+        '''
+        if name is None:
+            return self
+
+        profile = self._profiles.get(name)
+        if profile is None:
+            with self._profiles_lock:
+                profile = self._profiles.get(name)
+                if profile is None:
+                    if name not in self.PROFILES:
+                        raise ImproperlyConfigured('Unknown batch requests profile: %s' % name)
+                    user_settings = dict(self.user_settings, **self.PROFILES[name])
+                    user_settings.pop('PROFILES', None)
+                    profile = BatchRequestSettings(user_settings, self.defaults, name)
+                    self._profiles[name] = profile
+        return profile
+
+    def reload(self, user_settings=None):
+        '''
+            Drops the cached settings, profiles and executors, which are rebuilt from the
+            given user settings on next access.
+        '''
+        self.user_settings = user_settings or {}
+        for attr in self.defaults:
+            self.__dict__.pop(attr, None)
+
+        with self._profiles_lock:
+            profiles, self._profiles = self._profiles, {}
+        for profile in profiles.values():
+            profile.reload()
+
+        with self._executor_lock:
+            executor, self._executor_instance = self._executor_instance, None
+        if executor is not None:
+            executor.shutdown(wait=False)
 
     def _executor(self):
         '''
@@ -58,7 +187,24 @@ class BatchRequestSettings(object):
         else:
             executor_path = self.CONCURRENT_EXECUTOR
             executor_class = import_class(executor_path)
-            return executor_class(self.NUM_WORKERS)
+            snapshotters = [import_class(path)() for path in self.CONTEXT_SNAPSHOTTERS]
+            if self.name is not None:
+                # The sub requests run with the settings of the profile.
+                from batch_requests.concurrent.context import ProfileSnapshotter
+                snapshotters.append(ProfileSnapshotter())
+            executor_options = {
+                'longest_first': self.SCHEDULE_LONGEST_FIRST,
+                'snapshotters': snapshotters,
+                'propagate_contextvars': self.PROPAGATE_CONTEXTVARS,
+            }
+            if self.ADAPTIVE_INLINE:
+                executor_options.update({
+                    'inline_threshold': self.INLINE_THRESHOLD_MS / 1000,
+                    'inline_batch_size': self.INLINE_BATCH_SIZE,
+                })
+            return executor_class(
+                self.NUM_WORKERS, execution_classes=self.EXECUTION_CLASSES, **executor_options
+            )
 
     def __getattr__(self, attr):
         '''
@@ -80,4 +226,53 @@ class BatchRequestSettings(object):
         return val
 
 
-br_settings = BatchRequestSettings(USER_DEFINED_SETTINGS, DEFAULTS)
+# The settings of the profile of the batch endpoint being served by the current thread.
+current = threading.local()
+
+
+class ActiveSettings(object):
+    '''
+        The settings of the endpoint profile in use by the current thread, see use_profile,
+        the default settings otherwise.
+    '''
+
+    def __init__(self, default):
+        object.__setattr__(self, 'default', default)
+
+    def active(self):
+        return getattr(current, 'settings', None) or self.default
+
+    def __getattr__(self, attr):
+        return getattr(self.active(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.active(), attr, value)
+
+
+default_settings = BatchRequestSettings(USER_DEFINED_SETTINGS, DEFAULTS)
+br_settings = ActiveSettings(default_settings)
+
+
+@contextmanager
+def use_profile(name):
+    '''
+        Makes the settings of the given profile (the default settings for None) those in
+        use by the current thread.
+    '''
+    previous = getattr(current, 'settings', None)
+    current.settings = default_settings.profile(name)
+    try:
+        yield current.settings
+    finally:
+        current.settings = previous
+
+
+def reload_settings(setting, value, **kwargs):
+    '''
+        Rebuilds the batch requests settings when overridden, e.g. by override_settings.
+    '''
+    if setting == 'BATCH_REQUESTS':
+        default_settings.reload(value)
+
+
+setting_changed.connect(reload_settings)
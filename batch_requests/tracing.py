@@ -0,0 +1,312 @@
+'''
+@summary: Tracing spans for batches and their sub requests.
+
+Each batch gets a span, with a child span per sub request, itself having a child span for
+each phase of the sub request: build, queue, resolve, view and serialize. The span of a
+sub request is carried over to the worker executing it. Finished spans are handed to the
+exporters listed in TRACING_EXPORTERS; tracing is off when there is none.
+'''
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from batch_requests.settings import br_settings as _settings
+from batch_requests.settings import import_class
+from django.core.exceptions import ImproperlyConfigured
+
+_state = threading.local()
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+
+def new_id(length):
+    return os.urandom(length // 2).hex()
+
+
+class Span(object):
+    '''
+        A timed operation of a trace.
+    '''
+    __slots__ = (
+        'name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start_time', 'start',
+        'duration', 'exporters', 'exporter_data',
+    )
+
+    def __init__(self, name, parent=None, exporters=(), trace_id=None, parent_id=None,
+                 **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else trace_id or new_id(32)
+        self.span_id = new_id(16)
+        self.parent_id = parent.span_id if parent is not None else parent_id
+        self.attributes = attributes
+        self.exporters = parent.exporters if parent is not None else exporters
+        self.exporter_data = {}
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        for exporter in self.exporters:
+            exporter.on_start(self, parent)
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def finish(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.start
+        for exporter in self.exporters:
+            exporter.export(self)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start_time,
+            'duration_ms': self.duration * 1000,
+            'attributes': self.attributes,
+        }
+
+
+class _NullSpan(object):
+    '''
+        Stands for the spans when nothing is traced.
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_attribute(self, name, value):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def current_span():
+    '''
+        Returns the span active on the current thread, None if nothing is traced.
+    '''
+    return getattr(_state, 'span', None)
+
+
+class _ActiveSpan(object):
+
+    def __init__(self, span, finish):
+        self.span = span
+        self.finish = finish
+
+    def __enter__(self):
+        self.previous = current_span()
+        _state.span = self.span
+        return self.span
+
+    def __exit__(self, exc_type, exc, traceback):
+        _state.span = self.previous
+        if exc is not None:
+            self.span.set_attribute('error', repr(exc))
+        if self.finish:
+            self.span.finish()
+        return False
+
+
+def activate(span, finish=False):
+    '''
+        Makes the given span the active one of the current thread, e.g. on a worker.
+    '''
+    return _ActiveSpan(span, finish)
+
+
+def span(name, parent=None, **attributes):
+    '''
+        Returns a context manager timing a child span of the given span (of the active
+        one by default). Nothing is traced if there is no such span.
+    '''
+    parent = parent or current_span()
+    if parent is None:
+        return NULL_SPAN
+    return activate(Span(name, parent, **attributes), finish=True)
+
+
+def annotate(**attributes):
+    '''
+        Adds the given attributes to the active span, if any.
+    '''
+    active = current_span()
+    if active is not None:
+        active.attributes.update(attributes)
+
+
+def start_request(index, request_data):
+    '''
+        Starts the span of the sub request at the given index of the active batch.
+        Returns None if the batch isn't traced.
+    '''
+    parent = current_span()
+    if parent is None:
+        return None
+    return Span(
+        'batch.request', parent, index=index,
+        method=request_data.get('method'), url=request_data.get('url'),
+    )
+
+
+@contextmanager
+def building(request_span):
+    '''
+        Times the build of the sub request. Its span is finished if the build fails.
+    '''
+    if request_span is None:
+        yield
+        return
+
+    with span('build', parent=request_span):
+        try:
+            yield
+        except BaseException:
+            request_span.finish()
+            raise
+
+
+def enqueue(wsgi_request, request_span):
+    '''
+        Hands the span of the sub request over to the thread which will execute it.
+    '''
+    if request_span is not None:
+        wsgi_request.batch_span = request_span
+        wsgi_request.batch_queue_span = Span('queue', request_span)
+
+
+def finish_request(wsgi_request, result):
+    '''
+        Finishes the span of an executed sub request.
+    '''
+    request_span = getattr(wsgi_request, 'batch_span', None)
+    if request_span is not None:
+        wsgi_request.batch_queue_span.finish()
+        request_span.set_attribute('status_code', result.get('status_code'))
+        request_span.finish()
+
+
+def traced(get_response):
+    '''
+        Executes the sub requests of traced batches within their span.
+    '''
+    @wraps(get_response)
+    def inner(wsgi_request):
+        request = wsgi_request[0] if isinstance(wsgi_request, tuple) else wsgi_request
+        request_span = getattr(request, 'batch_span', None)
+        if request_span is None:
+            return get_response(wsgi_request)
+
+        request.batch_queue_span.finish()
+        with activate(request_span):
+            result = get_response(wsgi_request)
+        finish_request(request, result)
+        return result
+    return inner
+
+
+class SpanExporter(object):
+    '''
+        Receives the spans. on_start is called when a span starts, export when it finishes.
+    '''
+
+    def on_start(self, span, parent):
+        pass
+
+    def export(self, span):
+        raise NotImplementedError
+
+
+class JsonLinesExporter(SpanExporter):
+    '''
+        Appends each finished span as a line of JSON to TRACING_FILE.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + '\n'
+        with self.lock:
+            with open(_settings.TRACING_FILE, 'a') as trace_file:
+                trace_file.write(line)
+
+
+class OpenTelemetryExporter(SpanExporter):
+    '''
+        Mirrors the spans as OpenTelemetry spans. Batches are traced within the span of
+        the HTTP request if there is one. Requires the opentelemetry-api package.
+    '''
+
+    def __init__(self):
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImproperlyConfigured(
+                'OpenTelemetryExporter requires the opentelemetry-api package.'
+            )
+        self.trace = trace
+        self.tracer = trace.get_tracer('batch_requests')
+
+    def on_start(self, span, parent):
+        context = None
+        if parent is not None and self in parent.exporter_data:
+            context = self.trace.set_span_in_context(parent.exporter_data[self])
+        span.exporter_data[self] = self.tracer.start_span(
+            span.name, context=context, start_time=int(span.start_time * 1e9)
+        )
+
+    def export(self, span):
+        otel_span = span.exporter_data.pop(self)
+        for name, value in span.attributes.items():
+            if value is not None:
+                otel_span.set_attribute(name, value)
+        otel_span.end(end_time=int((span.start_time + span.duration) * 1e9))
+
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def get_exporters():
+    '''
+        Returns the configured exporters, shared by the whole process.
+    '''
+    paths = tuple(_settings.TRACING_EXPORTERS)
+    with _exporters_lock:
+        if paths not in _exporters:
+            _exporters[paths] = tuple(import_class(path)() for path in paths)
+        return _exporters[paths]
+
+
+def trace_batch(view):
+    '''
+        Traces the batch requests when TRACING_EXPORTERS is set. A W3C traceparent header
+        makes the batch part of the caller's trace.
+    '''
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if not _settings.TRACING_EXPORTERS:
+            return view(request, *args, **kwargs)
+
+        match = _TRACEPARENT.match(request.META.get('HTTP_TRACEPARENT', ''))
+        batch_span = Span(
+            'batch', exporters=get_exporters(),
+            trace_id=match.group(1) if match else None,
+            parent_id=match.group(2) if match else None,
+            path=request.path,
+        )
+        with activate(batch_span, finish=True):
+            response = view(request, *args, **kwargs)
+            batch_span.set_attribute('status_code', response.status_code)
+        return response
+    return inner
@@ -8,6 +8,7 @@ import json
 from batch_requests.settings import br_settings as _settings
 from django.conf import settings
 from django.test.client import FakePayload, RequestFactory
+from django.urls import resolve
 from django.utils.encoding import force_bytes
 
 
@@ -126,4 +127,23 @@ def get_wsgi_request_object(curr_request, method, url, headers, body):
     if hasattr(curr_request, 'user'):
         request.user = curr_request.user
 
+    # Sub requests share the loader of their batch.
+    if hasattr(curr_request, 'batch_loader'):
+        request.batch_loader = curr_request.batch_loader
+
+    # Sub requests of a profiled batch are profiled along with it.
+    if hasattr(curr_request, 'batch_profiler'):
+        request.batch_profiler = curr_request.batch_profiler
+
     return request
+
+
+def resolve_request(wsgi_request):
+    '''
+        Resolves the path of the given request. The match is kept on the request, like
+        Django does, so that the path is only resolved once. Raises Http404 if no
+        route matches.
+    '''
+    if wsgi_request.resolver_match is None:
+        wsgi_request.resolver_match = resolve(wsgi_request.path_info)
+    return wsgi_request.resolver_match
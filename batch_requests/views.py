@@ -4,21 +4,49 @@
 @summary: A module to perform batch request processing.
 '''
 
+import copy
 import json
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
+from functools import wraps
 
-from django.db import transaction
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
 from django.http import Http404
 from django.http.response import (HttpResponse, HttpResponseBadRequest,
-                                  HttpResponseServerError)
-from django.urls import resolve
+                                  HttpResponseNotModified,
+                                  HttpResponseServerError, JsonResponse,
+                                  StreamingHttpResponse)
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
+from batch_requests import tracing
+from batch_requests.admission import admission_control
+from batch_requests.bulk import bulk_handlers
+from batch_requests.concurrent.executor import BatchResults
+from batch_requests.conditional import (batch_etag, conditional_result,
+                                        is_conditional_batch, is_not_modified)
+from batch_requests.envelope import build_envelope
 from batch_requests.exceptions import BadBatchRequest
+from batch_requests.expansion import parse_batch
+from batch_requests.extraction import compile_extractor
+from batch_requests.idempotency import idempotent
+from batch_requests.ingest import iter_batch_requests
+from batch_requests.jobs import (DONE, FAILED, PENDING, RUNNING, JobRequest,
+                                 get_job_store, job_meta, submit_job)
 from batch_requests.jsonapi import JsonApiRewriter
+from batch_requests.loader import BatchLoader
+from batch_requests.messages import SubRequest, SubResponse, encode
+from batch_requests.profiling import profile_batch, profiled
+from batch_requests.projection import compile_fields
+from batch_requests.retry import backoff
+from batch_requests.routers import (READ_ONLY_METHODS, assign_databases,
+                                    use_database)
 from batch_requests.settings import br_settings as _settings
-from batch_requests.utils import get_wsgi_request_object
+from batch_requests.settings import import_class, use_profile
+from batch_requests.utils import get_wsgi_request_object, resolve_request
 
 
 def withDebugHeaders(view_handler):
@@ -28,9 +56,9 @@ def withDebugHeaders(view_handler):
     '''
     def inner(wsgi_request):
 
-        # We now always get a tuple for the WSGI request object, the
-        # first element is the request, the second is the onward
-        # variables.
+        # We now always get a SubRequest (a tuple) for the WSGI request
+        # object, the first element is the request, the second is the
+        # onward variables.
         # TODO: I think we can conver the onward variables implementation
         #  to a different rewriter.
         if isinstance(wsgi_request, tuple):
@@ -38,22 +66,45 @@ def withDebugHeaders(view_handler):
 
         service_start_time = datetime.now()
         result = view_handler(wsgi_request)
+        return add_debug_headers(result, wsgi_request, service_start_time)
+    return inner
 
-        # Check if we need to send across the duration header.
-        if not _settings.ADD_DURATION_HEADER:
-            return result
-
-        time_taken = (datetime.now() - service_start_time).microseconds / 1000
 
-        result.setdefault('headers', {})
-        result['headers'].update({
-            'request_url': wsgi_request.path_info,
-            _settings.DURATION_HEADER_NAME: time_taken,
-        })
+def add_debug_headers(result, wsgi_request, service_start_time):
+    '''
+        Adds the request url and the time taken since service_start_time to the result headers.
+    '''
+    # Check if we need to send across the duration header.
+    if not _settings.ADD_DURATION_HEADER:
         return result
-    return inner
+
+    time_taken = (datetime.now() - service_start_time).microseconds / 1000
+
+    result.setdefault('headers', {})
+    result['headers'].update({
+        'request_url': wsgi_request.path_info,
+        _settings.DURATION_HEADER_NAME: time_taken,
+    })
+
+    database = getattr(wsgi_request, 'batch_database', None)
+    if database is not None:
+        result['headers'][_settings.DATABASE_HEADER_NAME] = database
+    return result
 
 
+def forget_loaded_objects(wsgi_requests):
+    '''
+        Drops the objects cached by the batch loader once sub requests which may have
+        written finish, so that the following ones don't read stale objects.
+    '''
+    for wsgi_request in wsgi_requests:
+        loader = getattr(wsgi_request, 'batch_loader', None)
+        if loader is not None and wsgi_request.method.upper() not in READ_ONLY_METHODS:
+            loader.clear()
+
+
+@tracing.traced
+@profiled
 @withDebugHeaders
 def get_response(wsgi_request):
     '''
@@ -62,53 +113,118 @@ def get_response(wsgi_request):
     '''
     # Get the view / handler for this request
     try:
-        view, args, kwargs = resolve(wsgi_request.path_info)
+        with tracing.span('resolve'):
+            view, args, kwargs = resolve_request(wsgi_request)
     except Http404 as error:
-        return {'status_code': 404, 'reason_phrase': 'Page not found'}
+        return SubResponse(404, 'Page not found')
+    tracing.annotate(route=wsgi_request.resolver_match.view_name)
 
     # Let the view do its task.
-    kwargs.update({'request': wsgi_request})
+    kwargs = dict(kwargs, request=wsgi_request)
     try:
-        response = view(*args, **kwargs)
+        with tracing.span('view'), use_database(getattr(wsgi_request, 'batch_database', None)):
+            response = view(*args, **kwargs)
     except Exception as exc:
-        return {'status_code': 500, 'reason_phrase': str(exc)}
+        # Kept to tell whether a failed sequential batch is worth retrying.
+        wsgi_request.batch_exception = exc
+        return SubResponse(500, str(exc))
+    finally:
+        forget_loaded_objects([wsgi_request])
+
+    with tracing.span('serialize'):
+        result = response_to_dict(response, getattr(wsgi_request, 'batch_projection', None))
+        if _settings.USE_ETAGS:
+            result = conditional_result(wsgi_request, result)
+    return result
 
+
+def response_to_dict(response, projection=None):
+    '''
+        Converts the given HTTP response into a SubResponse with the status code,
+        reason phrase, headers and the (JSON decoded, when possible) body. The body of a
+        successful response is projected on the selected fields if a projection is given,
+        error bodies are returned whole.
+    '''
     # Make sure that the response has been rendered
     if hasattr(response, 'render') and callable(response.render):
         response = response.render()
 
-    # Convert HTTP response into simple dict type.
-    result = {
-        'status_code': response.status_code,
-        'reason_phrase': response.reason_phrase,
-        'headers': dict(response._headers.values()),
-    }
+    # Convert HTTP response into a sub response.
+    result = SubResponse(response.status_code, response.reason_phrase, dict(response.items()))
+    if not 200 <= response.status_code < 300:
+        projection = None
 
     content = response.content
     if isinstance(content, bytes):
         content = content.decode('utf-8')
 
-    try:
-        content = json.loads(content)
-    except json.JSONDecodeError:
-        pass
-
-    result['body'] = content
+    # List bodies are projected while being decoded, one element at a time.
+    body = projection.apply_json(content) if projection is not None else None
+    if body is None:
+        try:
+            body = json.loads(content)
+        except json.JSONDecodeError:
+            body = content
+        else:
+            if projection is not None:
+                body = projection.apply(body)
+
+    result.body = body
     return result
 
 
-def construct_wsgi_from_data(request, data, replace_params={}, rewriter=None):
+def get_bulk_responses(wsgi_requests):
     '''
-    Given the data in the format of url, method, body and headers, construct a new
-    WSGIRequest object.
+        Collapses the requests having a registered bulk handler into a single handler
+        call per route. Returns a dict of request index to the response for that request.
+    '''
+    results = {}
+    for view_name, entries in bulk_handlers.group(wsgi_requests).items():
+        handler = bulk_handlers.handlers[view_name]
+        service_start_time = datetime.now()
+        requests = [wsgi_request for _, wsgi_request, _ in entries]
+
+        # A single call serves all the requests, it can only use a replica if all of them can.
+        databases = {getattr(wsgi_request, 'batch_database', None) for wsgi_request in requests}
+        database = databases.pop() if len(databases) == 1 else _settings.PRIMARY_DATABASE_ALIAS
+        try:
+            with use_database(database):
+                responses = handler(requests, [kwargs for _, _, kwargs in entries])
+            if len(responses) != len(entries):
+                raise ValueError(
+                    'Bulk handler for %s returned %d responses for %d requests.' % (
+                        view_name, len(responses), len(entries)
+                    )
+                )
+        except Exception as exc:
+            responses = [SubResponse(500, str(exc)) for _ in entries]
+        finally:
+            forget_loaded_objects(requests)
+
+        for (index, wsgi_request, _), response in zip(entries, responses):
+            projection = getattr(wsgi_request, 'batch_projection', None)
+            if isinstance(response, dict):
+                response = SubResponse.from_dict(response)
+            if not isinstance(response, (dict, SubResponse)):
+                response = response_to_dict(response, projection)
+            elif projection is not None and 'body' in response:
+                if 200 <= response['status_code'] < 300:
+                    response['body'] = projection.apply(response['body'])
+            if _settings.USE_ETAGS:
+                response = conditional_result(wsgi_request, response)
+            results[index] = add_debug_headers(response, wsgi_request, service_start_time)
+            tracing.finish_request(wsgi_request, results[index])
+    return results
+
+
+def validate_request_data(data):
+    '''
+        Validates the request definition and returns its url and method.
     '''
     valid_http_methods = [
         'get', 'post', 'put', 'patch', 'delete', 'head', 'options', 'connect', 'trace'
     ]
 
-    if rewriter:
-        rewriter.rewrite_request(data)
-
     url = data.get('url', None)
     method = data.get('method', None)
 
@@ -118,25 +234,51 @@ def construct_wsgi_from_data(request, data, replace_params={}, rewriter=None):
     if method.lower() not in valid_http_methods:
         raise BadBatchRequest('Invalid request method.')
 
+    if data.get('fields') is not None:
+        compile_fields(data['fields'])
+    return url, method
+
+
+def construct_wsgi_from_data(request, data, replace_params={}, rewriter=None):
+    '''
+    Given the data in the format of url, method, body and headers, construct a new
+    WSGIRequest object.
+    '''
+    if rewriter:
+        rewriter.rewrite_request(data)
+
+    url, method = validate_request_data(data)
+
     body = None
     if method.lower() not in ['get', 'options']:
         body = data.get('body', '')
         for name, value in replace_params.items():
+            # The placeholder (with its quotes) is replaced by the JSON value, strings included.
             placeholder = '"{{' + name + '}}"'
-            body = json.loads(json.dumps(body).replace(placeholder, value))
+            body = json.loads(json.dumps(body).replace(placeholder, json.dumps(value)))
 
     headers = data.get('headers', {})
     onward_variables = data.get('onward_data', {})
     wsgi_request = get_wsgi_request_object(request, method, url, headers, body)
-    return (wsgi_request, onward_variables)
+
+    # Only the selected fields of the response body are returned.
+    if data.get('fields') is not None:
+        wsgi_request.batch_projection = compile_fields(data['fields'])
+    return SubRequest(wsgi_request, onward_variables)
 
 
-def get_requests_data(request):
+def get_requests_data(request, max_limit=None):
     '''
         For the given batch request, extract the individual requests and create
         WSGIRequest object for each.
     '''
-    requests = json.loads(request.body).get('batch', [])
+    max_limit = max_limit or _settings.MAX_LIMIT
+
+    # The requests may have been parsed already, e.g. by the admission control. Templates
+    # are expanded while parsing, up to the limit.
+    requests = getattr(request, 'batch_requests_data', None)
+    if requests is None:
+        requests = parse_batch(request.body, max_limit)
 
     if type(requests) not in (list, tuple):
         raise BadBatchRequest('The body of batch request should always be list!')
@@ -144,8 +286,9 @@ def get_requests_data(request):
     # Max limit check.
     no_requests = len(requests)
 
-    if no_requests > _settings.MAX_LIMIT:
-        raise BadBatchRequest('You can batch maximum of %d requests.' % (_settings.MAX_LIMIT))
+    if no_requests > max_limit:
+        raise BadBatchRequest('You can batch maximum of %d requests.' % (max_limit))
+    request.batch_requests_data = requests
     return requests
 
 
@@ -165,68 +308,304 @@ def is_error(code):
     return 400 <= code <= 599
 
 
-def execute_requests(request, sequential_override=False):
+def dependency_failed_response():
     '''
-        Execute the requests either sequentially or in parallel based on parallel
-        execution setting.
+        Response for a request which was not executed as a request it depends on failed.
     '''
-    if sequential_override:
+    return SubResponse(
+        424,
+        "This request was cancelled as it depended on a previous request which did not succeed.",
+    )
 
-        # We have to choose a rewriter before we begin processing requests as
-        # each request can add new mappings to the rewriter. By default we'll
-        # use a JSON-API rewriter, but in the future we may want to make this
-        # more dynamic.
-        rewriter = JsonApiRewriter()
 
-        with transaction.atomic():
-            next_variables = {}
-            results = []
-            # Get the data to make the requests
-            requests = get_requests_data(request)
-            for i, request_data in enumerate(requests):
-                # Generate the requests using additional data if passed
-                wsgi_request, onward_params = construct_wsgi_from_data(
+def execute_wsgi_requests(wsgi_requests):
+    '''
+        Executes the given WSGI requests using the configured executor and returns the
+        responses in order.
+    '''
+    # Requests having a bulk handler are answered with a single handler call per
+    # route, the rest go through the executor as usual.
+    bulk_results = get_bulk_responses(wsgi_requests)
+    if not bulk_results:
+        return _settings.executor.execute(wsgi_requests, get_response)
+
+    remaining = [
+        wsgi_request for index, wsgi_request in enumerate(wsgi_requests)
+        if index not in bulk_results
+    ]
+    executed = _settings.executor.execute(remaining, get_response)
+    results = iter(executed)
+    merged = BatchResults(
+        bulk_results[index] if index in bulk_results else next(results)
+        for index in range(len(wsgi_requests))
+    )
+    merged.predicted_makespan = getattr(executed, 'predicted_makespan', None)
+    merged.makespan = getattr(executed, 'makespan', None)
+    return merged
+
+
+def execute_parallel_requests(request, requests):
+    '''
+        Executes the requests using the configured executor.
+
+        A request referencing a JSON-API ID created by an earlier request of the batch is
+        held back until that request has finished, and then rewritten with the DB level ID.
+        Requests are executed in waves, each one containing every request whose
+        dependencies have finished. When the executor runs the requests one after the
+        other, a wave ends at the first request held back, so that they still run in order.
+    '''
+    in_order = not _settings.executor.concurrent
+    rewriter = JsonApiRewriter()
+    dependencies = rewriter.dependencies(requests)
+    databases = assign_databases([request_data['method'] for request_data in requests])
+
+    results = BatchResults([None] * len(requests))
+    results.predicted_makespan = results.makespan = 0.0
+    pending = list(range(len(requests)))
+    while pending:
+        wave = []
+        for i in pending:
+            if all(results[dep] is not None for dep in dependencies[i]):
+                wave.append(i)
+            elif in_order:
+                break
+        scheduled = set(wave)
+        pending = [i for i in pending if i not in scheduled]
+
+        ready = []
+        for i in wave:
+            if any(is_error(results[dep]['status_code']) for dep in dependencies[i]):
+                results[i] = dependency_failed_response()
+            else:
+                ready.append(i)
+
+        wsgi_requests = []
+        for i in ready:
+            request_span = tracing.start_request(i, requests[i])
+            with tracing.building(request_span):
+                sub_request = construct_wsgi_from_data(request, requests[i], rewriter=rewriter)
+            sub_request.wsgi_request.batch_database = databases[i]
+            tracing.enqueue(sub_request.wsgi_request, request_span)
+            wsgi_requests.append(sub_request)
+        wave_results = execute_wsgi_requests(wsgi_requests)
+        for i, result in zip(ready, wave_results):
+            results[i] = result
+            rewriter.update_mapping(requests[i], result)
+
+        # The waves run one after the other, so do their makespans add up.
+        for attr in ('predicted_makespan', 'makespan'):
+            wave_makespan = getattr(wave_results, attr, None)
+            if wave_makespan is None or getattr(results, attr) is None:
+                setattr(results, attr, None)
+            else:
+                setattr(results, attr, getattr(results, attr) + wave_makespan)
+    return results
+
+
+def execute_streamed_requests(request):
+    '''
+        Executes the requests while the body of the batch request is being read: each
+        request is handed over to the executor as soon as it has been read and validated.
+
+        A request referencing a JSON-API ID created by an earlier request waits for that
+        request to finish before being submitted. If the batch turns out to be invalid,
+        e.g. once more than MAX_LIMIT requests were read, the rest of it is not read: the
+        results of the requests already submitted are returned, followed by a 400 entry
+        for the invalid request. BadBatchRequest is only raised if none was submitted.
+    '''
+    executor = _settings.executor
+    context = executor.capture_context()
+    start = time.perf_counter()
+
+    rewriter = JsonApiRewriter()
+    creators = {}
+    creating = {}
+    futures = []
+    written = False
+    read = []
+    try:
+        # The body is read as a stream rather than through request.body, which enforces
+        # DATA_UPLOAD_MAX_MEMORY_SIZE: it's enforced upfront when the length is known, and
+        # while reading otherwise.
+        max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if max_size is not None and content_length > max_size:
+            raise BadBatchRequest('The body of batch request is larger than %d bytes.' % max_size)
+        stream = iter_batch_requests(
+            request, _settings.MAX_LIMIT, _settings.STREAM_CHUNK_SIZE, max_size
+        )
+        for index, request_data in enumerate(stream):
+            url, method = validate_request_data(request_data)
+            read.append(request_data)
+
+            dependencies = {
+                creators[ref] for ref in rewriter.references(request_data) if ref in creators
+            }
+            for ref in rewriter.creates(request_data):
+                creators.setdefault(ref, index)
+                creating[index] = request_data
+
+            failed = False
+            for dep in sorted(dependencies):
+                result = futures[dep].result()
+                rewriter.update_mapping(creating[dep], result)
+                failed = failed or is_error(result['status_code'])
+            if failed:
+                future = Future()
+                future.set_result(dependency_failed_response())
+                futures.append(future)
+                continue
+
+            request_span = tracing.start_request(index, request_data)
+            with tracing.building(request_span):
+                sub_request = construct_wsgi_from_data(request, request_data, rewriter=rewriter)
+            wsgi_request = sub_request.wsgi_request
+            # Once the batch has written, the following requests stay on the primary.
+            wsgi_request.batch_database, = assign_databases([method], in_transaction=written)
+            written = written or method.upper() not in READ_ONLY_METHODS
+            tracing.enqueue(wsgi_request, request_span)
+
+            futures.append(executor.submit(sub_request, get_response, context))
+    except BadBatchRequest as brx:
+        if not futures:
+            raise
+        # The requests submitted may have written already, so their results are returned.
+        future = Future()
+        future.set_result(SubResponse(400, str(brx)))
+        futures.append(future)
+
+    request.batch_requests_data = read
+    results = BatchResults(future.result() for future in futures)
+    results.makespan = time.perf_counter() - start
+    return results
+
+
+def run_sequential_requests(request, requests):
+    '''
+        Executes the requests one after another, in a transaction. Raises BadBatchRequest
+        as soon as one of them fails.
+    '''
+    # We have to choose a rewriter before we begin processing requests as
+    # each request can add new mappings to the rewriter. By default we'll
+    # use a JSON-API rewriter, but in the future we may want to make this
+    # more dynamic.
+    rewriter = JsonApiRewriter()
+
+    with transaction.atomic():
+        next_variables = {}
+        results = []
+
+        # Compile the onward data expressions of all the requests upfront.
+        extractors = [
+            compile_extractor(request_data.get('onward_data', {}))
+            for request_data in requests
+        ]
+        databases = assign_databases(
+            [request_data.get('method') or '' for request_data in requests],
+            in_transaction=True
+        )
+        for i, request_data in enumerate(requests):
+            # Generate the requests using additional data if passed
+            request_span = tracing.start_request(i, request_data)
+            with tracing.building(request_span):
+                wsgi_request, _ = construct_wsgi_from_data(
                     request,
                     request_data,
                     replace_params=next_variables,
                     rewriter=rewriter
                 )
-                result = get_response(wsgi_request)
-                results.append(result)
-                if is_error(result['status_code']):
-                    raise BadBatchRequest(
-                        f'Sequential requests failed for request at index {i}',
-                        results, requests
-                    )
+            wsgi_request.batch_database = databases[i]
+            tracing.enqueue(wsgi_request, request_span)
+            result = get_response(wsgi_request)
+            results.append(result)
+            if is_error(result['status_code']):
+                raise BadBatchRequest(
+                    f'Sequential requests failed for request at index {i}',
+                    results, requests, getattr(wsgi_request, 'batch_exception', None)
+                )
+
+            # Add the response to the rewriter.
+            if i < len(requests):
+                rewriter.update_mapping(request_data, result)
+
+                # Take the value of any onward passing variables from the response. Values
+                # not found are left out, a null one (e.g. a "| null" default) is passed on.
+                next_variables.update(extractors[i].extract(result.get('body')))
+    return results
+
+
+def execute_sequential_requests(request, requests):
+    '''
+        Executes the requests sequentially. When the batch fails on a transient error, e.g. a
+        deadlock, the transaction is rolled back and the batch run again from the requests
+        already validated, up to SEQUENTIAL_RETRIES times. The number of retries is kept
+        on the batch request.
+
+        A batch running within an outer transaction, e.g. with ATOMIC_REQUESTS, is never
+        retried: only its savepoint would be rolled back, and the outer transaction is
+        the one which failed.
+    '''
+    is_transient = import_class(_settings.RETRY_CLASSIFIER)
+    retries = _settings.SEQUENTIAL_RETRIES
+    if transaction.get_connection().in_atomic_block:
+        retries = 0
+    attempt = 0
+    while True:
+        request.batch_retries = attempt
+        # Nothing read by a rolled back attempt is kept.
+        request.batch_loader = BatchLoader(window=0.0)
+        try:
+            # The requests are rewritten while executed, each attempt starts from a copy.
+            return run_sequential_requests(request, copy.deepcopy(requests))
+        except (BadBatchRequest, DatabaseError) as exc:
+            error = exc.exception if isinstance(exc, BadBatchRequest) else exc
+            if attempt >= retries or error is None or \
+                    not is_transient(error):
+                raise
+        time.sleep(backoff(attempt, _settings.RETRY_BACKOFF, _settings.RETRY_MAX_BACKOFF))
+        attempt += 1
 
-                # Add the response to the rewriter.
-                if i < len(requests):
-                    rewriter.update_mapping(request_data, result)
-
-                    # Take the value of any onward passing variables from the response
-                    for name, accessor_string in onward_params.items():
-                        value = None
-                        # Allow retrieval of nested values using dot notaion
-                        accessors = accessor_string.split('.')
-                        if len(accessors):
-                            value = result['body']
-                        for accessor in accessors:
-                            value = value[accessor]
-                        if value:
-                            next_variables[name] = value
-        return results
+
+def execute_requests(request, sequential_override=False):
+    '''
+        Execute the requests either sequentially or in parallel based on parallel
+        execution setting.
+    '''
+    # Lookups are only worth holding back to be coalesced when sub requests run concurrently.
+    window = 0.0
+    if _settings.EXECUTE_PARALLEL and not sequential_override:
+        window = _settings.LOADER_WINDOW_MS / 1000
+    request.batch_loader = BatchLoader(window=window)
+
+    if sequential_override:
+        # Get the data to make the requests
+        return execute_sequential_requests(request, get_requests_data(request))
+    elif _settings.STREAM_INGEST:
+        try:
+            return execute_streamed_requests(request)
+        except BadBatchRequest as brx:
+            return HttpResponseBadRequest(content=str(brx))
     else:
         try:
-            # Get the Individual WSGI requests.
-            wsgi_requests = get_wsgi_requests(request)
+            # Validate all the requests before executing any of them.
+            requests = get_requests_data(request)
+            for request_data in requests:
+                validate_request_data(request_data)
         except BadBatchRequest as brx:
             return HttpResponseBadRequest(content=str(brx))
 
-        return _settings.executor.execute(wsgi_requests, get_response)
+        return execute_parallel_requests(request, requests)
 
 
 @csrf_exempt
 @require_http_methods(['POST'])
+@idempotent
+@admission_control
+@tracing.trace_batch
+@profile_batch
 def handle_batch_requests(request, *args, **kwargs):
     '''
         A view function to handle the overall processing of batch requests.
@@ -237,26 +616,227 @@ def handle_batch_requests(request, *args, **kwargs):
     sequential_override = kwargs.pop('run_sequential', False)
     try:
         response = execute_requests(request, sequential_override)
+        if isinstance(response, HttpResponse):
+            return response
     except BadBatchRequest as brx:
+        if brx.requests is None:
+            return HttpResponseBadRequest(content=str(brx))
+
         # Get results and requests from batch error and populate
         results = brx.results or []
         while len(results) < len(brx.requests):
-            results.append({
-                'status_code': 424,
-                'reason_phrase': "This request was cancelled as it depended on a previous request which did not succeed.",
-            })
+            results.append(dependency_failed_response())
         response = results
 
+    # A client polling the same (read only) batch gets a single 304 if nothing changed.
+    etag = None
+    if _settings.USE_ETAGS and is_conditional_batch(getattr(request, 'batch_requests_data', None)):
+        etag = batch_etag(response)
+        if is_not_modified(request.META, etag):
+            resp = HttpResponseNotModified()
+            resp['ETag'] = etag
+            return resp
+
     # Everything's done, return the response.
-    resp = HttpResponse(content=json.dumps(response), content_type='application/json')
+    with tracing.span('serialize'):
+        content = json.dumps(build_envelope(response), default=encode)
+    resp = HttpResponse(content=content, content_type='application/json')
+    if etag is not None:
+        resp['ETag'] = etag
+
+    retries = getattr(request, 'batch_retries', None)
+    if retries is not None and _settings.SEQUENTIAL_RETRIES:
+        resp[_settings.RETRIES_HEADER_NAME] = str(retries)
 
     if _settings.ADD_DURATION_HEADER:
         resp.__setitem__(
             _settings.DURATION_HEADER_NAME,
             str((datetime.now() - batch_start_time).microseconds / 1000)
         )
+
+        # Expose how long the executor was expected to take, and actually took.
+        if getattr(response, 'makespan', None) is not None:
+            resp[_settings.MAKESPAN_HEADER_NAME] = str(response.makespan * 1000)
+        if getattr(response, 'predicted_makespan', None) is not None:
+            resp[_settings.MAKESPAN_HEADER_NAME + '.predicted'] = str(
+                response.predicted_makespan * 1000
+            )
     return resp
 
 
 def handle_sequential_batch_requests(request, *args, **kwargs):
     return handle_batch_requests(request, *args, run_sequential=True, **kwargs)
+
+
+def batch_endpoint(profile=None, sequential=False):
+    '''
+        Returns a view handling batch requests with the settings of the given profile (see
+        PROFILES), e.g. its own executor and limits. The default settings are used for
+        None.
+    '''
+    view = handle_sequential_batch_requests if sequential else handle_batch_requests
+
+    @csrf_exempt
+    @wraps(view)
+    def endpoint(request, *args, **kwargs):
+        with use_profile(profile):
+            return view(request, *args, **kwargs)
+    return endpoint
+
+
+def run_batch_job(job_id):
+    '''
+        Executes the sub requests of a job one after the other, storing each result as
+        it finishes. The requests which already have a result, e.g. when the job is
+        resumed, are skipped.
+    '''
+    store = get_job_store()
+    if not store.claim(job_id):
+        return
+
+    try:
+        job = store.get(job_id)
+        # The job may have been resubmitted after it finished.
+        if job is None or job['status'] in (DONE, FAILED):
+            return
+        done = {result['index'] for result in store.get_results(job_id)}
+        store.set_status(job_id, RUNNING)
+
+        request = JobRequest(job['meta'], job['user_id'])
+        for index, request_data in enumerate(job['requests']):
+            if index in done:
+                continue
+            try:
+                wsgi_request, _ = construct_wsgi_from_data(request, request_data)
+                result = get_response(wsgi_request)
+            except BadBatchRequest as brx:
+                result = SubResponse(400, str(brx))
+            store.add_result(job_id, dict(result, index=index))
+        store.set_status(job_id, DONE)
+    except Exception:
+        # A job failing for any other reason would otherwise be left running forever.
+        store.set_status(job_id, FAILED)
+        raise
+    finally:
+        store.release(job_id)
+        close_old_connections()
+
+
+_jobs_resumed_at = None
+_jobs_resumed_lock = threading.Lock()
+
+
+def resume_batch_jobs():
+    '''
+        Resubmits the unfinished jobs, e.g. the ones of a worker which was restarted.
+        The jobs still running in another worker are left to it.
+    '''
+    global _jobs_resumed_at
+    with _jobs_resumed_lock:
+        _jobs_resumed_at = time.monotonic()
+    store = get_job_store()
+    return [
+        submit_job(run_batch_job, job_id) for job_id in store.unfinished()
+        if not store.leased(job_id)
+    ]
+
+
+def resume_expired_jobs():
+    '''
+        Resumes the unfinished jobs at most once per JOB_LEASE_SECONDS, so that the jobs of
+        a worker which went away are picked up once their lease expired.
+    '''
+    resumed_at = _jobs_resumed_at
+    if resumed_at is None or time.monotonic() - resumed_at >= _settings.JOB_LEASE_SECONDS:
+        resume_batch_jobs()
+
+
+def get_user_id(request):
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+@idempotent
+def handle_batch_job_requests(request, *args, **kwargs):
+    '''
+        A view function accepting a batch too large to be executed synchronously. The
+        batch is executed in the background and a 202 with the id of the job is returned.
+    '''
+    # Submitting and polling jobs picks up the jobs left unfinished.
+    resume_expired_jobs()
+
+    try:
+        requests = get_requests_data(request, max_limit=_settings.JOB_MAX_LIMIT)
+        for request_data in requests:
+            validate_request_data(request_data)
+    except BadBatchRequest as brx:
+        return HttpResponseBadRequest(content=str(brx))
+
+    store = get_job_store()
+    job_id = store.create(requests, job_meta(request), get_user_id(request))
+    submit_job(run_batch_job, job_id)
+    return JsonResponse({'id': job_id, 'status': PENDING, 'total': len(requests)}, status=202)
+
+
+def stream_job_results(store, job_id):
+    '''
+        Yields the results of the job as JSON lines, as they finish. Ends once the job is
+        done or failed, or when no worker made progress on it for JOB_LEASE_SECONDS (the
+        job is resumed by the next request for it).
+    '''
+    offset = 0
+    progressed = time.monotonic()
+    while True:
+        # The job is read before its results, so that no result is missed once it's done.
+        job = store.get(job_id)
+        results = store.get_results(job_id, offset)
+        for result in results:
+            yield json.dumps(result) + '\n'
+        offset += len(results)
+
+        if job is None or job['status'] == FAILED:
+            return
+        if job['status'] == DONE and offset >= job['completed']:
+            return
+        if results or store.leased(job_id):
+            progressed = time.monotonic()
+        elif time.monotonic() - progressed >= _settings.JOB_LEASE_SECONDS:
+            return
+        time.sleep(_settings.JOB_POLL_INTERVAL)
+
+
+@require_http_methods(['GET'])
+def handle_batch_job(request, job_id, *args, **kwargs):
+    '''
+        A view function returning the progress of a job and a page of its results, in
+        completion order, from the offset query parameter. With stream=1, the results
+        are streamed as JSON lines as they finish.
+    '''
+    resume_expired_jobs()
+    store = get_job_store()
+    job = store.get(job_id) if job_id.isalnum() else None
+    if job is None or job['user_id'] != get_user_id(request):
+        return JsonResponse({'error': 'Job not found.'}, status=404)
+
+    if request.GET.get('stream'):
+        return StreamingHttpResponse(
+            stream_job_results(store, job_id), content_type='application/x-ndjson'
+        )
+
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = max(int(request.GET.get('limit', _settings.JOB_PAGE_SIZE)), 1)
+    except ValueError:
+        return HttpResponseBadRequest(content='offset and limit should be integers.')
+
+    results = store.get_results(job_id, offset, min(limit, _settings.JOB_PAGE_SIZE))
+    return JsonResponse({
+        'id': job_id,
+        'status': job['status'],
+        'total': job['total'],
+        'completed': job['completed'],
+        'results': results,
+        'next_offset': offset + len(results),
+    })
@@ -0,0 +1,97 @@
+'''
+@summary: Warms batch execution up ahead of the first batches.
+
+The first batches after a start are slow: pool workers are started, URL resolvers built and
+view modules imported, and database connections opened on demand. ``warm_up`` does all of
+this upfront and reports how long each step took.
+'''
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from importlib import import_module
+
+from batch_requests.settings import br_settings as _settings
+from django.db import connections
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+# Report of the last warm-up of this process, None until it has run.
+last_report = None
+
+# Process in which warm_up_once ran, the warm-up of a parent doesn't carry over a fork.
+_warmed_pid = None
+_warm_up_lock = threading.Lock()
+
+
+def resolve_routes(paths):
+    '''
+        Resolves the given paths, which builds the URL resolvers and imports the views.
+    '''
+    for path in paths:
+        match = resolve(path)
+        import_module(match.func.__module__)
+
+
+def open_connections(aliases=None):
+    '''
+        Opens the connections of the current thread to the given aliases (all by default).
+    '''
+    for alias in aliases if aliases is not None else connections:
+        connections[alias].ensure_connection()
+
+
+def warm_up(executor=None):
+    '''
+        Starts the pool workers, resolves the routes in WARMUP_ROUTES and opens the
+        connections of the workers to WARMUP_DATABASES. Returns the duration, in seconds,
+        of each step.
+    '''
+    global last_report
+    executor = executor or _settings.executor
+    aliases = _settings.WARMUP_DATABASES
+    steps = (
+        ('workers', lambda: executor.warm_up(timeout=_settings.WARMUP_TIMEOUT)),
+        ('routes', lambda: resolve_routes(_settings.WARMUP_ROUTES)),
+        ('connections', lambda: executor.warm_up(
+            lambda: open_connections(aliases), timeout=_settings.WARMUP_TIMEOUT
+        )),
+    )
+
+    report = OrderedDict()
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        report[name] = time.perf_counter() - start
+        logger.info('Batch requests warm-up: %s took %.1fms.', name, report[name] * 1000)
+
+    last_report = report
+    return report
+
+
+def warm_up_once(**kwargs):
+    '''
+        Runs the warm-up unless it already ran in this process. Connected to request_started
+        with WARMUP_ON_FIRST_REQUEST, it can also be called from a post-fork hook, e.g.
+        gunicorn's post_worker_init. A failed warm-up is logged, not retried.
+    '''
+    global _warmed_pid
+    if _warmed_pid == os.getpid():
+        return
+    with _warm_up_lock:
+        if _warmed_pid == os.getpid():
+            return
+        _warmed_pid = os.getpid()
+        try:
+            warm_up()
+        except Exception:
+            logger.exception('Batch requests warm-up failed.')
+
+
+def is_warm():
+    '''
+        Tells whether the warm-up has run in this process, e.g. for readiness probes.
+    '''
+    return last_report is not None
@@ -4,7 +4,10 @@ def pytest_configure():
     settings.configure(
         DEBUG_PROPAGATE_EXCEPTIONS=True,
         DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
-                               'NAME': ':memory:'}},
+                               'NAME': ':memory:'},
+                   'replica': {'ENGINE': 'django.db.backends.sqlite3',
+                               'NAME': ':memory:',
+                               'TEST': {'MIRROR': 'default'}}},
         SITE_ID=1,
         SECRET_KEY='not very secret in tests',
         USE_I18N=True,
@@ -0,0 +1,114 @@
+'''
+@summary: Test cases for the admission control of batch requests.
+'''
+import json
+
+from batch_requests import admission
+from batch_requests.admission import (AdmissionController, RouteWeights,
+                                      TokenBucket, check_settings)
+from batch_requests.settings import DEFAULTS, BatchRequestSettings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+
+class TestAdmissionController(TestCase):
+    '''
+        Tests admitting and rejecting batches.
+    '''
+
+    @override_settings(BATCH_REQUESTS={'ADMISSION_MAX_IN_FLIGHT': 5})
+    def test_in_flight(self):
+        controller = AdmissionController()
+        self.assertIsNone(controller.admit('user', 4, 0))
+        self.assertEqual(controller.admit('user', 2, 0), 1)
+        self.assertIsNone(controller.admit('user', 1, 0))
+
+        controller.release(5)
+        # A batch heavier than the limit is admitted when nothing else is in flight.
+        self.assertIsNone(controller.admit('user', 8, 0))
+
+    @override_settings(BATCH_REQUESTS={'ADMISSION_MAX_QUEUE_DEPTH': 10})
+    def test_queue_depth(self):
+        controller = AdmissionController()
+        self.assertIsNone(controller.admit('user', 1, 10))
+        self.assertEqual(controller.admit('user', 1, 11), 1)
+
+    @override_settings(BATCH_REQUESTS={'ADMISSION_USER_RATE': 2, 'ADMISSION_USER_BURST': 6})
+    def test_user_budget(self):
+        controller = AdmissionController()
+        self.assertIsNone(controller.admit('user', 4, 0))
+        retry_after = controller.admit('user', 4, 0)
+        self.assertGreater(retry_after, 0.9)
+        self.assertLessEqual(retry_after, 1)
+
+        # Budgets are per user, and rejected batches don't use any.
+        self.assertIsNone(controller.admit('other', 6, 0))
+        self.assertIsNone(controller.admit('user', 2, 0))
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, capacity=5)
+        self.assertEqual(bucket.wait_time(5), 0)
+        bucket.take(5)
+        self.assertAlmostEqual(bucket.wait_time(20), 0.5, places=1)
+
+    def test_route_weights(self):
+        weights = RouteWeights({'itemview': 5, r'^/sleep/': 10})
+        self.assertEqual(weights.weight({'url': '/items/1/?q=1'}), 5)
+        self.assertEqual(weights.weight({'url': '/sleep/?seconds=1'}), 10)
+        self.assertEqual(weights.weight({'url': '/views/'}), 1)
+        self.assertEqual(weights.weight({'url': '/unknown/'}), 1)
+        # URL names only match their route.
+        self.assertEqual(RouteWeights({'items': 5}).weight({'url': '/items/'}), 1)
+
+
+class TestAdmissionControl(TestCase):
+    '''
+        Tests the 503 responses of the batch endpoint.
+    '''
+
+    def setUp(self):
+        admission.controller = AdmissionController()
+
+    def post(self, count=2):
+        data = json.dumps({'batch': [{'url': '/views/', 'method': 'get'}] * count})
+        return self.client.post('/api/v1/batch/', data, content_type='application/json')
+
+    @override_settings(BATCH_REQUESTS={'ADMISSION_CONTROL': True, 'ADMISSION_MAX_IN_FLIGHT': 3})
+    def test_overloaded(self):
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(admission.controller.in_flight, 0)
+
+        admission.controller.in_flight = 2
+        response = self.post()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(BATCH_REQUESTS={
+        'ADMISSION_CONTROL': True, 'ADMISSION_USER_RATE': 0.1, 'ADMISSION_USER_BURST': 3,
+        'ADMISSION_ROUTE_WEIGHTS': {'simpleview': 2},
+    })
+    def test_user_budget(self):
+        self.assertEqual(self.post(1).status_code, 200)
+        response = self.post(1)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
+
+    def test_streamed_settings(self):
+        '''
+            Limits which can't apply to streamed batches are rejected.
+        '''
+        streamed = {'ADMISSION_CONTROL': True, 'STREAM_INGEST': True}
+        check_settings(BatchRequestSettings(dict(streamed, ADMISSION_MAX_QUEUE_DEPTH=5), DEFAULTS))
+        for user_settings in (
+                dict(streamed, ADMISSION_MAX_IN_FLIGHT=5),
+                dict(streamed, ADMISSION_USER_RATE=1),
+                {'ADMISSION_MAX_IN_FLIGHT': 5, 'PROFILES': {'bulk': {
+                    'ADMISSION_CONTROL': True, 'STREAM_INGEST': True,
+                }}}):
+            with self.assertRaises(ImproperlyConfigured, msg=user_settings):
+                check_settings(BatchRequestSettings(user_settings, DEFAULTS))
+
+    @override_settings(BATCH_REQUESTS={'ADMISSION_MAX_IN_FLIGHT': 0})
+    def test_disabled(self):
+        admission.controller.in_flight = 10
+        self.assertEqual(self.post().status_code, 200)
@@ -0,0 +1,83 @@
+'''
+@summary: Test cases for collapsing batched reads through registered bulk handlers.
+'''
+import json
+
+from batch_requests.bulk import bulk_handlers
+from batch_requests.settings import br_settings
+from django.http.response import JsonResponse
+from tests.test_base import TestBase
+
+
+class TestBulkHandlers(TestBase):
+    '''
+        Tests that registered routes are answered with a single bulk handler call.
+    '''
+
+    def setUp(self):
+        self.calls = []
+
+        def bulk_items(requests, kwargs_list):
+            self.calls.append([kwargs['pk'] for kwargs in kwargs_list])
+            return [
+                JsonResponse({'id': int(kwargs['pk']), 'name': 'Item %s' % kwargs['pk']})
+                for kwargs in kwargs_list
+            ]
+        bulk_handlers.register('itemview', bulk_items)
+
+    def tearDown(self):
+        bulk_handlers.unregister('itemview')
+
+    def test_bulk_handler_called_once(self):
+        '''
+            All the matching GET requests should be collapsed into one handler call and
+            the responses split back in order.
+        '''
+        batch_requests = self.make_multiple_batch_request([
+            ('get', '/items/1/', '', {}),
+            ('get', '/views/', '', {}),
+            ('get', '/items/2/', '', {}),
+        ])
+        responses = json.loads(batch_requests.content)
+
+        self.assertEqual(self.calls, [['1', '2']])
+        self.assertEqual(responses[0]['body'], {'id': 1, 'name': 'Item 1'})
+        self.assertEqual(responses[1]['body'], 'Success!')
+        self.assertEqual(responses[2]['body'], {'id': 2, 'name': 'Item 2'})
+
+    def test_bulk_response_compatible(self):
+        '''
+            Bulk responses should have the same shape as the ones from the detail view.
+        '''
+        bulk_resp = json.loads(self.make_a_batch_request('get', '/items/3/', '').content)[0]
+        bulk_handlers.unregister('itemview')
+        view_resp = json.loads(self.make_a_batch_request('get', '/items/3/', '').content)[0]
+
+        for resp in (bulk_resp, view_resp):
+            del resp['headers'][br_settings.DURATION_HEADER_NAME]
+        self.assertDictEqual(bulk_resp, view_resp)
+
+    def test_bulk_handler_failure(self):
+        '''
+            A failing bulk handler should fail only the requests it was responsible for.
+        '''
+        def broken(requests, kwargs_list):
+            raise Exception('bulk failure')
+        bulk_handlers.register('itemview', broken)
+
+        batch_requests = self.make_multiple_batch_request([
+            ('get', '/items/1/', '', {}),
+            ('get', '/views/', '', {}),
+        ])
+        responses = json.loads(batch_requests.content)
+
+        self.assertEqual(responses[0]['status_code'], 500)
+        self.assertEqual(responses[0]['reason_phrase'], 'bulk failure')
+        self.assertEqual(responses[1]['status_code'], 200)
+
+    def test_writes_are_not_collapsed(self):
+        '''
+            Only GET requests should go through the bulk handler.
+        '''
+        self.make_multiple_batch_request([('delete', '/items/1/', '', {})])
+        self.assertEqual(self.calls, [])
@@ -0,0 +1,83 @@
+'''
+@summary: Test cases for ETags and 304 responses in batches.
+'''
+import json
+
+from batch_requests.conditional import batch_etag
+from django.test import TestCase, override_settings
+
+
+@override_settings(BATCH_REQUESTS={'USE_ETAGS': True})
+class TestConditionalRequests(TestCase):
+    '''
+        Tests ETags of sub responses and of the batch response.
+    '''
+
+    def post_batch(self, requests, **extra):
+        return self.client.post(
+            '/api/v1/batch/', json.dumps({'batch': requests}),
+            content_type='application/json', **extra
+        )
+
+    def test_sub_response_etag(self):
+        '''
+            Sub responses get an ETag, and a matching If-None-Match gets a body-less 304.
+        '''
+        request = {'method': 'get', 'url': '/items/1/'}
+        first = json.loads(self.post_batch([request]).content)[0]
+        etag = first['headers']['ETag']
+
+        request['headers'] = {'If-None-Match': etag}
+        second = json.loads(self.post_batch([request]).content)[0]
+
+        self.assertEqual(second['status_code'], 304)
+        self.assertNotIn('body', second)
+        self.assertEqual(second['headers']['ETag'], etag)
+
+    def test_changed_sub_response(self):
+        request = {'method': 'get', 'url': '/items/1/', 'headers': {'If-None-Match': '"stale"'}}
+        response = json.loads(self.post_batch([request]).content)[0]
+
+        self.assertEqual(response['status_code'], 200)
+        self.assertEqual(response['body'], {'id': 1, 'name': 'Item 1'})
+
+    def test_writes_are_not_conditional(self):
+        request = {'method': 'delete', 'url': '/views/'}
+        response = json.loads(self.post_batch([request]).content)[0]
+        self.assertNotIn('ETag', response['headers'])
+
+    def test_batch_etag(self):
+        '''
+            Polling the same batch gets a single 304 until one of its responses changes.
+        '''
+        requests = [{'method': 'get', 'url': '/items/1/'}, {'method': 'get', 'url': '/views/'}]
+        first = self.post_batch(requests)
+        etag = first['ETag']
+
+        second = self.post_batch(requests, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+
+        requests[0]['url'] = '/items/2/'
+        third = self.post_batch(requests, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third['ETag'], etag)
+
+    def test_batch_with_writes(self):
+        '''
+            A batch with writes is never short-circuited, its results would be lost.
+        '''
+        requests = [{'method': 'get', 'url': '/items/1/'}, {'method': 'delete', 'url': '/views/'}]
+        first = self.post_batch(requests)
+        self.assertNotIn('ETag', first)
+        second = self.post_batch(requests, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(second.status_code, 200)
+
+    def test_batch_etag_of_errors(self):
+        '''
+            Body-less entries with the same status but another reason get another ETag.
+        '''
+        self.assertNotEqual(
+            batch_etag([{'status_code': 500, 'reason_phrase': 'Disk full'}]),
+            batch_etag([{'status_code': 500, 'reason_phrase': 'Timeout'}]),
+        )
@@ -0,0 +1,70 @@
+'''
+@summary: Test cases for the propagation of the caller's context to the workers.
+'''
+import threading
+import unittest
+
+from batch_requests.concurrent.context import (BatchContext,
+                                               ThreadLocalSnapshotter,
+                                               TimezoneSnapshotter,
+                                               TranslationSnapshotter,
+                                               contextvars)
+from batch_requests.concurrent.executor import ThreadBasedExecutor
+from django.test import TestCase
+from django.utils import timezone, translation
+
+tenant = threading.local()
+
+
+class TenantSnapshotter(ThreadLocalSnapshotter):
+    local = tenant
+    attributes = ('name',)
+
+
+def current_state(request):
+    return (
+        translation.get_language(), str(timezone.get_current_timezone()),
+        getattr(tenant, 'name', None),
+    )
+
+
+class TestContextPropagation(TestCase):
+    '''
+        Tests running sub requests on workers within the context of the batch.
+    '''
+
+    def setUp(self):
+        self.executor = ThreadBasedExecutor(2, snapshotters=[
+            TranslationSnapshotter(), TimezoneSnapshotter(), TenantSnapshotter(),
+        ])
+        self.addCleanup(self.executor.shutdown)
+
+    def test_propagated(self):
+        tenant.name = 'acme'
+        self.addCleanup(delattr, tenant, 'name')
+        with translation.override('fr'), timezone.override('Europe/Paris'):
+            results = self.executor.execute(['a', 'b', 'c'], current_state)
+        self.assertEqual(list(results), [('fr', 'Europe/Paris', 'acme')] * 3)
+
+    def test_workers_reset(self):
+        tenant.name = 'acme'
+        with translation.override('fr'):
+            self.executor.execute(['a', 'b'], current_state)
+        del tenant.name
+
+        # Work submitted without a context finds the workers as they were.
+        futures = [self.executor.executor_pool.submit(current_state, None) for _ in range(4)]
+        for future in futures:
+            language, _, name = future.result()
+            self.assertNotEqual(language, 'fr')
+            self.assertIsNone(name)
+
+    def test_nothing_to_propagate(self):
+        self.assertFalse(BatchContext([], propagate_contextvars=False))
+
+    @unittest.skipIf(contextvars is None, 'contextvars requires Python 3.7+')
+    def test_contextvars(self):
+        variable = contextvars.ContextVar('variable', default=None)
+        variable.set('batch')
+        results = self.executor.execute(['a', 'b'], lambda request: variable.get())
+        self.assertEqual(list(results), ['batch', 'batch'])
@@ -0,0 +1,86 @@
+'''
+@summary: Test cases for the batch response envelope.
+'''
+import json
+
+from batch_requests.settings import br_settings
+from django.test import TestCase, override_settings
+
+
+class TestEnvelope(TestCase):
+    '''
+        Tests the default and compact envelopes.
+    '''
+    batch = [
+        {'method': 'get', 'url': '/items/1/'},
+        {'method': 'get', 'url': '/items/2/'},
+        {'method': 'delete', 'url': '/views/'},
+        {'method': 'head', 'url': '/views/'},
+    ]
+
+    def post_batch(self):
+        return json.loads(self.client.post(
+            '/api/v1/batch/', json.dumps({'batch': self.batch}),
+            content_type='application/json'
+        ).content)
+
+    @override_settings(BATCH_REQUESTS={})
+    def test_default_envelope(self):
+        responses = self.post_batch()
+
+        self.assertEqual(len(responses), 4)
+        self.assertEqual(responses[0]['headers']['Content-Type'], 'application/json')
+        self.assertEqual(responses[0]['reason_phrase'], 'OK')
+        self.assertIn(br_settings.DURATION_HEADER_NAME, responses[0]['headers'])
+
+    @override_settings(BATCH_REQUESTS={'RESPONSE_HEADERS_TO_INCLUDE': ['content-type']})
+    def test_header_allowlist(self):
+        responses = self.post_batch()
+        self.assertEqual(responses[0]['headers'], {'Content-Type': 'application/json'})
+
+    @override_settings(BATCH_REQUESTS={
+        'COMPACT_ENVELOPE': True, 'RESPONSE_HEADERS_TO_INCLUDE': ['Content-Type', 'request_url'],
+    })
+    def test_compact_envelope(self):
+        '''
+            Common headers are hoisted, default reasons and empty bodies are left out.
+        '''
+        response = self.post_batch()
+        self.batch = self.batch[:2]
+        hoisted = self.post_batch()
+
+        self.assertEqual(response['headers'], {})
+        self.assertEqual(response['batch'][0], {
+            'status_code': 200,
+            'headers': {'Content-Type': 'application/json', 'request_url': '/items/1/'},
+            'body': {'id': 1, 'name': 'Item 1'},
+        })
+        self.assertEqual(response['batch'][3], {
+            'status_code': 200,
+            'headers': {'Content-Type': 'text/html; charset=utf-8', 'request_url': '/views/'},
+        })
+        self.assertEqual(hoisted['headers'], {'Content-Type': 'application/json'})
+        self.assertEqual(hoisted['batch'][1]['headers'], {'request_url': '/items/2/'})
+
+    @override_settings(BATCH_REQUESTS={'MERGE_JSONAPI_INCLUDED': True})
+    def test_merged_included(self):
+        '''
+            The included resources of the JSON-API sub responses are pooled.
+        '''
+        self.batch = [
+            {'method': 'get', 'url': '/jsonapi/?id=1&author=7'},
+            {'method': 'get', 'url': '/jsonapi/?id=2&author=7'},
+            {'method': 'get', 'url': '/jsonapi/?id=3&author=8'},
+            {'method': 'get', 'url': '/items/1/'},
+        ]
+        response = self.post_batch()
+
+        self.assertEqual(response['included'], [
+            {'type': 'people', 'id': '7', 'attributes': {'name': 'Person 7'}},
+            {'type': 'people', 'id': '8', 'attributes': {'name': 'Person 8'}},
+        ])
+        self.assertEqual(
+            [result['body'].get('included') for result in response['batch']],
+            [[{'type': 'people', 'id': '7'}]] * 2 + [[{'type': 'people', 'id': '8'}], None]
+        )
+        self.assertEqual(response['batch'][3]['body'], {'id': 1, 'name': 'Item 1'})
@@ -0,0 +1,349 @@
+'''
+@summary: Test cases for the lifecycle of the executors and their pools.
+'''
+from batch_requests.concurrent import routing
+from batch_requests.concurrent.executor import (SequentialExecutor,
+                                                ThreadBasedExecutor,
+                                                _reset_executors_after_fork)
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from batch_requests.concurrent.stats import UNRESOLVED
+from batch_requests.settings import br_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, TestCase, override_settings
+
+
+class TestExecutorLifecycle(TestCase):
+    '''
+        Tests that pools are created lazily and rebuilt when required.
+    '''
+
+    def test_pool_created_lazily(self):
+        '''
+            Creating an executor should not create its pool.
+        '''
+        executor = ThreadBasedExecutor(2)
+        self.assertEqual(executor._pools, {})
+
+        self.assertEqual(executor.execute([1, 2], lambda x: x * 2), [2, 4])
+        self.assertIn(None, executor._pools)
+        executor.shutdown()
+        self.assertEqual(executor._pools, {})
+
+    def test_pool_reset_after_fork(self):
+        '''
+            Pools inherited from the parent process are dropped and recreated on use.
+        '''
+        executor = ThreadBasedExecutor(2)
+        pool = executor.executor_pool
+        _reset_executors_after_fork()
+
+        self.assertEqual(executor._pools, {})
+        self.assertIsNot(executor.executor_pool, pool)
+        executor.shutdown()
+        pool.shutdown()
+
+    def test_pool_reset_in_other_process(self):
+        '''
+            Without a fork hook, pools are reset once used from another process.
+        '''
+        executor = ThreadBasedExecutor(2)
+        pool = executor.executor_pool
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertIsNot(executor.executor_pool, pool)
+            self.assertIs(executor.executor_pool, executor._pools[None])
+            executor.shutdown()
+        pool.shutdown()
+
+    def test_override_settings_rebuilds_executor(self):
+        '''
+            Overriding the settings should rebuild the executor.
+        '''
+        self.assertIsInstance(br_settings.executor, SequentialExecutor)
+
+        with override_settings(BATCH_REQUESTS={'EXECUTE_PARALLEL': True, 'NUM_WORKERS': 2}):
+            self.assertIsInstance(br_settings.executor, ThreadBasedExecutor)
+            self.assertEqual(br_settings.executor.num_workers, 2)
+
+        self.assertIsInstance(br_settings.executor, SequentialExecutor)
+        self.assertEqual(br_settings.MAX_LIMIT, 3)
+
+
+class TestExecutionClasses(TestCase):
+    '''
+        Tests routing requests to the pools of their execution class.
+    '''
+
+    def setUp(self):
+        self.executor = ThreadBasedExecutor(4, execution_classes={
+            'simpleview': routing.INLINE,
+            r'^/sleep/': routing.SERIALIZED,
+        })
+        factory = RequestFactory()
+        self.requests = [
+            factory.get('/views/'), factory.get('/sleep/'), factory.get('/echo/'),
+        ]
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_classify(self):
+        self.assertEqual(
+            [self.executor.execution_class(request) for request in self.requests],
+            [routing.INLINE, routing.SERIALIZED, None]
+        )
+
+    def test_dispatch(self):
+        '''
+            Each request should run on the pool of its class, results being kept in order.
+        '''
+        def current_thread(request):
+            return request.path, threading.current_thread()
+
+        results = self.executor.execute(self.requests, current_thread)
+
+        self.assertEqual([path for path, _ in results], ['/views/', '/sleep/', '/echo/'])
+        self.assertIs(results[0][1], threading.current_thread())
+        self.assertIsNot(results[1][1], threading.current_thread())
+        self.assertEqual(self.executor.get_pool(routing.SERIALIZED)._max_workers, 1)
+        self.assertEqual(set(self.executor._pools), {None, routing.SERIALIZED})
+
+    def test_invalid_class(self):
+        with self.assertRaises(ImproperlyConfigured):
+            routing.ExecutionClassRouter({'simpleview': 'gpu'})
+        with self.assertRaises(ImproperlyConfigured):
+            routing.ExecutionClassRouter({'simpleview': routing.PROCESS})
+        with self.assertRaises(ImproperlyConfigured):
+            routing.ExecutionClassRouter({'^/views/(': routing.INLINE})
+
+    def test_names_are_not_patterns(self):
+        '''
+            URL names only match their route, not the paths starting with them.
+        '''
+        router = routing.ExecutionClassRouter({
+            'views': routing.SERIALIZED, 'echo.*': routing.SERIALIZED, '^/views/': routing.INLINE,
+        })
+        factory = RequestFactory()
+        self.assertEqual(router.classify(factory.get('/views/')), routing.INLINE)
+        self.assertIsNone(router.classify(factory.get('/echo/')))
+
+
+class TestAdaptiveInline(TestCase):
+    '''
+        Tests the adaptive inline fast path.
+    '''
+
+    def setUp(self):
+        self.executor = ThreadBasedExecutor(4, inline_threshold=0.01, inline_batch_size=1)
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def current_thread(self, request):
+        if request.path.startswith('/sleep/'):
+            time.sleep(0.05)
+        return threading.current_thread()
+
+    def test_small_batch_inline(self):
+        '''
+            Single request batches should not be handed over to the pool.
+        '''
+        results = self.executor.execute([self.factory.get('/sleep/')], self.current_thread)
+        self.assertIs(results[0], threading.current_thread())
+
+    def test_cheap_routes_inline(self):
+        '''
+            Once known to be cheap, requests of a route run inline, expensive ones don't.
+        '''
+        requests = [self.factory.get('/views/'), self.factory.get('/sleep/')]
+
+        first = self.executor.execute(requests, self.current_thread)
+        self.assertNotIn(threading.current_thread(), first)
+
+        second = self.executor.execute(requests, self.current_thread)
+        self.assertIs(second[0], threading.current_thread())
+        self.assertIsNot(second[1], threading.current_thread())
+        self.assertGreater(self.executor.cost_model.predict('sleepingview'), 0.01)
+
+
+class TestAdaptiveInlineRouting(TestCase):
+    '''
+        Tests which requests the adaptive executor runs inline, given the expected cost of
+        their routes.
+    '''
+
+    def setUp(self):
+        self.executor = ThreadBasedExecutor(4, inline_threshold=0.01, inline_batch_size=1)
+        self.addCleanup(self.executor.shutdown)
+        # The expected costs stay put, whatever the requests took.
+        costs = {'simpleview': 0.001, 'sleepingview': 0.05}
+        for name, stub in (('predict', costs.get), ('observe', None)):
+            patcher = mock.patch.object(self.executor.cost_model, name, side_effect=stub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        factory = RequestFactory()
+        self.requests = [factory.get('/views/'), factory.get('/sleep/'), factory.get('/echo/')]
+
+    def handle(self, request):
+        return threading.current_thread()
+
+    def test_routing(self):
+        '''
+            Cheap routes run inline, expensive and unknown ones on the pool.
+        '''
+        self.assertEqual(
+            [self.executor.execution_class(request, self.executor.cost_model.route_key(request))
+             for request in self.requests],
+            [routing.INLINE, None, None]
+        )
+
+        results = self.executor.execute(self.requests, self.handle)
+        self.assertIs(results[0], threading.current_thread())
+        self.assertIsNot(results[1], threading.current_thread())
+        self.assertIsNot(results[2], threading.current_thread())
+
+    def test_small_batch(self):
+        '''
+            Batches of at most inline_batch_size requests run inline, whatever their cost.
+        '''
+        self.assertEqual(
+            self.executor.execution_class(self.requests[1], 'sleepingview', batch_size=1),
+            routing.INLINE
+        )
+        self.assertIs(
+            self.executor.execute(self.requests[1:2], self.handle)[0], threading.current_thread()
+        )
+
+    def test_without_threshold(self):
+        executor = ThreadBasedExecutor(4)
+        self.addCleanup(executor.shutdown)
+        self.assertIsNone(executor.execution_class(self.requests[0], 'simpleview', batch_size=1))
+
+
+@unittest.skipUnless(
+    os.environ.get('BATCH_REQUESTS_BENCHMARKS'), 'Set BATCH_REQUESTS_BENCHMARKS to run.'
+)
+class TestAdaptiveInlineBenchmark(TestCase):
+    '''
+        Compares the adaptive executor to always using the pool and to running inline.
+        Timings depend on the machine, so this only runs on demand, with generous margins.
+    '''
+
+    def setUp(self):
+        factory = RequestFactory()
+        self.cheap = [factory.get('/views/') for _ in range(50)]
+        self.expensive = [factory.get('/sleep/') for _ in range(4)]
+        self.executors = {
+            'adaptive': ThreadBasedExecutor(4, inline_threshold=0.01, inline_batch_size=1),
+            'pool': ThreadBasedExecutor(4),
+            'inline': SequentialExecutor(),
+        }
+
+    def tearDown(self):
+        for executor in self.executors.values():
+            executor.shutdown()
+
+    def handle(self, request):
+        if request.path.startswith('/sleep/'):
+            time.sleep(0.05)
+        return request.path
+
+    def best_duration(self, executor, requests, runs=5):
+        durations = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            executor.execute(requests, self.handle)
+            durations.append(time.perf_counter() - start)
+        return min(durations)
+
+    def test_never_much_slower(self):
+        for requests in (self.cheap, self.expensive):
+            durations = {
+                name: self.best_duration(executor, requests)
+                for name, executor in self.executors.items()
+            }
+            fastest = min(durations['pool'], durations['inline'])
+            self.assertLessEqual(durations['adaptive'], fastest * 3 + 0.02, durations)
+
+
+class TestLongestFirstScheduling(TestCase):
+    '''
+        Tests that the longest expected requests are submitted first.
+    '''
+
+    def setUp(self):
+        factory = RequestFactory()
+        self.requests = [factory.get('/views/'), factory.get('/echo/'), factory.get('/sleep/')]
+        self.started = []
+
+    def handle(self, request):
+        self.started.append(request.path)
+        return request.path
+
+    def executor(self, num_workers, **kwargs):
+        executor = ThreadBasedExecutor(num_workers, **kwargs)
+        self.addCleanup(executor.shutdown)
+        executor.cost_model.observe('sleepingview', 0.5)
+        executor.cost_model.observe('simpleview', 0.01)
+        executor.cost_model.observe('echoheader', 0.02)
+        return executor
+
+    def test_longest_first(self):
+        results = self.executor(1).execute(self.requests, self.handle)
+
+        self.assertEqual(self.started, ['/sleep/', '/echo/', '/views/'])
+        self.assertEqual(results, ['/views/', '/echo/', '/sleep/'])
+
+    def test_unknown_route(self):
+        '''
+            Requests of a route without an estimate are expected to take the mean time.
+        '''
+        executor = ThreadBasedExecutor(1)
+        self.addCleanup(executor.shutdown)
+        executor.cost_model.observe('sleepingview', 0.5)
+        executor.cost_model.observe('simpleview', 0.01)
+        executor.execute(self.requests, self.handle)
+        self.assertEqual(self.started, ['/sleep/', '/echo/', '/views/'])
+
+    def test_unresolved_routes(self):
+        '''
+            Requests which don't resolve share a single estimate.
+        '''
+        executor = self.executor(1)
+        factory = RequestFactory()
+        executor.execute([factory.get('/unknown/%d/' % i) for i in range(5)], self.handle)
+        self.assertEqual(
+            set(executor.cost_model.estimates),
+            {'sleepingview', 'simpleview', 'echoheader', UNRESOLVED}
+        )
+
+    def test_client_order(self):
+        self.executor(1, longest_first=False).execute(self.requests, self.handle)
+        self.assertEqual(self.started, ['/views/', '/echo/', '/sleep/'])
+
+    def test_makespan(self):
+        '''
+            The predicted makespan follows the number of workers, the actual one is measured.
+        '''
+        single = self.executor(1).execute(self.requests, self.handle)
+        self.assertAlmostEqual(single.predicted_makespan, 0.53)
+
+        parallel = self.executor(2).execute(self.requests, self.handle)
+        self.assertAlmostEqual(parallel.predicted_makespan, 0.5)
+        self.assertGreater(parallel.makespan, 0)
+        self.assertLess(parallel.makespan, 0.5)
+
+    def test_makespan_headers(self):
+        with override_settings(BATCH_REQUESTS={'EXECUTE_PARALLEL': True, 'NUM_WORKERS': 2}):
+            response = self.client.post(
+                '/api/v1/batch/',
+                '{"batch": [{"method": "get", "url": "/views/"}]}',
+                content_type='application/json'
+            )
+            self.assertIn(br_settings.MAKESPAN_HEADER_NAME, response)
+            self.assertIn(br_settings.MAKESPAN_HEADER_NAME + '.predicted', response)
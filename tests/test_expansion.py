@@ -0,0 +1,132 @@
+'''
+@summary: Test cases for the fan-out templates and the defaults of batches.
+'''
+import io
+import json
+
+from batch_requests.exceptions import BadBatchRequest
+from batch_requests.expansion import Template, apply_defaults, expand_requests, parse_batch
+from batch_requests.ingest import iter_batch_requests
+from batch_requests.views import construct_wsgi_from_data
+from django.test import RequestFactory, TestCase, override_settings
+
+
+class TestExpansion(TestCase):
+    '''
+        Tests expanding the templates of a batch.
+    '''
+
+    def test_url(self):
+        self.assertEqual(expand_requests([
+            {'url': '/items/{{item}}/?q={{item}}', 'method': 'get', 'for_each': [1, 'a b']},
+            {'url': '/views/', 'method': 'get'},
+        ]), [
+            {'url': '/items/1/?q=1', 'method': 'get'},
+            {'url': '/items/a%20b/?q=a%20b', 'method': 'get'},
+            {'url': '/views/', 'method': 'get'},
+        ])
+        self.assertEqual(expand_requests([{'url': '/views/', 'for_each': []}]), [])
+
+    def test_body(self):
+        requests = expand_requests([{
+            'url': '/views/', 'method': 'post', 'for_each': [1, {'a': 'x"y'}],
+            'body': {'id': '{{item}}', 'name': 'Item {{item}}', 'fixed': [1]},
+        }])
+        self.assertEqual([request['body'] for request in requests], [
+            {'id': 1, 'name': 'Item 1', 'fixed': [1]},
+            {'id': {'a': 'x"y'}, 'name': "Item {'a': 'x\"y'}", 'fixed': [1]},
+        ])
+
+        # Bodies without placeholders are left as they are.
+        self.assertEqual(
+            expand_requests([{'url': '/views/', 'body': {'a': 1}, 'for_each': [1]}]),
+            [{'url': '/views/', 'body': {'a': 1}}]
+        )
+
+    def test_defaults(self):
+        defaults = {'method': 'get', 'headers': {'a': '1', 'b': '2'}}
+        self.assertEqual(
+            apply_defaults({'url': '/views/', 'headers': {'b': '3'}}, defaults),
+            {'url': '/views/', 'method': 'get', 'headers': {'a': '1', 'b': '3'}}
+        )
+        self.assertEqual(
+            apply_defaults({'url': '/views/', 'method': 'post'}, defaults)['method'], 'post'
+        )
+        self.assertEqual(
+            expand_requests([{'url': '/items/{{item}}/', 'for_each': [1]}], defaults),
+            [{'url': '/items/1/', 'method': 'get', 'headers': {'a': '1', 'b': '2'}}]
+        )
+
+    def test_invalid(self):
+        with self.assertRaises(BadBatchRequest):
+            expand_requests([{'url': '/views/', 'for_each': 'abc'}])
+        with self.assertRaises(BadBatchRequest):
+            expand_requests([], defaults=[])
+        with self.assertRaises(BadBatchRequest):
+            parse_batch('{"batch": {}}')
+
+    def test_max_limit(self):
+        self.assertEqual(len(expand_requests([{'url': '/', 'for_each': [1, 2]}], None, 2)), 2)
+        with self.assertRaises(BadBatchRequest):
+            expand_requests([{'url': '/', 'for_each': list(range(10 ** 6))}], None, 2)
+
+    def test_streamed(self):
+        body = json.dumps({
+            'defaults': {'method': 'get'}, 'batch': [{'url': '/items/{{item}}/', 'for_each': [1, 2]}],
+        }).encode('utf-8')
+        self.assertEqual(list(iter_batch_requests(io.BytesIO(body), 10, 4)), [
+            {'url': '/items/1/', 'method': 'get'}, {'url': '/items/2/', 'method': 'get'},
+        ])
+        with self.assertRaises(BadBatchRequest):
+            list(iter_batch_requests(io.BytesIO(body), 1, 4))
+
+        body = json.dumps({'batch': [], 'defaults': {'method': 'get'}}).encode('utf-8')
+        with self.assertRaisesRegex(BadBatchRequest, 'should come before'):
+            list(iter_batch_requests(io.BytesIO(body), 10, 4))
+
+    def test_onward_placeholders(self):
+        '''
+            Onward placeholders of templated JSON bodies are still replaced.
+        '''
+        template = Template({
+            'url': '/views/', 'method': 'post', 'for_each': [1],
+            'body': {'id': '{{item}}', 'parent': '{{parent}}'},
+        })
+        request = RequestFactory().post('/api/v1/batch/')
+        body = json.loads(construct_wsgi_from_data(
+            request, template.expand(1), {'parent': 'a'}
+        ).wsgi_request.body.decode('utf-8'))
+        self.assertEqual(body, {'id': 1, 'parent': 'a'})
+
+
+@override_settings(BATCH_REQUESTS={'MAX_LIMIT': 3})
+class TestExpandedBatch(TestCase):
+    '''
+        Tests executing the batches with templates.
+    '''
+
+    def post(self, data):
+        return self.client.post(
+            '/api/v1/batch/', json.dumps(data), content_type='application/json'
+        )
+
+    def test_responses(self):
+        response = self.post({
+            'defaults': {'method': 'get'},
+            'batch': [
+                {'url': '/items/{{item}}/', 'for_each': [1, 2]},
+                {'url': '/views/', 'method': 'post', 'body': '"{{item}}"', 'for_each': ['a']},
+            ],
+        })
+        self.assertEqual(response.status_code, 200)
+        responses = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([result['status_code'] for result in responses], [200, 200, 201])
+        self.assertEqual(
+            [result['body'] for result in responses[:2]],
+            [{'id': 1, 'name': 'Item 1'}, {'id': 2, 'name': 'Item 2'}]
+        )
+        self.assertEqual(responses[2]['body'], 'a')
+
+    def test_max_limit(self):
+        response = self.post({'batch': [{'url': '/items/{{item}}/', 'for_each': [1, 2, 3, 4]}]})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,113 @@
+'''
+@summary: Test cases for the onward_data extraction expressions.
+'''
+import json
+
+from batch_requests.exceptions import BadBatchRequest
+from batch_requests.extraction import compile_expression, compile_extractor
+from django.test import TestCase
+from tests.test_views import JsonApiView
+
+
+class TestExtraction(TestCase):
+    '''
+        Tests compiling and evaluating extraction expressions.
+    '''
+    body = {
+        'data': [
+            {'id': 1, 'tags': [{'name': 'a'}, {'name': 'b'}]},
+            {'id': 2, 'tags': []},
+        ],
+        'meta': {'a/b': 'slash', 'count': 2},
+    }
+
+    def extract(self, expression):
+        return compile_expression(expression).extract(self.body)
+
+    def test_dotted_path(self):
+        self.assertEqual(self.extract('meta.count'), 2)
+        self.assertEqual(self.extract('data.1.id'), 2)
+
+    def test_json_pointer(self):
+        self.assertEqual(self.extract('/data/0/id'), 1)
+        self.assertEqual(self.extract('/meta/a~1b'), 'slash')
+
+    def test_indexes_and_wildcards(self):
+        self.assertEqual(self.extract('data[-1].id'), 2)
+        self.assertEqual(self.extract('/data[*]/id'), [1, 2])
+        self.assertEqual(self.extract('data[*].tags[*].name'), [['a', 'b'], []])
+
+    def test_missing_and_defaults(self):
+        self.assertIsNone(self.extract('meta.missing'))
+        self.assertIsNone(self.extract('data[5].id'))
+        self.assertEqual(self.extract('meta.missing | []'), [])
+        self.assertEqual(self.extract('meta.missing | fallback'), 'fallback')
+
+    def test_single_walk(self):
+        extractor = compile_extractor({
+            'ids': 'data[*].id', 'first': 'data[0].id', 'count': '/meta/count',
+            'none': 'data.x',
+        })
+        self.assertEqual(
+            extractor.extract(self.body), {'ids': [1, 2], 'first': 1, 'count': 2}
+        )
+
+    def test_cached(self):
+        self.assertIs(compile_expression('data[*].id'), compile_expression('data[*].id'))
+        self.assertIs(compile_extractor({'a': 'meta'}), compile_extractor({'a': 'meta'}))
+
+    def test_invalid_expression(self):
+        with self.assertRaises(BadBatchRequest):
+            compile_expression('data[x].id')
+
+    def test_sequential_onward_data(self):
+        '''
+            Extracted values, including non string ones, are passed to the next request.
+        '''
+        JsonApiView.created = []
+        batch = [
+            {
+                'method': 'post', 'url': '/jsonapi/',
+                'body': {'data': {'type': 'A', 'attributes': {}}},
+                'onward_data': {'parent': '/data/id', 'missing': 'data.missing'},
+            },
+            {
+                'method': 'post', 'url': '/jsonapi/',
+                'body': {'data': {'type': 'B', 'attributes': {'parent': '{{parent}}'}}},
+            },
+        ]
+        responses = json.loads(self.client.post(
+            '/api/v1/batch/sequential/', json.dumps({'batch': batch}),
+            content_type='application/json'
+        ).content)
+
+        self.assertEqual(responses[1]['status_code'], 201)
+        self.assertEqual(responses[1]['body']['data']['attributes'], {'parent': 1})
+
+    def test_sequential_onward_strings_and_nulls(self):
+        '''
+            String values are passed as JSON strings, and null defaults as null.
+        '''
+        JsonApiView.created = []
+        batch = [
+            {
+                'method': 'post', 'url': '/jsonapi/',
+                'body': {'data': {'type': 'A', 'attributes': {}}},
+                'onward_data': {'type': '/data/type', 'note': 'data.note | null'},
+            },
+            {
+                'method': 'post', 'url': '/jsonapi/',
+                'body': {'data': {'type': 'B', 'attributes': {
+                    'type': '{{type}}', 'note': '{{note}}',
+                }}},
+            },
+        ]
+        responses = json.loads(self.client.post(
+            '/api/v1/batch/sequential/', json.dumps({'batch': batch}),
+            content_type='application/json'
+        ).content)
+
+        self.assertEqual(responses[1]['status_code'], 201)
+        self.assertEqual(
+            responses[1]['body']['data']['attributes'], {'type': 'A', 'note': None}
+        )
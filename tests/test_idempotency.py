@@ -0,0 +1,164 @@
+'''
+@summary: Test cases for the Idempotency-Key support.
+'''
+import json
+import threading
+from unittest import mock
+
+from batch_requests import idempotency
+from batch_requests.idempotency import (CacheIdempotencyStore,
+                                        LocalIdempotencyStore,
+                                        get_idempotency_store, idempotent)
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+
+class TestIdempotency(TestCase):
+    '''
+        Tests storing and replaying batch responses.
+    '''
+
+    def setUp(self):
+        # Every test starts with an empty store.
+        idempotency._stores.clear()
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+        @idempotent
+        def view(request):
+            self.release.wait(5)
+            self.calls.append(request)
+            return HttpResponse('call %d' % len(self.calls), status=200)
+        self.view = view
+        self.factory = RequestFactory()
+
+    def post(self, key='retry-1', body='{"batch": []}', path='/api/v1/batch/'):
+        extra = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        request = self.factory.post(path, body, content_type='application/json', **extra)
+        return self.view(request)
+
+    def test_replay(self):
+        first = self.post()
+        retry = self.post()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        # Other keys, paths and requests without a key are executed.
+        self.post(key='retry-2')
+        self.post(path='/api/v1/batch/sequential/')
+        self.post(key=None)
+        self.assertEqual(len(self.calls), 4)
+
+        self.assertEqual(self.post(body='{"batch": [{}]}').status_code, 422)
+
+    def test_retry_waits_for_original(self):
+        self.release.clear()
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(self.post())) for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual({response.content for response in responses}, {b'call 1'})
+
+    @override_settings(BATCH_REQUESTS={'IDEMPOTENCY_WAIT_SECONDS': 0})
+    def test_retry_timeout(self):
+        self.release.clear()
+        thread = threading.Thread(target=self.post)
+        thread.start()
+        while not get_idempotency_store().in_flight:
+            pass
+        self.assertEqual(self.post().status_code, 409)
+        self.release.set()
+        thread.join()
+
+    @override_settings(BATCH_REQUESTS={'IDEMPOTENCY_MAX_ENTRIES': 1})
+    def test_local_store_lru(self):
+        store = LocalIdempotencyStore()
+        store.set('a', {'content': b'a'})
+        store.set('b', {'content': b'b'})
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(store.get('b'), {'content': b'b'})
+
+        with override_settings(BATCH_REQUESTS={'IDEMPOTENCY_TTL': -1}):
+            store.set('c', {'content': b'c'})
+            self.assertIsNone(store.get('c'))
+
+    def test_cache_store(self):
+        store = CacheIdempotencyStore()
+        self.assertTrue(store.acquire('key'))
+        self.assertFalse(store.acquire('key'))
+        store.set('key', {'content': b'stored'})
+        store.release('key')
+        self.assertEqual(store.get('key'), {'content': b'stored'})
+        self.assertTrue(store.acquire('key'))
+        store.release('key')
+
+    @override_settings(BATCH_REQUESTS={'IDEMPOTENCY_WAIT_SECONDS': 0})
+    def test_cache_store_lock_ttl(self):
+        '''
+            The lock is held while the batch executes, however long the retries wait.
+        '''
+        store = CacheIdempotencyStore()
+        self.assertTrue(store.acquire('key'))
+        self.assertFalse(store.acquire('key'))
+        store.release('key')
+
+    def test_stored_before_acquired(self):
+        '''
+            A retry acquiring the key once the first execution is done replays its response.
+        '''
+        self.post()
+        store = get_idempotency_store()
+        get = store.get
+        lookups = []
+
+        def stale_get(key):
+            lookups.append(key)
+            return None if len(lookups) == 1 else get(key)
+
+        with mock.patch.object(store, 'get', side_effect=stale_get):
+            response = self.post()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    @override_settings(BATCH_REQUESTS={'STREAM_INGEST': True})
+    def test_streamed_body(self):
+        '''
+            With STREAM_INGEST, the body is left for the view to read, and hashed meanwhile.
+        '''
+        @idempotent
+        def view(request):
+            self.calls.append(request.read(4) + request.read())
+            return HttpResponse('call %d' % len(self.calls))
+
+        def post(body):
+            return view(self.factory.post(
+                '/api/v1/batch/', body, content_type='application/json',
+                HTTP_IDEMPOTENCY_KEY='key'
+            ))
+
+        post('{"batch": []}')
+        self.assertEqual(self.calls, [b'{"batch": []}'])
+        self.assertEqual(post('{"batch": []}')['Idempotent-Replayed'], 'true')
+        self.assertEqual(post('{"batch": [{}]}').status_code, 422)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_batch_replay(self):
+        data = json.dumps({'batch': [{'url': '/views/', 'method': 'post', 'body': 'data'}]})
+        first = self.client.post(
+            '/api/v1/batch/', data, content_type='application/json', HTTP_IDEMPOTENCY_KEY='key'
+        )
+        retry = self.client.post(
+            '/api/v1/batch/', data, content_type='application/json', HTTP_IDEMPOTENCY_KEY='key'
+        )
+        self.assertEqual(retry.content, first.content)
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
@@ -0,0 +1,155 @@
+'''
+@summary: Test cases for the incremental parsing and execution of batch bodies.
+'''
+import io
+import json
+import uuid
+
+from batch_requests.exceptions import BadBatchRequest
+from batch_requests.ingest import iter_batch_requests
+from batch_requests.views import execute_streamed_requests
+from django.test import RequestFactory, TestCase, override_settings
+from tests.test_views import JsonApiView
+
+
+def parse(body, max_limit=10, chunk_size=3):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return list(iter_batch_requests(io.BytesIO(body), max_limit, chunk_size))
+
+
+class TestBatchStreamParser(TestCase):
+    '''
+        Tests reading the batch array in chunks.
+    '''
+
+    def test_chunks(self):
+        batch = [
+            {'url': '/views/', 'method': 'get', 'body': 'café ☃', 'count': 12345},
+            {'url': '/echo/', 'method': 'post', 'headers': {}, 'fields': None},
+        ]
+        body = json.dumps({'before': [1, {'a': 2.5}], 'batch': batch, 'after': 12345})
+        for chunk_size in (1, 2, 7, 1024):
+            self.assertEqual(parse(body, chunk_size=chunk_size), batch)
+
+        self.assertEqual(parse(' {\n "batch" : [ ] } \n'), [])
+        self.assertEqual(parse('{}'), [])
+        self.assertEqual(parse('{"other": 1}'), [])
+
+    def test_invalid(self):
+        for body in (
+                '', '[]', '{"batch": {}}', '{"batch": [1]}', '{"batch": [{}]', '{"batch": [{},]}',
+                '{"batch": []} []', '{batch: []}', '{"batch": [], "batch": []}',
+                b'{"batch": ["\xff"]}'):
+            with self.assertRaises(BadBatchRequest, msg=body):
+                parse(body)
+
+    def test_max_limit(self):
+        requests = iter_batch_requests(
+            io.BytesIO(json.dumps({'batch': [{}] * 4}).encode('utf-8')), 2, 3
+        )
+        self.assertEqual(next(requests), {})
+        self.assertEqual(next(requests), {})
+        with self.assertRaises(BadBatchRequest):
+            next(requests)
+
+    def test_max_size(self):
+        body = json.dumps({'batch': [{}] * 4}).encode('utf-8')
+        self.assertEqual(len(list(iter_batch_requests(io.BytesIO(body), 10, 3, len(body)))), 4)
+        with self.assertRaisesRegex(BadBatchRequest, 'larger than'):
+            list(iter_batch_requests(io.BytesIO(body), 10, 3, len(body) - 1))
+
+
+@override_settings(BATCH_REQUESTS={
+    'EXECUTE_PARALLEL': True, 'NUM_WORKERS': 2, 'STREAM_INGEST': True,
+    'STREAM_CHUNK_SIZE': 16, 'MAX_LIMIT': 3,
+})
+class TestStreamedExecution(TestCase):
+    '''
+        Tests executing the requests while the batch is read.
+    '''
+
+    def post(self, requests):
+        return self.client.post(
+            '/api/v1/batch/', json.dumps({'batch': requests}), content_type='application/json'
+        )
+
+    def test_responses(self):
+        response = self.post([
+            {'url': '/views/', 'method': 'get'},
+            {'url': '/unknown/', 'method': 'get'},
+            {'url': '/views/', 'method': 'post', 'body': 'data'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status_code'] for result in json.loads(response.content.decode('utf-8'))],
+            [200, 404, 201]
+        )
+        self.assertIn('batch_requests.makespan', response)
+
+    def test_invalid(self):
+        self.assertEqual(self.post([{'url': '/views/'}]).status_code, 400)
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100)
+    def test_too_large(self):
+        '''
+            The body is limited to DATA_UPLOAD_MAX_MEMORY_SIZE, as when read upfront.
+        '''
+        self.assertEqual(self.post([{'url': '/views/', 'method': 'get'}] * 3).status_code, 400)
+
+        # Without a length, the limit applies while reading.
+        body = json.dumps({'batch': [{'url': '/views/', 'method': 'get'}] * 3}).encode('utf-8')
+        request = RequestFactory().generic(
+            'POST', '/api/v1/batch/', body, content_type='application/json'
+        )
+        del request.META['CONTENT_LENGTH']
+        request._stream = io.BytesIO(body)
+        results = execute_streamed_requests(request)
+        self.assertEqual([result['status_code'] for result in results], [200, 200, 400])
+
+    def test_invalid_after_writes(self):
+        '''
+            The results of the requests executed before the batch turned out invalid are
+            returned, followed by an error entry.
+        '''
+        response = self.post([{'url': '/views/', 'method': 'post', 'body': 'data'}] * 4)
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([result['status_code'] for result in results], [201, 201, 201, 400])
+        self.assertEqual(results[3]['reason_phrase'], 'You can batch maximum of 3 requests.')
+
+        response = self.post([{'url': '/views/', 'method': 'get'}, {'url': '/views/'}])
+        results = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([result['status_code'] for result in results], [200, 400])
+
+    def test_dependencies(self):
+        JsonApiView.created = []
+        parent = {'type': 'A', 'id': str(uuid.uuid4())}
+        child = {'type': 'B', 'id': str(uuid.uuid4()), 'relationships': {
+            'parent': {'data': parent}
+        }}
+        orphan = dict(child, id=str(uuid.uuid4()), relationships={
+            'parent': {'data': {'type': 'A', 'id': str(uuid.uuid4())}}
+        })
+        responses = json.loads(self.post([
+            {'url': '/jsonapi/', 'method': 'post', 'body': json.dumps({'data': parent})},
+            {'url': '/jsonapi/', 'method': 'post', 'body': json.dumps({'data': child})},
+            {'url': '/jsonapi/', 'method': 'post', 'body': json.dumps({'data': orphan})},
+        ]).content.decode('utf-8'))
+
+        self.assertEqual([response['status_code'] for response in responses], [201] * 3)
+        self.assertEqual(
+            responses[1]['body']['data']['relationships']['parent']['data']['id'],
+            responses[0]['body']['data']['id']
+        )
+
+    def test_failed_dependency(self):
+        parent = {'type': 'A', 'id': str(uuid.uuid4())}
+        child = {'type': 'B', 'id': str(uuid.uuid4()), 'relationships': {
+            'parent': {'data': parent}
+        }}
+        responses = json.loads(self.post([
+            {'url': '/missing/', 'method': 'post', 'body': json.dumps({'data': parent})},
+            {'url': '/jsonapi/', 'method': 'post', 'body': json.dumps({'data': child})},
+        ]).content.decode('utf-8'))
+        self.assertEqual([response['status_code'] for response in responses], [404, 424])
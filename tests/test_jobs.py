@@ -0,0 +1,183 @@
+'''
+@summary: Test cases for the asynchronous batch jobs.
+'''
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+from unittest import mock
+
+from batch_requests import views
+from batch_requests.jobs import DONE, FAILED, RUNNING, FileJobStore
+from batch_requests.views import resume_batch_jobs, stream_job_results
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+
+class TestBatchJobs(TestCase):
+    '''
+        Tests submitting jobs, fetching their results and resuming them.
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+        overrider = override_settings(BATCH_REQUESTS={
+            'HEADERS_TO_INCLUDE': ['HTTP_USER_AGENT', 'HTTP_COOKIE'],
+            'MAX_LIMIT': 3,
+            'JOB_STORE_DIR': self.directory,
+            'JOB_MAX_LIMIT': 10,
+            'JOB_PAGE_SIZE': 4,
+            'JOB_POLL_INTERVAL': 0.01,
+        })
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+        self.store = FileJobStore(self.directory)
+
+    def submit(self, requests, **extra):
+        return self.client.post(
+            '/api/v1/batch/jobs/', json.dumps({'batch': requests}),
+            content_type='application/json', **extra
+        )
+
+    def wait(self, job_id):
+        for _ in range(500):
+            job = self.store.get(job_id)
+            if job['status'] == DONE:
+                return job
+            time.sleep(0.01)
+        self.fail('The job did not finish.')
+
+    def test_job_over_max_limit(self):
+        requests = [{'url': '/views/?index=%d' % i, 'method': 'get'} for i in range(6)]
+        response = self.submit(requests)
+        self.assertEqual(response.status_code, 202)
+
+        job = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(job['status'], 'pending')
+        self.assertEqual(job['total'], 6)
+        self.assertEqual(self.wait(job['id'])['completed'], 6)
+
+        # Results are paged, at most JOB_PAGE_SIZE at a time.
+        page = json.loads(self.client.get('/api/v1/batch/jobs/%s/?limit=10' % job['id']).content)
+        self.assertEqual(page['status'], DONE)
+        self.assertEqual(len(page['results']), 4)
+        self.assertEqual(page['next_offset'], 4)
+
+        page = json.loads(self.client.get(
+            '/api/v1/batch/jobs/%s/?offset=%d' % (job['id'], page['next_offset'])
+        ).content)
+        self.assertEqual(len(page['results']), 2)
+        self.assertEqual(page['next_offset'], 6)
+
+    def test_stream_results(self):
+        requests = [{'url': '/views/', 'method': 'get'}, {'url': '/unknown/', 'method': 'get'}]
+        job = json.loads(self.submit(requests).content.decode('utf-8'))
+
+        response = self.client.get('/api/v1/batch/jobs/%s/?stream=1' % job['id'])
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        results = sorted((json.loads(line) for line in lines), key=lambda result: result['index'])
+        self.assertEqual([result['status_code'] for result in results], [200, 404])
+        self.assertEqual(results[0]['body'], 'Success!')
+
+    def test_invalid_jobs(self):
+        too_many = [{'url': '/views/', 'method': 'get'}] * 11
+        self.assertEqual(self.submit(too_many).status_code, 400)
+        self.assertEqual(self.submit([{'url': '/views/'}]).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/batch/jobs/unknown/').status_code, 404)
+
+    def test_job_of_another_user(self):
+        user = User.objects.create(username='owner')
+        job_id = self.store.create([], {}, user.pk)
+        self.assertEqual(self.client.get('/api/v1/batch/jobs/%s/' % job_id).status_code, 404)
+
+    def test_resume(self):
+        '''
+            An unfinished job is resumed from the requests without a result.
+        '''
+        requests = [{'url': '/echo/?header=HTTP_USER_AGENT', 'method': 'get'}] * 3
+        job_id = self.store.create(requests, {'HTTP_USER_AGENT': 'importer'})
+        self.store.set_status(job_id, RUNNING)
+        self.store.add_result(job_id, {'index': 1, 'status_code': 200, 'body': 'kept'})
+
+        for future in resume_batch_jobs():
+            future.result()
+
+        job = self.store.get(job_id)
+        self.assertEqual(job['status'], DONE)
+        results = {result['index']: result for result in self.store.get_results(job_id)}
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertEqual(results[1]['body'], 'kept')
+        self.assertEqual(results[0]['body'], 'importer')
+        self.assertEqual(self.store.unfinished(), [])
+
+    def test_claim(self):
+        '''
+            A job is only run by the worker holding its lease, until the lease expires.
+        '''
+        job_id = self.store.create([], {})
+        self.assertTrue(self.store.claim(job_id))
+        self.assertFalse(self.store.claim(job_id))
+
+        with override_settings(BATCH_REQUESTS={'JOB_LEASE_SECONDS': 0}):
+            self.assertTrue(self.store.claim(job_id))
+        self.store.release(job_id)
+        self.assertTrue(self.store.claim(job_id))
+
+    def test_private_files(self):
+        '''
+            Jobs are only readable by their worker, and stored without credentials.
+        '''
+        directory = os.path.join(self.directory, 'private')
+        store = FileJobStore(directory)
+        job_id = store.create([], {'HTTP_USER_AGENT': 'importer'})
+        store.add_result(job_id, {'index': 0})
+        store.claim(job_id)
+        self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode), 0o700)
+        for name in os.listdir(directory):
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.join(directory, name)).st_mode), 0o600)
+
+        response = self.submit([], HTTP_COOKIE='sessionid=secret', HTTP_USER_AGENT='importer')
+        job = self.store.get(json.loads(response.content.decode('utf-8'))['id'])
+        self.assertEqual(job['meta'], {'HTTP_USER_AGENT': 'importer'})
+
+    def test_failed_job(self):
+        '''
+            A job failing unexpectedly is marked failed, and its stream ends.
+        '''
+        job_id = self.store.create([{'url': '/views/', 'method': 'get'}], {})
+        with mock.patch.object(views, 'get_response', side_effect=RuntimeError('failed')):
+            with self.assertRaises(RuntimeError):
+                views.run_batch_job(job_id)
+        self.assertEqual(self.store.get(job_id)['status'], FAILED)
+        self.assertFalse(self.store.leased(job_id))
+        self.assertEqual(list(stream_job_results(self.store, job_id)), [])
+        self.assertEqual(self.store.unfinished(), [])
+
+    @override_settings(BATCH_REQUESTS={'JOB_LEASE_SECONDS': 0, 'JOB_POLL_INTERVAL': 0.01})
+    def test_stream_of_abandoned_job(self):
+        '''
+            The stream of a job no worker holds ends rather than waiting forever.
+        '''
+        job_id = self.store.create([{'url': '/views/', 'method': 'get'}], {})
+        self.store.set_status(job_id, RUNNING)
+        self.assertEqual(list(stream_job_results(self.store, job_id)), [])
+
+    def test_expired_leases_rescanned(self):
+        '''
+            A job whose worker went away is resumed once its lease expired.
+        '''
+        job_id = self.store.create([{'url': '/views/', 'method': 'get'}], {})
+        self.store.set_status(job_id, RUNNING)
+        self.assertTrue(self.store.claim(job_id))
+        self.assertEqual(resume_batch_jobs(), [])
+
+        with override_settings(BATCH_REQUESTS={
+            'JOB_STORE_DIR': self.directory, 'JOB_LEASE_SECONDS': 0,
+        }):
+            self.client.get('/api/v1/batch/jobs/%s/' % job_id)
+            self.assertEqual(self.wait(job_id)['completed'], 1)
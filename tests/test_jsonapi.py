@@ -1,8 +1,11 @@
 import json
 import uuid
 
-from batch_requests.jsonapi import JsonApiRewriter
+from batch_requests.concurrent.executor import ThreadBasedExecutor
+from batch_requests.jsonapi import JsonApiIncludedMerger, JsonApiRewriter
+from batch_requests.settings import br_settings
 from tests.test_base import TestBase
+from tests.test_views import JsonApiView
 
 
 class TestJsonApiRewriter(TestBase):
@@ -68,3 +71,124 @@ class TestJsonApiRewriter(TestBase):
             self.requests[1]['body']['data']['relationships']['f0']['data']['id'],
             self.responses[0]['body']['data']['id']
         )
+
+    def test_dependencies(self):
+        """ A request depends on the earlier request creating an ID it references.
+        """
+        independent = {
+            'method': 'post',
+            'body': {'data': {'type': 'B', 'id': str(uuid.uuid4())}}
+        }
+        read = {'method': 'get', 'url': '/views/'}
+        self.assertEqual(
+            self.rewriter.dependencies(self.requests + [independent, read]),
+            [set(), {0}, set(), set()]
+        )
+
+
+class TestJsonApiParallel(TestBase):
+    """ JSON-API batches executed by a concurrent executor.
+    """
+    def setUp(self):
+        self.orig_executor = br_settings.executor
+        br_settings.executor = ThreadBasedExecutor(4)
+        JsonApiView.created = []
+
+    def tearDown(self):
+        br_settings.executor = self.orig_executor
+
+    def _create(self, type, id, url='/jsonapi/', parent=None):
+        data = {'type': type, 'id': id}
+        if parent is not None:
+            data['relationships'] = {'parent': {'data': parent}}
+        return {'method': 'post', 'url': url, 'body': json.dumps({'data': data})}
+
+    def _post_batch(self, requests):
+        return json.loads(self.client.post(
+            '/api/v1/batch/', json.dumps({'batch': requests}),
+            content_type='application/json'
+        ).content)
+
+    def test_children_rewritten(self):
+        """ Independent children run after their parent with the DB level ID.
+        """
+        parent = {'type': 'A', 'id': str(uuid.uuid4())}
+        responses = self._post_batch([
+            self._create('A', parent['id']),
+            self._create('B', str(uuid.uuid4()), parent=parent),
+            self._create('B', str(uuid.uuid4()), parent=parent),
+        ])
+        parent_id = responses[0]['body']['data']['id']
+        for response in responses[1:]:
+            self.assertEqual(response['status_code'], 201)
+            self.assertEqual(
+                response['body']['data']['relationships']['parent']['data']['id'],
+                parent_id
+            )
+
+    def test_failed_parent(self):
+        """ Children of a failed request are cancelled.
+        """
+        parent = {'type': 'A', 'id': str(uuid.uuid4())}
+        responses = self._post_batch([
+            self._create('A', parent['id'], url='/missing/'),
+            self._create('B', str(uuid.uuid4()), parent=parent),
+            self._create('B', str(uuid.uuid4())),
+        ])
+        self.assertEqual(
+            [response['status_code'] for response in responses], [404, 424, 201]
+        )
+
+
+class TestJsonApiInOrder(TestJsonApiParallel):
+    """ JSON-API batches executed by the default, sequential, executor.
+    """
+    def setUp(self):
+        JsonApiView.created = []
+
+    def tearDown(self):
+        pass
+
+    def test_execution_order(self):
+        """ Requests run in order, even when a later one doesn't wait for anything.
+        """
+        first = {'type': 'A', 'id': str(uuid.uuid4())}
+        responses = self._post_batch([
+            self._create('A', first['id']),
+            self._create('B', str(uuid.uuid4()), parent=first),
+            self._create('C', str(uuid.uuid4())),
+        ])
+        self.assertEqual([response['status_code'] for response in responses], [201] * 3)
+        self.assertEqual([data['type'] for data in JsonApiView.created], ['A', 'B', 'C'])
+
+
+class TestJsonApiIncludedMerger(TestBase):
+    def test_merge(self):
+        merger = JsonApiIncludedMerger()
+        author = {'type': 'people', 'id': '1', 'attributes': {'name': 'A'}}
+        tag = {'type': 'tags', 'id': '2'}
+        results = [merger.merge(result) for result in [
+            {'status_code': 200, 'body': {'data': [], 'included': [author, tag]}},
+            {'status_code': 200, 'body': {'data': [], 'included': [
+                {'type': 'people', 'id': '1', 'attributes': {'name': 'B', 'age': 3}},
+            ]}},
+            {'status_code': 200, 'body': {'data': []}},
+            {'status_code': 404},
+        ]]
+
+        self.assertEqual(results[0]['body']['included'], [
+            {'type': 'people', 'id': '1'}, {'type': 'tags', 'id': '2'},
+        ])
+        self.assertEqual(results[1]['body']['included'], [{'type': 'people', 'id': '1'}])
+        self.assertEqual(results[2:], [
+            {'status_code': 200, 'body': {'data': []}}, {'status_code': 404},
+        ])
+        self.assertEqual(merger.resources(), [
+            {'type': 'people', 'id': '1', 'attributes': {'name': 'A', 'age': 3}}, tag,
+        ])
+
+    def test_unidentified_resources(self):
+        merger = JsonApiIncludedMerger()
+        result = {'status_code': 200, 'body': {'data': [], 'included': [{'type': 'people'}]}}
+        self.assertIs(merger.merge(result), result)
+        self.assertEqual(merger.resources(), [])
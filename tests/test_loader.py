@@ -0,0 +1,146 @@
+'''
+@summary: Test cases for the batch scoped loader.
+'''
+import json
+import threading
+
+from batch_requests.loader import BatchLoader
+from batch_requests.routers import use_database
+from batch_requests.views import forget_loaded_objects
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+
+
+class TestBatchLoader(TestCase):
+    '''
+        Tests coalescing and caching lookups.
+    '''
+
+    def setUp(self):
+        self.users = [User.objects.create(username='user%d' % i) for i in range(3)]
+
+    def test_load_many(self):
+        loader = BatchLoader()
+        pks = [self.users[1].pk, self.users[0].pk, 999]
+
+        with self.assertNumQueries(1):
+            users = loader.load_many(User, pks)
+        self.assertEqual(users, [self.users[1], self.users[0], None])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(loader.load(User, str(self.users[1].pk)), self.users[1])
+
+    def test_concurrent_lookups_coalesced(self):
+        '''
+            Lookups made concurrently within the window are fetched together.
+        '''
+        fetches = []
+
+        def fetch(model, keys):
+            fetches.append(set(keys))
+            return {key: 'user%d' % key for key in keys}
+
+        loader = BatchLoader(window=0.1, fetch=fetch)
+        results = {}
+
+        def load(key):
+            results[key] = loader.load(User, key)
+
+        threads = [threading.Thread(target=load, args=(key,)) for key in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(fetches, [{1, 2, 3, 4}])
+        self.assertEqual(results, {key: 'user%d' % key for key in range(1, 5)})
+
+    def test_failed_fetch(self):
+        def fetch(model, keys):
+            raise ValueError('database is down')
+
+        loader = BatchLoader(fetch=fetch)
+        with self.assertRaises(ValueError):
+            loader.load(User, 1)
+        self.assertEqual(loader.pending[(None, User)], {1})
+
+    def test_cleared_while_loading(self):
+        '''
+            Objects dropped by a write finishing meanwhile are still returned rather than
+            waited for forever.
+        '''
+        fetches = []
+
+        def fetch(model, keys):
+            fetches.append(set(keys))
+            return {key: 'user%d' % key for key in keys}
+
+        loader = BatchLoader(fetch=fetch)
+        dispatch = loader._dispatch
+
+        def dispatch_then_clear(group):
+            objects = dispatch(group)
+            clearing = threading.Thread(target=loader.clear)
+            clearing.start()
+            clearing.join()
+            return objects
+
+        loader._dispatch = dispatch_then_clear
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(loader.load_many(User, [1, 2])), daemon=True
+        )
+        thread.start()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(results, [['user1', 'user2']])
+        self.assertEqual(fetches, [{1, 2}])
+
+    def test_loads_per_database(self):
+        '''
+            Objects fetched for a sub request pinned to a replica aren't served to one
+            reading from the primary.
+        '''
+        fetches = []
+
+        def fetch(model, keys):
+            fetches.append(set(keys))
+            return {key: 'user%d' % key for key in keys}
+
+        loader = BatchLoader(fetch=fetch)
+        with use_database('replica'):
+            loader.load(User, 1)
+        with use_database('default'):
+            loader.load(User, 1)
+            loader.load(User, 1)
+        self.assertEqual(fetches, [{1}, {1}])
+
+    def test_cleared_after_writes(self):
+        '''
+            Cached objects are dropped once a sub request which may have written finishes.
+        '''
+        loader = BatchLoader()
+        loader.load(User, self.users[0].pk)
+        factory = RequestFactory()
+        reader, writer = factory.get('/users/1/'), factory.post('/views/')
+        reader.batch_loader = writer.batch_loader = loader
+
+        forget_loaded_objects([reader])
+        self.assertEqual(len(loader.cache), 1)
+        forget_loaded_objects([writer])
+        self.assertEqual(loader.cache, {})
+
+    def test_batch_shares_loader(self):
+        '''
+            The sub requests of a batch share the loader and its cache.
+        '''
+        pk = self.users[2].pk
+        batch = [{'method': 'get', 'url': '/users/%d/' % pk} for _ in range(3)]
+
+        with self.assertNumQueries(1):
+            responses = json.loads(self.client.post(
+                '/api/v1/batch/', json.dumps({'batch': batch}), content_type='application/json'
+            ).content)
+        self.assertEqual(
+            [response['body'] for response in responses], [{'username': 'user2'}] * 3
+        )
@@ -0,0 +1,91 @@
+'''
+@summary: Test cases for the slotted sub requests and sub responses.
+'''
+import json
+import pickle
+import tracemalloc
+
+from batch_requests.envelope import build_envelope
+from batch_requests.messages import SubRequest, SubResponse, encode
+from django.test import TestCase
+
+
+class TestSubResponse(TestCase):
+    '''
+        Tests the sub responses behave as the result dicts they replace.
+    '''
+
+    def test_mapping(self):
+        response = SubResponse(404, 'Page not found')
+        self.assertEqual(response, {'status_code': 404, 'reason_phrase': 'Page not found'})
+        self.assertNotIn('body', response)
+        self.assertIsNone(response.get('body'))
+        self.assertEqual(response.setdefault('headers', {}), {})
+
+        response['body'] = 'missing'
+        self.assertEqual(response.body, 'missing')
+        self.assertEqual(response.pop('body'), 'missing')
+        self.assertEqual(len(response), 3)
+        self.assertEqual(
+            dict(response), {'status_code': 404, 'reason_phrase': 'Page not found', 'headers': {}}
+        )
+        with self.assertRaises(KeyError):
+            response['other'] = 1
+        with self.assertRaises(KeyError):
+            del response['body']
+
+    def test_from_dict(self):
+        result = {'status_code': 200, 'body': [1]}
+        response = SubResponse.from_dict(result)
+        self.assertIsInstance(response, SubResponse)
+        self.assertEqual(response, result)
+        self.assertIs(SubResponse.from_dict(response), response)
+        # Dicts with other keys are kept as they are.
+        result = {'status_code': 200, 'index': 1}
+        self.assertIs(SubResponse.from_dict(result), result)
+
+    def test_serialized(self):
+        results = [SubResponse(200, 'OK', {'a': '1'}, body={'id': 1}), SubResponse(404)]
+        self.assertEqual(json.loads(json.dumps(build_envelope(results), default=encode)), [
+            {'status_code': 200, 'reason_phrase': 'OK', 'headers': {'a': '1'}, 'body': {'id': 1}},
+            {'status_code': 404},
+        ])
+        with self.assertRaises(TypeError):
+            json.dumps(object(), default=encode)
+
+        response = pickle.loads(pickle.dumps(results[0]))
+        self.assertEqual(response, results[0])
+
+    def test_sub_request(self):
+        sub_request = SubRequest('request', {'id': 'data.id'})
+        wsgi_request, onward_variables = sub_request
+        self.assertEqual((wsgi_request, onward_variables), ('request', {'id': 'data.id'}))
+        self.assertIsInstance(sub_request, tuple)
+        self.assertFalse(hasattr(sub_request, '__dict__'))
+
+
+class TestSubResponseBenchmark(TestCase):
+    '''
+        Compares the memory held by the results of a large batch, as dicts and as sub
+        responses.
+    '''
+
+    def allocated(self, build, count=10000):
+        tracemalloc.start()
+        try:
+            results = [build(index) for index in range(count)]
+            size, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(results), count)
+        return size
+
+    def test_memory(self):
+        headers = {'Content-Type': 'application/json'}
+        as_dicts = self.allocated(lambda index: {
+            'status_code': 200, 'reason_phrase': 'OK', 'headers': headers, 'body': index,
+        })
+        as_responses = self.allocated(
+            lambda index: SubResponse(200, 'OK', headers, body=index)
+        )
+        self.assertLess(as_responses, as_dicts * 0.6)
@@ -0,0 +1,79 @@
+'''
+@summary: Test cases for the batch endpoints configured with their own profile.
+'''
+import json
+
+from batch_requests import admission
+from batch_requests.concurrent.executor import (SequentialExecutor,
+                                                ThreadBasedExecutor)
+from batch_requests.settings import br_settings, default_settings, use_profile
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+
+@override_settings(BATCH_REQUESTS={
+    'MAX_LIMIT': 2,
+    'PROFILES': {
+        'internal': {
+            'MAX_LIMIT': 4, 'EXECUTE_PARALLEL': True, 'NUM_WORKERS': 2,
+            'DURATION_HEADER_NAME': 'internal.duration',
+        },
+    },
+})
+class TestProfiles(TestCase):
+    '''
+        Tests the endpoints of the profiles use their own settings and executor.
+    '''
+
+    def post(self, url, count):
+        return self.client.post(url, json.dumps({
+            'batch': [{'url': '/views/', 'method': 'get'}] * count
+        }), content_type='application/json')
+
+    def test_limits(self):
+        self.assertEqual(self.post('/api/v1/batch/', 3).status_code, 400)
+        self.assertEqual(self.post('/api/v1/batch/internal/', 3).status_code, 200)
+        self.assertEqual(self.post('/api/v1/batch/internal/', 5).status_code, 400)
+        self.assertEqual(self.post('/api/v1/batch/internal/sequential/', 3).status_code, 200)
+
+    def test_executors(self):
+        internal = default_settings.profile('internal')
+        self.assertIsInstance(default_settings.executor, SequentialExecutor)
+        self.assertIsInstance(internal.executor, ThreadBasedExecutor)
+        self.assertEqual(internal.executor.num_workers, 2)
+        self.assertIs(default_settings.profile('internal'), internal)
+
+    def test_sub_requests(self):
+        '''
+            The sub requests run on the workers with the settings of the profile.
+        '''
+        responses = json.loads(self.post('/api/v1/batch/internal/', 3).content.decode('utf-8'))
+        for response in responses:
+            self.assertIn('internal.duration', response['headers'])
+            self.assertNotIn('batch_requests.duration', response['headers'])
+
+    def test_use_profile(self):
+        with use_profile('internal') as internal:
+            self.assertEqual(br_settings.MAX_LIMIT, 4)
+            self.assertIs(br_settings.active(), internal)
+            with use_profile(None):
+                self.assertEqual(br_settings.MAX_LIMIT, 2)
+            self.assertEqual(br_settings.MAX_LIMIT, 4)
+        self.assertEqual(br_settings.MAX_LIMIT, 2)
+
+        with self.assertRaises(ImproperlyConfigured):
+            with use_profile('unknown'):
+                pass
+
+    def test_reload(self):
+        internal = default_settings.profile('internal')
+        with override_settings(BATCH_REQUESTS={'PROFILES': {'internal': {'MAX_LIMIT': 1}}}):
+            self.assertIsNot(default_settings.profile('internal'), internal)
+            self.assertEqual(default_settings.profile('internal').MAX_LIMIT, 1)
+
+    def test_admission(self):
+        with use_profile('internal'):
+            internal = admission.get_controller()
+            self.assertIsNot(internal, admission.controller)
+            self.assertIs(admission.get_controller(), internal)
+        self.assertIs(admission.get_controller(), admission.controller)
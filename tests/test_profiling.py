@@ -0,0 +1,92 @@
+'''
+@summary: Test cases for the profiling of batch executions.
+'''
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from batch_requests.profiling import rotate
+from django.test import TestCase, override_settings
+
+
+class TestProfiling(TestCase):
+    '''
+        Tests selecting, capturing and rotating profiles.
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def settings(self, **settings):
+        return override_settings(BATCH_REQUESTS=dict({
+            'PROFILE_DIR': self.directory,
+            'PROFILE_TOKEN': 'secret',
+            'EXECUTE_PARALLEL': True,
+            'NUM_WORKERS': 2,
+        }, **settings))
+
+    def post(self, **extra):
+        data = json.dumps({'batch': [
+            {'url': '/views/', 'method': 'get'}, {'url': '/echo/', 'method': 'get'},
+        ]})
+        return self.client.post('/api/v1/batch/', data, content_type='application/json', **extra)
+
+    def test_not_profiled(self):
+        with self.settings():
+            response = self.post(HTTP_X_BATCH_PROFILE='wrong')
+        self.assertNotIn('batch_requests.profile', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_non_ascii_token(self):
+        with self.settings():
+            response = self.post(HTTP_X_BATCH_PROFILE='s\xe9cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('batch_requests.profile', response)
+
+    def test_cprofile(self):
+        with self.settings():
+            response = self.post(HTTP_X_BATCH_PROFILE='secret')
+        self.assertEqual(response.status_code, 200)
+
+        name = response['batch_requests.profile']
+        self.assertEqual(os.listdir(self.directory), [name])
+
+        # The profile covers the sub requests executed on the worker threads.
+        stats = pstats.Stats(os.path.join(self.directory, name))
+        functions = {function for _, _, function in stats.stats}
+        self.assertIn('handle_batch_requests', functions)
+        self.assertIn('get_wsgi_request_object', functions)
+        self.assertTrue(any(path.endswith('test_views.py') for path, _, _ in stats.stats))
+
+    def test_sampled(self):
+        with self.settings(PROFILE_SAMPLE_RATE=1.0):
+            response = self.post()
+        self.assertIn('batch_requests.profile', response)
+
+    def test_tracemalloc(self):
+        with self.settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_MODE='tracemalloc'):
+            response = self.post()
+        snapshot = tracemalloc.Snapshot.load(
+            os.path.join(self.directory, response['batch_requests.profile'])
+        )
+        self.assertTrue(snapshot.traces)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_rotate(self):
+        for i in range(4):
+            path = os.path.join(self.directory, 'batch-%d.prof' % i)
+            with open(path, 'w') as profile:
+                profile.write('x' * 10)
+            os.utime(path, (time.time() + i, time.time() + i))
+
+        rotate(self.directory, 3, 100)
+        self.assertEqual(sorted(os.listdir(self.directory)), [
+            'batch-1.prof', 'batch-2.prof', 'batch-3.prof'
+        ])
+        rotate(self.directory, 3, 15)
+        self.assertEqual(os.listdir(self.directory), ['batch-3.prof'])
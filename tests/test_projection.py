@@ -0,0 +1,76 @@
+'''
+@summary: Test cases for projecting sub response bodies on selected fields.
+'''
+import json
+
+from batch_requests.exceptions import BadBatchRequest
+from batch_requests.projection import compile_fields, iter_json_array
+from django.test import TestCase
+
+
+class TestProjection(TestCase):
+    '''
+        Tests compiling and applying field selections.
+    '''
+    body = {'id': 1, 'name': 'a', 'owner': {'id': 2, 'name': 'b'}, 'tags': [{'id': 3, 'x': 4}]}
+
+    def test_json_pointers(self):
+        projection = compile_fields(['/id', '/owner/name', '/tags/id'])
+        self.assertEqual(
+            projection.apply(self.body), {'id': 1, 'owner': {'name': 'b'}, 'tags': [{'id': 3}]}
+        )
+
+    def test_sparse_fieldset(self):
+        projection = compile_fields('name, owner')
+        self.assertEqual(
+            projection.apply([self.body]), [{'name': 'a', 'owner': {'id': 2, 'name': 'b'}}]
+        )
+
+    def test_streaming_array(self):
+        projection = compile_fields('id')
+        self.assertEqual(projection.apply_json(' [ {"id": 1, "x": 2} , {"id": 3}] '), [{'id': 1}, {'id': 3}])
+        self.assertEqual(projection.apply_json('[]'), [])
+        self.assertIsNone(projection.apply_json('{"id": 1}'))
+        self.assertIsNone(projection.apply_json('[{"id": 1}'))
+        self.assertEqual(list(iter_json_array('[1, "a", [2]]')), [1, 'a', [2]])
+
+    def test_invalid_fields(self):
+        with self.assertRaises(BadBatchRequest):
+            compile_fields({'id': True})
+
+    def test_batch_fields(self):
+        '''
+            Sub responses only contain the selected fields.
+        '''
+        batch = [
+            {'method': 'get', 'url': '/items/', 'fields': 'id,owner.name'},
+            {'method': 'get', 'url': '/items/2/', 'fields': ['/name']},
+            {'method': 'get', 'url': '/items/2/'},
+        ]
+        responses = json.loads(self.client.post(
+            '/api/v1/batch/', json.dumps({'batch': batch}), content_type='application/json'
+        ).content)
+
+        self.assertEqual(responses[0]['body'][1], {'id': 2, 'owner': {'name': 'Owner'}})
+        self.assertEqual(responses[1]['body'], {'name': 'Item 2'})
+        self.assertEqual(responses[2]['body'], {'id': 2, 'name': 'Item 2'})
+
+    def test_batch_error_fields(self):
+        '''
+            Error bodies are returned whole, whatever the selected fields.
+        '''
+        responses = json.loads(self.client.post(
+            '/api/v1/batch/', json.dumps({'batch': [
+                {'method': 'get', 'url': '/items/0/', 'fields': 'id'},
+            ]}), content_type='application/json'
+        ).content)
+        self.assertEqual(responses[0]['status_code'], 404)
+        self.assertEqual(responses[0]['body'], {'id': 0, 'detail': 'Not found.'})
+
+    def test_batch_invalid_fields(self):
+        response = self.client.post(
+            '/api/v1/batch/', json.dumps({'batch': [
+                {'method': 'get', 'url': '/items/', 'fields': 5},
+            ]}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,108 @@
+'''
+@summary: Test cases for retrying the sequential batches on transient errors.
+'''
+import json
+from unittest import mock
+
+from batch_requests.retry import backoff, is_transient
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, transaction
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from tests.test_views import SimpleView
+
+
+class DriverError(Exception):
+    '''
+        Stands for the error of a database driver, with its SQLSTATE.
+    '''
+    def __init__(self, pgcode):
+        self.pgcode = pgcode
+        Exception.__init__(self, 'driver error')
+
+
+def wrapped(driver_error):
+    try:
+        raise OperationalError('error') from driver_error
+    except OperationalError as error:
+        return error
+
+
+class TestClassification(TestCase):
+    '''
+        Tests telling the transient errors apart.
+    '''
+
+    def test_transient(self):
+        self.assertTrue(is_transient(wrapped(DriverError('40P01'))))
+        self.assertTrue(is_transient(wrapped(DriverError('40001'))))
+        self.assertTrue(is_transient(OperationalError(1213, 'Deadlock found')))
+        self.assertTrue(is_transient(OperationalError('database is locked')))
+
+    def test_not_transient(self):
+        self.assertFalse(is_transient(wrapped(DriverError('23505'))))
+        self.assertFalse(is_transient(IntegrityError('duplicate key')))
+        self.assertFalse(is_transient(ValueError('deadlock')))
+
+    def test_backoff(self):
+        for attempt in range(10):
+            self.assertTrue(0 <= backoff(attempt, 0.1, 0.5) <= min(0.5, 0.1 * 2 ** attempt))
+
+
+@override_settings(BATCH_REQUESTS={'SEQUENTIAL_RETRIES': 2, 'RETRY_BACKOFF': 0.001})
+class TestSequentialRetry(TransactionTestCase):
+    '''
+        Tests retrying the sequential batches. They only run outside of a transaction.
+    '''
+
+    def post(self, failures, error=OperationalError('database is locked')):
+        attempts = []
+
+        def create_user(request):
+            attempts.append(json.loads(request.body.decode('utf-8')))
+            User.objects.create(username='user%d' % len(attempts))
+            if len(attempts) <= failures:
+                raise error
+            return HttpResponse(status=201)
+
+        with mock.patch.object(SimpleView, 'post', side_effect=create_user):
+            response = self.client.post('/api/v1/batch/sequential/', json.dumps({'batch': [
+                {'url': '/views/', 'method': 'post', 'body': {'name': 'a'}},
+            ]}), content_type='application/json')
+        return response, attempts
+
+    def test_retried(self):
+        response, attempts = self.post(failures=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['batch_requests.retries'], '2')
+        self.assertEqual(json.loads(response.content.decode('utf-8'))[0]['status_code'], 201)
+        self.assertEqual(attempts, [{'name': 'a'}] * 3)
+        # The failed attempts were rolled back.
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['user3'])
+
+    def test_gives_up(self):
+        response, attempts = self.post(failures=3)
+        self.assertEqual(response['batch_requests.retries'], '2')
+        self.assertEqual(json.loads(response.content.decode('utf-8'))[0]['status_code'], 500)
+        self.assertEqual(len(attempts), 3)
+        self.assertFalse(User.objects.exists())
+
+    def test_not_transient(self):
+        response, attempts = self.post(failures=1, error=ValueError('invalid'))
+        self.assertEqual(response['batch_requests.retries'], '0')
+        self.assertEqual(len(attempts), 1)
+
+    def test_outer_transaction(self):
+        '''
+            A batch running within a transaction isn't retried.
+        '''
+        with transaction.atomic():
+            response, attempts = self.post(failures=1)
+        self.assertEqual(response['batch_requests.retries'], '0')
+        self.assertEqual(len(attempts), 1)
+
+    @override_settings(BATCH_REQUESTS={'SEQUENTIAL_RETRIES': 0})
+    def test_disabled(self):
+        response, attempts = self.post(failures=1)
+        self.assertNotIn('batch_requests.retries', response)
+        self.assertEqual(len(attempts), 1)
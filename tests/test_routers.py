@@ -0,0 +1,60 @@
+'''
+@summary: Test cases for routing read-only sub requests to replicas.
+'''
+import json
+
+from batch_requests.settings import br_settings
+from django.test import TestCase, override_settings
+
+
+@override_settings(
+    DATABASE_ROUTERS=['batch_requests.routers.BatchRouter'],
+    BATCH_REQUESTS={'EXECUTE_PARALLEL': True, 'NUM_WORKERS': 2, 'READ_REPLICA_ALIASES': ['replica']},
+)
+class TestReplicaRouting(TestCase):
+    '''
+        Tests the databases chosen for the sub requests of a batch.
+    '''
+    batch = [
+        {'method': 'get', 'url': '/database/'},
+        {'method': 'post', 'url': '/database/', 'body': {}},
+        {'method': 'get', 'url': '/database/'},
+    ]
+
+    def post_batch(self, url):
+        return json.loads(self.client.post(
+            url, json.dumps({'batch': self.batch}), content_type='application/json'
+        ).content)
+
+    def test_parallel_batch(self):
+        '''
+            Reads go to the replica until the batch writes, writes go to the primary.
+        '''
+        responses = self.post_batch('/api/v1/batch/')
+
+        self.assertEqual(
+            [response['body'] for response in responses], [
+                {'read': 'replica', 'write': 'default'},
+                {'read': 'default', 'write': 'default'},
+                {'read': 'default', 'write': 'default'},
+            ]
+        )
+        self.assertEqual(
+            [response['headers'][br_settings.DATABASE_HEADER_NAME] for response in responses],
+            ['replica', 'default', 'default']
+        )
+
+    def test_sequential_batch(self):
+        '''
+            Sequential batches run in a transaction on the primary.
+        '''
+        responses = self.post_batch('/api/v1/batch/sequential/')
+        self.assertEqual(
+            [response['body']['read'] for response in responses], ['default'] * 3
+        )
+
+    @override_settings(BATCH_REQUESTS={})
+    def test_no_replicas(self):
+        responses = self.post_batch('/api/v1/batch/')
+        self.assertEqual(responses[0]['body'], {'read': 'default', 'write': 'default'})
+        self.assertNotIn(br_settings.DATABASE_HEADER_NAME, responses[0]['headers'])
@@ -0,0 +1,104 @@
+'''
+@summary: Test cases for the tracing of batches.
+'''
+import json
+import os
+import shutil
+import tempfile
+
+from batch_requests import tracing
+from batch_requests.tracing import SpanExporter
+from django.test import TestCase, override_settings
+
+
+class RecordingExporter(SpanExporter):
+    '''
+        Keeps the finished spans.
+    '''
+    spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+class TestTracing(TestCase):
+    '''
+        Tests the spans of batches, sub requests and their phases.
+    '''
+
+    def setUp(self):
+        RecordingExporter.spans = []
+
+    def settings(self, **settings):
+        return override_settings(BATCH_REQUESTS=dict({
+            'TRACING_EXPORTERS': ['tests.test_tracing.RecordingExporter'],
+            'EXECUTE_PARALLEL': True,
+            'NUM_WORKERS': 2,
+        }, **settings))
+
+    def post(self, url='/api/v1/batch/', **extra):
+        data = json.dumps({'batch': [
+            {'url': '/views/', 'method': 'get'}, {'url': '/items/1/', 'method': 'get'},
+        ]})
+        return self.client.post(url, data, content_type='application/json', **extra)
+
+    def check_spans(self):
+        spans = {span.span_id: span for span in RecordingExporter.spans}
+        batch, = [span for span in spans.values() if span.name == 'batch']
+        requests = sorted(
+            (span for span in spans.values() if span.name == 'batch.request'),
+            key=lambda span: span.attributes['index']
+        )
+        self.assertEqual([span.parent_id for span in requests], [batch.span_id] * 2)
+        self.assertEqual([span.attributes['status_code'] for span in requests], [200, 200])
+        self.assertEqual(
+            [span.attributes['route'] for span in requests], ['simpleview', 'itemview']
+        )
+
+        for request in requests:
+            phases = [span.name for span in spans.values() if span.parent_id == request.span_id]
+            self.assertEqual(
+                sorted(phases), ['build', 'queue', 'resolve', 'serialize', 'view']
+            )
+        self.assertTrue(all(span.trace_id == batch.trace_id for span in spans.values()))
+        return batch
+
+    def test_parallel(self):
+        with self.settings():
+            self.post()
+        batch = self.check_spans()
+        self.assertIsNone(batch.parent_id)
+
+    def test_sequential(self):
+        with self.settings():
+            self.post('/api/v1/batch/sequential/')
+        self.check_spans()
+
+    def test_traceparent(self):
+        with self.settings():
+            self.post(HTTP_TRACEPARENT='00-%s-%s-01' % ('a' * 32, 'b' * 16))
+        batch = self.check_spans()
+        self.assertEqual(batch.trace_id, 'a' * 32)
+        self.assertEqual(batch.parent_id, 'b' * 16)
+
+    def test_disabled(self):
+        with self.settings(TRACING_EXPORTERS=[]):
+            self.post()
+        self.assertEqual(RecordingExporter.spans, [])
+        self.assertIs(tracing.span('view'), tracing.NULL_SPAN)
+
+    def test_json_lines_exporter(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'traces.jsonl')
+
+        with self.settings(
+                TRACING_EXPORTERS=['batch_requests.tracing.JsonLinesExporter'], TRACING_FILE=path):
+            self.post()
+
+        with open(path) as trace_file:
+            spans = [json.loads(line) for line in trace_file]
+        self.assertEqual(len(spans), 1 + 2 * 6 + 1)
+        batch, = [span for span in spans if span['name'] == 'batch']
+        self.assertEqual(batch['attributes']['path'], '/api/v1/batch/')
+        self.assertGreaterEqual(batch['duration_ms'], 0)
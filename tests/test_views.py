@@ -4,7 +4,9 @@
 import json
 from time import sleep
 
-from django.http.response import HttpResponse
+from django.contrib.auth.models import User
+from django.db import router
+from django.http.response import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
 
@@ -124,3 +126,116 @@ class SleepingView(View):
         sleep(seconds)
         # Make the current thread sleep.
         return HttpResponse('Success!')
+
+
+class ItemView(View):
+    '''
+        Returns a JSON representation of the item with the given primary key.
+    '''
+
+    def get(self, request, pk, *args, **kwargs):
+        '''
+            Handles the get request. There is no item 0.
+        '''
+        if int(pk) == 0:
+            return JsonResponse({'id': 0, 'detail': 'Not found.'}, status=404)
+        return JsonResponse({'id': int(pk), 'name': 'Item %s' % pk})
+
+
+class JsonApiView(View):
+    '''
+        Mimics a JSON-API endpoint assigning DB level IDs to the created resources.
+    '''
+    created = []
+
+    def get(self, request, *args, **kwargs):
+        '''
+            Returns an article along with its (included) author.
+        '''
+        author = {'type': 'people', 'id': request.GET['author']}
+        return JsonResponse({
+            'data': {
+                'type': 'articles',
+                'id': request.GET['id'],
+                'relationships': {'author': {'data': author}},
+            },
+            'included': [dict(author, attributes={'name': 'Person %s' % author['id']})],
+        })
+
+    def post(self, request, *args, **kwargs):
+        '''
+            Creates the resource and echos back its relationships.
+        '''
+        data = json.loads(request.body.decode('utf-8'))['data']
+        self.created.append(data)
+        return JsonResponse({'data': {
+            'type': data['type'],
+            'id': len(self.created),
+            'attributes': data.get('attributes', {}),
+            'relationships': data.get('relationships', {}),
+        }}, status=201)
+
+    @csrf_exempt
+    def dispatch(self, *args, **kwargs):
+        '''
+            Overiding to exempt csrf.
+        '''
+        return super(JsonApiView, self).dispatch(*args, **kwargs)
+
+
+class ItemListView(View):
+    '''
+        Returns a JSON list of items.
+    '''
+
+    def get(self, request, *args, **kwargs):
+        '''
+            Handles the get request.
+        '''
+        count = int(request.GET.get('count', '3'))
+        return JsonResponse([
+            {'id': pk, 'name': 'Item %s' % pk, 'owner': {'id': 1, 'name': 'Owner'},
+             'tags': [{'id': pk, 'name': 'tag'}]}
+            for pk in range(1, count + 1)
+        ], safe=False)
+
+
+class DatabaseView(View):
+    '''
+        Returns the databases the router chooses for reading and writing users.
+    '''
+
+    def get(self, request, *args, **kwargs):
+        '''
+            Handles the get request.
+        '''
+        return JsonResponse({
+            'read': router.db_for_read(User),
+            'write': router.db_for_write(User),
+        })
+
+    def post(self, request, *args, **kwargs):
+        '''
+            Delegates to the get request.
+        '''
+        return self.get(request, *args, **kwargs)
+
+    @csrf_exempt
+    def dispatch(self, *args, **kwargs):
+        '''
+            Overiding to exempt csrf.
+        '''
+        return super(DatabaseView, self).dispatch(*args, **kwargs)
+
+
+class UserView(View):
+    '''
+        Returns the username of the user with the given primary key, using the batch loader.
+    '''
+
+    def get(self, request, pk, *args, **kwargs):
+        '''
+            Handles the get request.
+        '''
+        user = request.batch_loader.load(User, pk)
+        return JsonResponse({'username': user.username if user else None})
@@ -0,0 +1,84 @@
+'''
+@summary: Test cases for the warm-up of batch execution.
+'''
+import threading
+from io import StringIO
+from unittest import mock
+
+from batch_requests import warmup
+from batch_requests.concurrent.executor import (SequentialExecutor,
+                                                ThreadBasedExecutor)
+from django.apps import apps
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.test import TestCase, override_settings
+from django.urls import Resolver404
+
+
+class TestWarmUp(TestCase):
+    '''
+        Tests starting the workers and reporting the steps.
+    '''
+
+    def test_workers_started(self):
+        executor = ThreadBasedExecutor(4)
+        self.addCleanup(executor.shutdown)
+        threads = set()
+        executor.warm_up(lambda: threads.add(threading.get_ident()), timeout=5)
+
+        # The task ran once on each of the workers.
+        self.assertEqual(len(threads), 4)
+        self.assertEqual(len(executor.executor_pool._threads), 4)
+
+    def test_sequential_executor(self):
+        SequentialExecutor().warm_up(self.fail)
+
+    @override_settings(BATCH_REQUESTS={'WARMUP_ROUTES': ['/views/', '/items/1/']})
+    def test_report(self):
+        executor = ThreadBasedExecutor(2)
+        self.addCleanup(executor.shutdown)
+        report = warmup.warm_up(executor)
+
+        self.assertEqual(list(report), ['workers', 'routes', 'connections'])
+        self.assertTrue(all(duration >= 0 for duration in report.values()))
+        self.assertTrue(warmup.is_warm())
+
+    @override_settings(BATCH_REQUESTS={'WARMUP_ROUTES': ['/unknown/']})
+    def test_unknown_route(self):
+        with self.assertRaises(Resolver404):
+            warmup.warm_up(SequentialExecutor())
+
+    def test_once_per_process(self):
+        self.addCleanup(setattr, warmup, '_warmed_pid', None)
+        with mock.patch.object(warmup, 'warm_up') as warm_up:
+            warmup.warm_up_once()
+            warmup.warm_up_once()
+            self.assertEqual(warm_up.call_count, 1)
+
+            # A forked process warms itself up.
+            with mock.patch('os.getpid', return_value=-1):
+                warmup.warm_up_once()
+            self.assertEqual(warm_up.call_count, 2)
+
+    @override_settings(BATCH_REQUESTS={'WARMUP_ON_FIRST_REQUEST': True})
+    def test_first_request(self):
+        '''
+            The warm-up runs on the first request rather than when the app is ready.
+        '''
+        self.addCleanup(setattr, warmup, '_warmed_pid', None)
+        self.addCleanup(request_started.disconnect, dispatch_uid='batch_requests.warm_up')
+        with mock.patch.object(warmup, 'warm_up') as warm_up:
+            apps.get_app_config('batch_requests').ready()
+            self.assertFalse(warm_up.called)
+            self.client.get('/views/')
+            self.client.get('/views/')
+            self.assertEqual(warm_up.call_count, 1)
+
+    @override_settings(BATCH_REQUESTS={'EXECUTE_PARALLEL': True, 'NUM_WORKERS': 2})
+    def test_command(self):
+        out = StringIO()
+        call_command('warm_up_batch_requests', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split(':')[0] for line in lines], [
+            'workers', 'routes', 'connections', 'total'
+        ])
@@ -1,12 +1,26 @@
-from batch_requests.views import handle_batch_requests
+from batch_requests.views import (batch_endpoint, handle_batch_job,
+                                  handle_batch_job_requests,
+                                  handle_batch_requests,
+                                  handle_sequential_batch_requests)
 from django.conf.urls import url
-from tests.test_views import (EchoHeaderView, ExceptionView, SimpleView,
-                              SleepingView)
+from tests.test_views import (DatabaseView, EchoHeaderView, ExceptionView,
+                              ItemListView, ItemView, JsonApiView, SimpleView,
+                              SleepingView, UserView)
 
 urlpatterns = [
     url(r'^views/', SimpleView.as_view(), name='simpleview'),
     url(r'^echo/', EchoHeaderView.as_view(), name='echoheader'),
     url(r'^exception/', ExceptionView.as_view(), name='exceptionview'),
     url(r'^sleep/', SleepingView.as_view(), name='sleepingview'),
+    url(r'^items/$', ItemListView.as_view(), name='itemlist'),
+    url(r'^items/(?P<pk>\d+)/', ItemView.as_view(), name='itemview'),
+    url(r'^jsonapi/', JsonApiView.as_view(), name='jsonapiview'),
+    url(r'^database/', DatabaseView.as_view(), name='databaseview'),
+    url(r'^users/(?P<pk>\d+)/', UserView.as_view(), name='userview'),
+    url(r'^api/v1/batch/jobs/(?P<job_id>\w+)/', handle_batch_job, name='batch_job'),
+    url(r'^api/v1/batch/jobs/', handle_batch_job_requests, name='batch_jobs'),
+    url(r'^api/v1/batch/internal/sequential/', batch_endpoint('internal', sequential=True)),
+    url(r'^api/v1/batch/internal/', batch_endpoint('internal'), name='internal_batch'),
+    url(r'^api/v1/batch/sequential/', handle_sequential_batch_requests, name='sequential_batch'),
     url(r'^api/v1/batch/', handle_batch_requests, name='batch'),
 ]